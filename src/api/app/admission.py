@@ -0,0 +1,146 @@
+# admission.py
+
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from metrics import record_timing
+
+# Who the current request belongs to and until when it may wait for capacity.
+# Set per request by the server; the engine loop sees them because contextvars
+# are copied along with every coroutine submitted to it. Work started outside
+# a request (background jobs) has no deadline and is never rejected.
+current_client = contextvars.ContextVar('current_client', default='background')
+current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+def begin_request(client, timeout):
+    current_client.set(client)
+    current_deadline.set(time.monotonic() + timeout if timeout else None)
+
+class AdmissionRejected(Exception):
+    """Raised when there is no capacity; maps to an HTTP 429/503 with Retry-After."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class FairLimiter:
+    """
+    Concurrency limit with a bounded wait queue, used only on the engine loop.
+
+    Waiters are queued per client and slots are handed out round-robin
+    across clients, so one busy API key cannot starve the others.
+    """
+
+    def __init__(self, name, limit, max_queue):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_use = 0
+        self.queued = 0
+        self._waiters = OrderedDict()
+        self.counters = {"admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0,
+                         "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+                         "hold_seconds_total": 0.0, "released": 0}
+
+    def _retry_after(self):
+        released = self.counters["released"]
+        average_hold = self.counters["hold_seconds_total"] / released if released else 1.0
+        return max(1, math.ceil(average_hold * (self.queued + 1) / max(self.limit, 1)))
+
+    def _wake_next(self):
+        # Round-robin: serve the oldest waiter of the next client in line
+        while self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            self._waiters.move_to_end(client)
+            future = waiters.popleft()
+            if not waiters:
+                del self._waiters[client]
+            self.queued -= 1
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+    async def acquire(self):
+        client = current_client.get()
+        deadline = current_deadline.get()
+        started = time.monotonic()
+
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+        else:
+            if deadline is not None and self.queued >= self.max_queue:
+                self.counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(f"Too many pending {self.name} requests", 429, self._retry_after())
+
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(client, deque()).append(future)
+            self.queued += 1
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we gave up; pass it on
+                    self.release(time.monotonic())
+                else:
+                    future.cancel()
+                    self._discard(client, future)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.counters["rejected_deadline"] += 1
+                raise AdmissionRejected(f"Timed out waiting for {self.name} capacity", 503, self._retry_after())
+
+        waited = time.monotonic() - started
+        record_timing(f"{self.name}_queue", waited)
+        self.counters["admitted"] += 1
+        self.counters["wait_seconds_total"] += waited
+        self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], waited)
+        return time.monotonic()
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now; returns None otherwise."""
+        if self.in_use >= self.limit or self._waiters:
+            return None
+        self.in_use += 1
+        self.counters["admitted"] += 1
+        return time.monotonic()
+
+    def _discard(self, client, future):
+        waiters = self._waiters.get(client)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[client]
+
+    def release(self, acquired_at):
+        self.counters["released"] += 1
+        self.counters["hold_seconds_total"] += time.monotonic() - acquired_at
+        # A woken waiter inherits the slot, so in_use only drops when nobody waits
+        if not self._wake_next():
+            self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def stats(self):
+        admitted = self.counters["admitted"]
+        return dict(
+            self.counters,
+            limit=self.limit,
+            in_use=self.in_use,
+            queued=self.queued,
+            max_queue=self.max_queue,
+            wait_seconds_avg=round(self.counters["wait_seconds_total"] / admitted, 4) if admitted else 0.0,
+        )
@@ -0,0 +1,417 @@
+# audio_cache.py
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+
+def make_key(text, voice, response_format, speed, pitch="+0Hz", volume="+0%"):
+    """Content address of a synthesis request; `voice` must already be resolved."""
+    normalized_text = unicodedata.normalize('NFC', text).strip()
+    payload = json.dumps([normalized_text, voice, response_format, f"{float(speed):g}", pitch, volume], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# One cached output as found by AudioCache.lookup: `data` (a bytes-like
+# object) for the memory tier and bundles, otherwise the `path` of the disk
+# file. `modified` is when the entry was stored, in seconds since the epoch.
+CachedAudio = namedtuple('CachedAudio', 'data path size modified')
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytes-like object, without copying it."""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._position))
+        b[:n] = self._view[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+# Cache bundle layout: magic, 8-byte little-endian index length, the JSON
+# index, then the audio of every entry back to back
+BUNDLE_MAGIC = b"EDGE-TTS-BUNDLE1"
+
+def write_bundle(path, entries):
+    """
+    Write a portable cache bundle. `entries` yields (key, audio, metadata)
+    where metadata describes the request (text, voice, format, ...) and is
+    kept in the index for inspection only.
+    """
+    index = {}
+    blobs = []
+    offset = 0
+    for key, audio, metadata in entries:
+        index[key] = dict(metadata, offset=offset, size=len(audio))
+        blobs.append(audio)
+        offset += len(audio)
+    encoded = json.dumps({"entries": index}, ensure_ascii=False).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(BUNDLE_MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for audio in blobs:
+                f.write(audio)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return len(index)
+
+class CacheBundle:
+    """
+    Read-only, memory-mapped cache bundle written by write_bundle. The
+    audio stays in the page cache and is shared by every worker process
+    that maps the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = len(BUNDLE_MAGIC) + 8
+        if self._map[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a cache bundle")
+        (index_size,) = struct.unpack_from("<Q", self._map, len(BUNDLE_MAGIC))
+        self.entries = json.loads(self._map[header_size:header_size + index_size])["entries"]
+        self._data_start = header_size + index_size
+        self.size = sum(entry["size"] for entry in self.entries.values())
+        self.modified = os.stat(path).st_mtime
+
+    def _entry(self, key, response_format):
+        # Only an entry recorded with the same format answers the request
+        entry = self.entries.get(key)
+        if entry is None or entry.get("format") != response_format:
+            return None
+        return entry
+
+    def get(self, key, response_format):
+        entry = self._entry(key, response_format)
+        if entry is None:
+            return None
+        start = self._data_start + entry["offset"]
+        return self._map[start:start + entry["size"]]
+
+    def view(self, key, response_format):
+        """Like get(), but a memoryview of the mapped pages instead of a copy."""
+        entry = self._entry(key, response_format)
+        if entry is None:
+            return None
+        start = self._data_start + entry["offset"]
+        return memoryview(self._map)[start:start + entry["size"]]
+
+    def close(self):
+        self._map.close()
+
+# Hidden subdirectories of the disk tier hold other data (timestamps) and
+# are not cache entries
+TIMESTAMPS_DIR_NAME = '.timestamps'
+
+# Temp files of interrupted writes are removed once they are this old;
+# younger ones may still be being written by another worker process
+STALE_WRITE_AGE = 3600
+
+class AudioCache:
+    """
+    Two-tier cache of synthesized audio.
+
+    The memory tier is an LRU bounded by total bytes. The optional disk tier
+    stores one file per key under `disk_dir` and evicts the least recently
+    used files once `disk_limit` bytes are exceeded. Disk hits are promoted
+    to memory. Read-only bundles added with add_bundle are consulted after
+    the memory tier and are never evicted.
+
+    Every entry is stored together with its response format: the memory
+    and disk tiers under "<key>.<format>" (the disk file has that name) and
+    bundles with the format in their index, so an entry is only ever served
+    as the format it was synthesized in.
+
+    The disk tier can be shared by several worker processes: entries
+    written by another process are picked up on a miss. Each process only
+    counts its own writes between calls to rescan(), which recounts the
+    directory and evicts down to `disk_limit`. A disk file's mtime is when
+    it was stored and its atime when it was last used.
+    """
+
+    def __init__(self, memory_limit, disk_dir=None, disk_limit=0):
+        self.memory_limit = memory_limit
+        self.disk_dir = disk_dir or None
+        self.disk_limit = disk_limit
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._bundles = []
+        self.counters = {
+            "memory_hits": 0,
+            "bundle_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def _entry_id(key, response_format):
+        return f"{key}.{response_format}"
+
+    def _disk_path(self, entry):
+        return os.path.join(self.disk_dir, entry[:2], entry)
+
+    def _scan_disk(self):
+        # (atime, entry id, size) of every file in the disk tier, least recently used first
+        entries = []
+        now = time.time()
+        for root, dirs, files in os.walk(self.disk_dir):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.startswith('.'):
+                    # Partial write left behind by a crash
+                    if now - stat.st_mtime > STALE_WRITE_AGE:
+                        self._remove_files([path])
+                    continue
+                entries.append((stat.st_atime, name, stat.st_size))
+        entries.sort()
+        return entries
+
+    def _load_disk_index(self):
+        # Rebuild the LRU order from file atimes so a restart keeps the warm set
+        for _, key, size in self._scan_disk():
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def rescan(self):
+        """
+        Recount the disk tier from its directory, which other worker
+        processes may write to as well, and evict the least recently used
+        files until it fits in `disk_limit`. Returns the number evicted.
+        """
+        if not self.disk_dir:
+            return 0
+        entries = self._scan_disk()
+        with self._lock:
+            self._disk = OrderedDict((key, size) for _, key, size in entries)
+            self._disk_bytes = sum(self._disk.values())
+            evicted = self._evict_disk()
+        self._remove_files([self._disk_path(key) for key in evicted])
+        return len(evicted)
+
+    def get(self, key, response_format):
+        entry_id = self._entry_id(key, response_format)
+        with self._lock:
+            entry = self._memory.get(entry_id)
+            if entry is not None:
+                self._memory.move_to_end(entry_id)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            # Also look for entries written by other processes sharing the directory
+            on_disk = entry_id in self._disk or self.disk_dir is not None
+
+        for bundle in self._bundles:
+            data = bundle.get(key, response_format)
+            if data is not None:
+                with self._lock:
+                    self.counters["bundle_hits"] += 1
+                return data
+
+        if on_disk:
+            found = self._read_disk(entry_id)
+            if found is not None:
+                data, modified = found
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    self._put_memory(entry_id, data, modified)
+                return data
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def lookup(self, key, response_format):
+        """
+        Find a cached output without reading it: a CachedAudio whose `data`
+        is the memory tier's bytes or a view of a bundle's mapped pages, or
+        whose `path` names the disk file. Disk hits are not promoted to
+        memory, so large files can be sent straight from the file. Returns
+        None on a miss, including when `key` was only stored in another format.
+        """
+        entry_id = self._entry_id(key, response_format)
+        with self._lock:
+            entry = self._memory.get(entry_id)
+            if entry is not None:
+                self._memory.move_to_end(entry_id)
+                self.counters["memory_hits"] += 1
+                data, modified = entry
+                return CachedAudio(data, None, len(data), modified)
+            on_disk = entry_id in self._disk or self.disk_dir is not None
+
+        for bundle in self._bundles:
+            view = bundle.view(key, response_format)
+            if view is not None:
+                with self._lock:
+                    self.counters["bundle_hits"] += 1
+                return CachedAudio(view, None, len(view), bundle.modified)
+
+        if on_disk:
+            path = self._disk_path(entry_id)
+            stat = self._touch_disk(entry_id, path)
+            if stat is not None:
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                return CachedAudio(None, path, stat.st_size, stat.st_mtime)
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def add_bundle(self, bundle):
+        self._bundles.append(bundle)
+
+    def put(self, key, response_format, data):
+        entry_id = self._entry_id(key, response_format)
+        with self._lock:
+            self._put_memory(entry_id, data)
+        if self.disk_dir:
+            self._write_disk(entry_id, data)
+
+    def put_file(self, key, response_format, source_path):
+        """Store a large output that only lives on disk; it goes to the disk tier only."""
+        if self.disk_dir:
+            self._write_disk(self._entry_id(key, response_format), source_path=source_path)
+
+    def _put_memory(self, key, data, modified=None):
+        if len(data) > self.memory_limit:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[0])
+        self._memory[key] = (data, time.time() if modified is None else modified)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_limit:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.counters["memory_evictions"] += 1
+
+    def _touch_disk(self, key, path):
+        # Marks the file as recently used (atime only, the mtime stays the
+        # time it was stored) and returns its stat, or None once it is gone
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except FileNotFoundError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            else:
+                self._disk[key] = stat.st_size
+                self._disk_bytes += stat.st_size
+        return stat
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        stat = self._touch_disk(key, path)
+        if data is None or stat is None:
+            return None
+        return data, stat.st_mtime
+
+    def _write_disk(self, key, data=None, source_path=None):
+        size = len(data) if data is not None else os.path.getsize(source_path)
+        if size > self.disk_limit:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a hidden temp file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            if data is not None:
+                f.write(data)
+            else:
+                with open(source_path, 'rb') as source:
+                    shutil.copyfileobj(source, f)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+            evicted = self._evict_disk()
+        self._remove_files([self._disk_path(old_key) for old_key in evicted])
+
+    def _evict_disk(self):
+        # Caller holds the lock; returns the evicted keys, whose files are
+        # removed after the lock is released
+        evicted = []
+        while self._disk_bytes > self.disk_limit:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.counters["disk_evictions"] += 1
+            evicted.append(old_key)
+        return evicted
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                memory_limit=self.memory_limit,
+                bundle_entries=sum(len(bundle.entries) for bundle in self._bundles),
+                bundle_bytes=sum(bundle.size for bundle in self._bundles),
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_bytes,
+                disk_limit=self.disk_limit if self.disk_dir else 0,
+            )
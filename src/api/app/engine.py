@@ -0,0 +1,94 @@
+# engine.py
+
+import asyncio
+import threading
+
+from gevent import Timeout, get_hub
+from gevent.hub import Waiter
+
+# Returned by _anext() instead of raising StopAsyncIteration across threads
+_EXHAUSTED = object()
+
+async def _anext(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+async def _aclose(agen):
+    try:
+        await agen.aclose()
+    except RuntimeError:
+        # Still unwinding a cancelled step; asyncio finalizes it once collected
+        pass
+
+class SynthesisEngine:
+    """
+    Owns one long-lived asyncio loop running on a dedicated thread.
+
+    WSGI handlers submit coroutines to the loop and wait on a gevent async
+    watcher, so a request waiting for synthesis only parks its own
+    greenlet and many syntheses can be in flight at once.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        # Started lazily so that forked worker processes get their own loop
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="synthesis-engine", daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop and return a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the engine loop, waiting cooperatively for its result."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("SynthesisEngine.run() cannot be called from the engine loop")
+
+        future = self.submit(coro)
+
+        # The async watcher is the thread-safe way to wake this greenlet's hub
+        # and it keeps the hub alive while the engine thread does the work
+        watcher = get_hub().loop.async_()
+        waiter = Waiter()
+        watcher.start(waiter.switch, None)
+        future.add_done_callback(lambda _: watcher.send())
+        try:
+            with Timeout(timeout):
+                waiter.get()
+        except BaseException:
+            # Client went away or the wait timed out; stop the work on the loop too
+            future.cancel()
+            raise
+        finally:
+            watcher.close()
+        return future.result()
+
+    def iterate(self, agen):
+        """Drive an async generator on the engine loop and yield its items synchronously."""
+        try:
+            while True:
+                item = self.run(_anext(agen))
+                if item is _EXHAUSTED:
+                    break
+                yield item
+        finally:
+            # Not waited for: this also runs when the consumer is being
+            # garbage collected and can no longer switch greenlets
+            self.submit(_aclose(agen))
+
+# Process-wide engine shared by all request handlers
+engine = SynthesisEngine()
@@ -0,0 +1,304 @@
+# jobs.py
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from prefork import process_alive
+from transcoder import fix_wav_header, WAV_HEADER_SCAN_SIZE
+
+# Jobs in these states are done and can be removed
+FINISHED_STATUSES = ('completed', 'failed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    response_format TEXT NOT NULL,
+    speed REAL NOT NULL,
+    pitch TEXT NOT NULL,
+    volume TEXT NOT NULL,
+    total_segments INTEGER NOT NULL,
+    completed_segments INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result_path TEXT,
+    result_size INTEGER,
+    owner INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_segments (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+class JobStore:
+    """
+    SQLite-backed record of jobs and of which of their segments are done.
+
+    Several worker processes can share one store: each opens its own
+    connection, and a job is run by whichever process claims it first.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        db = self._db
+        db.executescript(_SCHEMA)
+        if 'owner' not in [row['name'] for row in db.execute("PRAGMA table_info(jobs)")]:
+            # Stores created before jobs were claimed by a process
+            db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+
+    @property
+    def _db(self):
+        # A connection must not be used across fork, so each process opens its own
+        if self._connection_pid != os.getpid():
+            connection = sqlite3.connect(os.path.join(self.directory, 'jobs.sqlite3'), check_same_thread=False,
+                                         isolation_level=None, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._connection, self._connection_pid = connection, os.getpid()
+        return self._connection
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def segment_path(self, job_id, position):
+        return os.path.join(self.job_dir(job_id), f"{position:05d}.mp3")
+
+    def create(self, segments, voice, response_format, speed, pitch, volume):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "INSERT INTO jobs (id, status, voice, response_format, speed, pitch, volume, total_segments, created_at, updated_at)"
+                    " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, voice, response_format, speed, pitch, volume, len(segments), now, now),
+                )
+                self._db.executemany(
+                    "INSERT INTO job_segments (job_id, position, text) VALUES (?, ?, ?)",
+                    [(job_id, position, text) for position, text in enumerate(segments)],
+                )
+        return job_id
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def pending_segments(self, job_id):
+        return [(row['position'], row['text']) for row in self._execute(
+            "SELECT position, text FROM job_segments WHERE job_id = ? AND done = 0 ORDER BY position", (job_id,))]
+
+    def unfinished(self):
+        return [row['id'] for row in self._execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at")]
+
+    def claim(self, job_id):
+        """
+        Mark a queued job, or one left running by a process that is gone, as
+        running in this process. Returns False if another process has it.
+        """
+        with self._lock:
+            db = self._db
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                row = db.execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None or row['status'] not in ('queued', 'running'):
+                    return False
+                owner = row['owner']
+                if row['status'] == 'running' and owner not in (None, os.getpid()) and process_alive(owner):
+                    return False
+                db.execute("UPDATE jobs SET status = 'running', owner = ?, updated_at = ? WHERE id = ?",
+                           (os.getpid(), time.time(), job_id))
+                return True
+
+    def set_status(self, job_id, status, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        assignments = f"status = ?, updated_at = ?{', ' + columns if columns else ''}"
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (status, time.time(), *fields.values(), job_id))
+
+    def segment_done(self, job_id, position):
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute("UPDATE job_segments SET done = 1 WHERE job_id = ? AND position = ?", (job_id, position))
+                self._db.execute(
+                    "UPDATE jobs SET completed_segments = (SELECT COUNT(*) FROM job_segments WHERE job_id = ? AND done = 1),"
+                    " updated_at = ? WHERE id = ?",
+                    (job_id, time.time(), job_id),
+                )
+
+    def finished_before(self, cutoff):
+        """Ids of completed or failed jobs last updated before `cutoff`."""
+        return [row['id'] for row in self._execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (*FINISHED_STATUSES, cutoff))]
+
+    def delete(self, job_id):
+        """
+        Remove a completed or failed job with its segments and result.
+        Returns False if there is no such job or it has not finished.
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                deleted = self._db.execute("DELETE FROM jobs WHERE id = ? AND status IN (?, ?)",
+                                           (job_id, *FINISHED_STATUSES)).rowcount
+                if deleted:
+                    self._db.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+        if deleted:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return bool(deleted)
+
+class JobManager:
+    """
+    Runs queued jobs on the engine loop with a fixed number of workers.
+
+    Each segment's mp3 is written to the job directory and marked done as
+    soon as it finishes, so a job interrupted by a restart resumes from the
+    segments that are still missing. When all segments are done they are
+    stitched and converted once into the final output.
+
+    `stream_segment(text, job)` yields upstream mp3 for one segment and
+    `convert(chunks, response_format, speed)` turns stitched mp3 into the
+    requested output; both are provided by tts_handler.
+
+    The store and the job files are only touched from worker threads, never
+    directly on the engine loop. Finished jobs are removed by expire() once
+    they are older than `retention` seconds (0 keeps them forever).
+    """
+
+    def __init__(self, engine, store, stream_segment, convert, workers, segment_parallelism, retention=0):
+        self.engine = engine
+        self.store = store
+        self.stream_segment = stream_segment
+        self.convert = convert
+        self.workers = workers
+        self.segment_parallelism = segment_parallelism
+        self.retention = retention
+        self._queue = None
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the workers and requeue jobs left unfinished by a previous run."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            self._queue = asyncio.Queue()
+        self.engine.run(self._start())
+
+    async def _start(self):
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            self._queue.put_nowait(job_id)
+        for _ in range(self.workers):
+            asyncio.ensure_future(self._worker())
+
+    def submit(self, text_segments, voice, response_format, speed, pitch, volume):
+        self.start()
+        job_id = self.store.create(text_segments, voice, response_format, speed, pitch, volume)
+        self.engine.loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                await asyncio.to_thread(self.store.set_status, job_id, 'failed', error=str(e))
+
+    def _save_segment(self, job_id, position, data):
+        path = self.store.segment_path(job_id, position)
+        # Written under a temporary name so a crash never leaves a truncated segment
+        with open(path + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.part', path)
+        self.store.segment_done(job_id, position)
+
+    async def _run(self, job_id):
+        if not await asyncio.to_thread(self.store.claim, job_id):
+            return
+        job = await asyncio.to_thread(self.store.get, job_id)
+
+        semaphore = asyncio.Semaphore(self.segment_parallelism)
+
+        async def synthesize(position, text):
+            async with semaphore:
+                # A segment is at most SEGMENT_MAX_CHARS of text, so its mp3 is small
+                data = b"".join([chunk async for chunk in self.stream_segment(text, job)])
+                await asyncio.to_thread(self._save_segment, job_id, position, data)
+
+        pending = await asyncio.to_thread(self.store.pending_segments, job_id)
+        await asyncio.gather(*(synthesize(position, text) for position, text in pending))
+        await self._assemble(job)
+
+    def _read_segment(self, job_id, position):
+        with open(self.store.segment_path(job_id, position), 'rb') as f:
+            return f.read()
+
+    def _finish(self, job, f, temp_path, size):
+        # Patches the wav header, publishes the result and removes the segments
+        job_id = job['id']
+        with f:
+            if job['response_format'] == 'wav':
+                f.seek(0)
+                header = fix_wav_header(f.read(WAV_HEADER_SCAN_SIZE), size)
+                f.seek(0)
+                f.write(header)
+        result_path = os.path.join(self.store.job_dir(job_id), f"result.{job['response_format']}")
+        os.replace(temp_path, result_path)
+        self.store.set_status(job_id, 'completed', result_path=result_path, result_size=size)
+
+        for position in range(job['total_segments']):
+            os.remove(self.store.segment_path(job_id, position))
+
+    async def _assemble(self, job):
+        job_id = job['id']
+
+        async def stitched():
+            for position in range(job['total_segments']):
+                yield await asyncio.to_thread(self._read_segment, job_id, position)
+
+        fd, temp_path = await asyncio.to_thread(tempfile.mkstemp, dir=self.store.job_dir(job_id))
+        f = os.fdopen(fd, 'w+b')
+        size = 0
+        try:
+            async for chunk in self.convert(stitched(), job['response_format'], job['speed']):
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            f.close()
+            os.remove(temp_path)
+            raise
+        await asyncio.to_thread(self._finish, job, f, temp_path, size)
+
+    def delete(self, job_id):
+        """Remove a finished job and its files; False if it is missing or still running."""
+        return self.store.delete(job_id)
+
+    def expire(self):
+        """Remove finished jobs older than `retention`; returns how many were removed."""
+        if self.retention <= 0:
+            return 0
+        return sum(self.store.delete(job_id) for job_id in self.store.finished_before(time.time() - self.retention))
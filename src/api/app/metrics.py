@@ -0,0 +1,267 @@
+# metrics.py
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache hits up to long syntheses
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    """Holds metrics plus collectors that turn existing stats dicts into samples at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """`collector()` returns [(name, kind, documentation, {labels_tuple: value})]."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    label_text = "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in labels) + "}" if labels else ""
+                    lines.append(f"{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+def stats_collector(prefix, sources):
+    """
+    Expose existing `stats()` dicts as gauges named `{prefix}_{key}`, one
+    sample per source, so they are read only when /metrics is scraped.
+    `sources` maps a label value to a zero-argument callable.
+    """
+    def collect():
+        samples = {}
+        for source, stats in sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    samples.setdefault(key, {})[(('source', source),)] = value
+        return [(f"{prefix}_{key}", "gauge", f"{key} from {prefix} stats.", values) for key, values in samples.items()]
+    return collect
+
+registry = Registry()
+
+# Time spent in each stage of a request: upstream synthesis (and its first
+# byte), ffmpeg transcoding, sending the response and fetching the voice list
+stage_seconds = registry.histogram('tts_stage_duration_seconds', 'Duration of each processing stage.', ('stage',))
+synthesis_seconds = registry.histogram('tts_synthesis_duration_seconds', 'Duration of generate_speech/stream_speech/get_voices calls.', ('operation',))
+upstream_errors = registry.counter('tts_upstream_errors_total', 'Upstream synthesis or voice list failures by exception type.', ('operation', 'error'))
+speech_requests = registry.counter('tts_speech_requests_total', 'Speech requests by endpoint, format and voice.', ('endpoint', 'format', 'voice'))
+http_requests = registry.counter('http_requests_total', 'HTTP requests by endpoint, method and status.', ('endpoint', 'method', 'status'))
+http_seconds = registry.histogram('http_request_duration_seconds', 'Time from receiving a request until its body was fully sent.', ('endpoint',))
+http_bytes_out = registry.counter('http_response_bytes_total', 'Response body bytes sent.', ('endpoint',))
+http_in_flight = registry.gauge('http_requests_in_flight', 'Requests currently being handled or sent.')
+
+class RequestTiming:
+    """
+    Stages of one request for its Server-Timing header. Durations added
+    more than once (queue waits, handshakes, transcodes) are summed; marks
+    are the time since the request started, for points such as the first
+    upstream byte.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def mark(self, name, first=False):
+        if not (first and name in self.stages):
+            self.stages[name] = time.perf_counter() - self.started
+
+    def header(self):
+        stages = dict(self.stages, app=time.perf_counter() - self.started)
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items())
+
+# The current request's RequestTiming, set by MetricsMiddleware. Like the
+# admission contextvars it is copied along with every coroutine submitted
+# to the engine loop; outside a request it is None and recording is a no-op.
+current_timing = contextvars.ContextVar('current_timing', default=None)
+
+def record_timing(name, seconds):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+def mark_timing(name, first=False):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.mark(name, first)
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that measures each request until its body has been fully
+    sent, which also covers streamed and send_file responses. With
+    `server_timing` the stages recorded until the response starts are sent
+    back in a Server-Timing header; the send itself is still running then,
+    so it only shows up in the stage histogram.
+    """
+
+    def __init__(self, app, flask_app, server_timing=False):
+        self.app = app
+        self.flask_app = flask_app
+        self.server_timing = server_timing
+
+    def _endpoint(self, environ):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except Exception:
+            return "other"
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        endpoint = self._endpoint(environ)
+        method = environ.get('REQUEST_METHOD', '')
+        status_holder = []
+        # Set for every request, since a keep-alive connection reuses its greenlet
+        timing = RequestTiming() if self.server_timing else None
+        current_timing.set(timing)
+
+        def _start_response(status, headers, exc_info=None):
+            status_holder.append(status.split(' ', 1)[0])
+            if timing is not None:
+                headers = list(headers) + [('Server-Timing', timing.header())]
+            return start_response(status, headers, exc_info)
+
+        http_in_flight.inc()
+        try:
+            body = self.app(environ, _start_response)
+        except BaseException:
+            http_in_flight.dec()
+            raise
+        return _MeasuredBody(body, endpoint, method, status_holder, started)
+
+class _MeasuredBody:
+    def __init__(self, body, endpoint, method, status_holder, started):
+        self._body = body
+        self._endpoint = endpoint
+        self._method = method
+        self._status = status_holder
+        self._started = started
+        self._sent = 0
+        self._send_started = time.perf_counter()
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            now = time.perf_counter()
+            http_in_flight.dec()
+            http_requests.inc(endpoint=self._endpoint, method=self._method, status=self._status[0] if self._status else '')
+            http_seconds.observe(now - self._started, endpoint=self._endpoint)
+            http_bytes_out.inc(self._sent, endpoint=self._endpoint)
+            stage_seconds.observe(now - self._send_started, stage='send')
@@ -0,0 +1,248 @@
+# prefork.py
+
+import os
+import signal
+import socket
+import sys
+import time
+
+# Set on the re-executed master during a reload: the listening socket it
+# inherits and the workers of the previous generation it has to retire
+LISTEN_FD_ENV = 'PREFORK_LISTEN_FD'
+RETIRE_ENV = 'PREFORK_RETIRE'
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_LIFETIME = 5
+MAX_RESTART_DELAY = 30
+
+def prefork_supported():
+    return hasattr(os, 'fork')
+
+def reuse_port_supported():
+    return hasattr(socket, 'SO_REUSEPORT')
+
+def process_alive(pid):
+    """Whether another serving process with this pid is still running."""
+    if os.name == 'nt':
+        # Only one serving process on Windows; os.kill(pid, 0) would send CTRL_C_EVENT
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _bind(address, reuse_port=False, backlog=1024):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if os.name != 'nt':
+        # On Windows SO_REUSEADDR would let another process take over the port
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    return listener
+
+def bind_listener(address):
+    """
+    Bind the listening socket, or adopt the one a reloading master passed
+    on. Called before the application is imported, so that connections
+    arriving during start-up wait in the backlog instead of being refused.
+    """
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited:
+        listener = socket.socket(fileno=int(inherited))
+        listener.set_inheritable(False)
+        return listener
+    return _bind(address)
+
+class PreforkServer:
+    """
+    Master process that forks `workers` gevent WSGI servers.
+
+    By default the master binds the port and the workers inherit that one
+    listening socket. With `reuse_port` every worker binds its own socket
+    with SO_REUSEPORT and the kernel spreads connections between them.
+
+    Workers that crash are restarted, with a growing delay when they keep
+    dying right after start. SIGTERM/SIGINT stop everything; SIGHUP reloads
+    code and configuration without dropping connections: the master
+    re-executes itself (keeping its pid and the listening socket), forks a
+    new generation and only then asks the old workers to finish what they
+    are serving and exit. A socket bound earlier with bind_listener can be
+    passed as `listener`.
+    """
+
+    def __init__(self, app, address, workers, reuse_port=False, graceful_timeout=30, on_worker_start=None,
+                 listener=None):
+        self.app = app
+        self.address = address
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.on_worker_start = on_worker_start
+        self.master_pid = os.getpid()
+        self._listener = listener
+        self._slots = {}  # slot -> (pid, started)
+        self._restart_at = {}
+        self._restart_delay = {}
+        self._retiring = set()
+        self._stopping = False
+        self._reloading = False
+
+    def run(self):
+        if not self.reuse_port and self._listener is None:
+            self._listener = bind_listener(self.address)
+        retire = [int(pid) for pid in os.environ.pop(RETIRE_ENV, '').split(',') if pid]
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        print(f" * Pre-fork mode: {self.workers} workers (master pid {self.master_pid})", flush=True)
+        for slot in range(self.workers):
+            self._spawn(slot)
+        # The new generation is accepting; the previous one drains and exits
+        for pid in retire:
+            self._retire(pid)
+
+        while not self._stopping:
+            if self._reloading:
+                self._reexec()
+            self._reap()
+            now = time.monotonic()
+            for slot, restart_at in list(self._restart_at.items()):
+                if now >= restart_at:
+                    del self._restart_at[slot]
+                    self._spawn(slot)
+            time.sleep(0.2)
+        self._shutdown()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reloading = True
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self._serve(slot)
+                status = 0
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self._slots[slot] = (pid, time.monotonic())
+
+    def _serve(self, slot):
+        # Runs in the worker; the master's handlers do not apply here
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        import gevent
+        from gevent import socket as gevent_socket
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+
+        gevent.reinit()
+        if self.reuse_port:
+            listener = gevent_socket.socket(fileno=_bind(self.address, reuse_port=True).detach())
+        else:
+            listener = gevent_socket.fromfd(self._listener.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.close()
+        # With a pool, stop() waits for the handlers that are still running
+        server = WSGIServer(listener, self.app, spawn=Pool())
+
+        def stop():
+            # Stop accepting, then give in-flight requests and streams time to finish
+            server.stop(timeout=self.graceful_timeout)
+
+        def watch_master():
+            # Exit with the master instead of lingering as an orphan
+            while os.getppid() == self.master_pid:
+                gevent.sleep(1)
+            stop()
+
+        gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(stop))
+        gevent.spawn(watch_master)
+        if self.on_worker_start:
+            self.on_worker_start(slot)
+        server.serve_forever()
+
+    def _retire(self, pid):
+        self._retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self._retiring.discard(pid)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            for slot, (worker_pid, started) in list(self._slots.items()):
+                if worker_pid != pid:
+                    continue
+                del self._slots[slot]
+                if self._stopping:
+                    break
+                lifetime = time.monotonic() - started
+                if lifetime < MIN_WORKER_LIFETIME:
+                    delay = min(self._restart_delay.get(slot, 0.5) * 2, MAX_RESTART_DELAY)
+                else:
+                    delay = 0
+                self._restart_delay[slot] = delay or 0.5
+                print(f" * Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting"
+                      f"{f' in {delay:g}s' if delay else ''}", flush=True)
+                self._restart_at[slot] = time.monotonic() + delay
+                break
+
+    def _reexec(self):
+        # Same pid after exec, so the running workers stay our children
+        current = [pid for pid, _ in self._slots.values()] + list(self._retiring)
+        if self._listener is not None:
+            os.set_inheritable(self._listener.fileno(), True)
+            os.environ[LISTEN_FD_ENV] = str(self._listener.fileno())
+        os.environ[RETIRE_ENV] = ','.join(str(pid) for pid in current)
+        print(" * Reloading", flush=True)
+        sys.stderr.flush()
+        if getattr(sys, 'frozen', False):
+            os.execv(sys.executable, sys.argv)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def _shutdown(self):
+        workers = [pid for pid, _ in self._slots.values()] + list(self._retiring)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        remaining = set(workers)
+        while remaining and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                remaining.discard(pid)
+            else:
+                time.sleep(0.1)
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
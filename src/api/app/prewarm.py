@@ -0,0 +1,103 @@
+# prewarm.py
+#
+# Synthesize a fixed set of phrases ahead of deploy and write them to a
+# cache bundle that the server memory-maps at start-up (CACHE_BUNDLE), so
+# those phrases are served without calling the upstream service.
+#
+# The manifest lists one request per entry with the fields text (or input),
+# voice, format (or response_format), speed, pitch and volume; all but text
+# are optional. It can be JSON lines, a JSON array or CSV with a header row.
+#
+# Usage: python prewarm.py phrases.jsonl -o phrases.bundle [--concurrency 8]
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from utils import AUDIO_FORMAT_MIME_TYPES
+
+load_dotenv()
+
+# Same defaults as the HTTP API
+DEFAULT_VOICE = os.getenv('DEFAULT_VOICE', 'en-US-AndrewNeural')
+DEFAULT_RESPONSE_FORMAT = os.getenv('DEFAULT_RESPONSE_FORMAT', 'mp3')
+DEFAULT_SPEED = float(os.getenv('DEFAULT_SPEED', 1.0))
+
+def _manifest_rows(path):
+    with open(path, encoding='utf-8-sig') as f:
+        if path.lower().endswith('.csv'):
+            yield from enumerate(csv.DictReader(f), start=2)
+            return
+        content = f.read()
+    if content.lstrip().startswith('['):
+        yield from enumerate(json.loads(content), start=1)
+        return
+    for number, line in enumerate(content.splitlines(), start=1):
+        if line.strip() and not line.lstrip().startswith('#'):
+            yield number, json.loads(line)
+
+def read_manifest(path):
+    """Return the manifest as generate_batch items, raising ValueError on an invalid entry."""
+    items = []
+    for number, row in _manifest_rows(path):
+        text = (row.get('text') or row.get('input') or '').strip()
+        if not text:
+            raise ValueError(f"{path}:{number}: missing text")
+        response_format = row.get('format') or row.get('response_format') or DEFAULT_RESPONSE_FORMAT
+        if response_format not in AUDIO_FORMAT_MIME_TYPES:
+            raise ValueError(f"{path}:{number}: unsupported format '{response_format}'")
+        items.append({
+            "text": text,
+            "voice": row.get('voice') or DEFAULT_VOICE,
+            "response_format": response_format,
+            "speed": float(row.get('speed') or DEFAULT_SPEED),
+            "pitch": row.get('pitch') or None,
+            "volume": row.get('volume') or None,
+        })
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthesize a phrase manifest into a cache bundle")
+    parser.add_argument('manifest', help="JSON lines, JSON array or CSV file of phrases")
+    parser.add_argument('-o', '--output', required=True, help="bundle file to write")
+    parser.add_argument('--concurrency', type=int, default=8, help="syntheses running at once")
+    args = parser.parse_args()
+
+    try:
+        items = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Invalid manifest: {e}")
+
+    # Imported here: it configures the whole synthesis pipeline from the environment
+    from audio_cache import write_bundle
+    from engine import engine
+    from tts_handler import generate_batch, speech_cache_key, upstream_client
+
+    entries = []
+    failed = 0
+    for indices, audio, error in generate_batch(items, args.concurrency):
+        item = items[indices[0]]
+        if error is not None:
+            failed += 1
+            print(f"failed: {item['text'][:60]!r} ({item['voice']}, {item['response_format']}): {error}", file=sys.stderr)
+            continue
+        key = speech_cache_key(item['text'], item['voice'], item['response_format'], item['speed'], item['pitch'], item['volume'])
+        entries.append((key, bytes(audio), {
+            "text": item['text'],
+            "voice": item['voice'],
+            "format": item['response_format'],
+            "speed": item['speed'],
+        }))
+
+    engine.run(upstream_client.close())
+
+    count = write_bundle(args.output, entries)
+    print(f"Wrote {count} phrases ({sum(len(audio) for _, audio, _ in entries)} bytes) to {args.output}, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
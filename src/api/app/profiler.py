@@ -0,0 +1,82 @@
+# profiler.py
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+def _frame_label(frame):
+    # Same shape as py-spy's collapsed output: function (file:line)
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _collapse(frame, thread_name):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.append(thread_name)
+    # Collapsed stacks read from the root to the leaf
+    return ";".join(reversed(stack))
+
+class SamplingProfiler:
+    """
+    Statistical profiler for live traffic. profile() samples the stack of
+    every thread with sys._current_frames() from a native thread for a
+    fixed time; between profiles nothing is installed, so there is no cost
+    at all.
+
+    Greenlets all run on the main thread, so its samples show whichever
+    greenlet was running (the gevent hub when the process was idle) and
+    the engine thread's samples show the asyncio loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"profiles": 0, "samples": 0, "seconds_total": 0.0}
+
+    def profile(self, seconds, interval):
+        """
+        Sample for `seconds` every `interval` seconds and return
+        (Counter of collapsed stacks, number of samples). Must be called
+        from a native thread that is not needed meanwhile; raises
+        ProfilerBusy if a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            stacks = Counter()
+            samples = 0
+            own_thread = threading.get_ident()
+            started = time.perf_counter()
+            deadline = started + seconds
+            while True:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != own_thread:
+                        stacks[_collapse(frame, names.get(ident, f"thread-{ident}"))] += 1
+                samples += 1
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                time.sleep(min(interval, remaining))
+            self.counters["profiles"] += 1
+            self.counters["samples"] += samples
+            self.counters["seconds_total"] += time.perf_counter() - started
+            return stacks, samples
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return dict(self.counters, running=self._lock.locked())
+
+def render_collapsed(stacks):
+    """One `frame;frame;... count` line per stack, as flamegraph.pl and speedscope read it."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+# Process-wide profiler; each worker process profiles itself
+profiler = SamplingProfiler()
@@ -0,0 +1,263 @@
+# resilience.py
+
+import asyncio
+import functools
+import random
+import time
+from collections import deque
+
+from upstream import UPSTREAM_ERRORS
+
+class UpstreamTimeout(Exception):
+    """The service sent nothing for longer than the attempt or stall timeout."""
+
+class UpstreamUnavailable(Exception):
+    """Raised while the circuit breaker is open; maps to an HTTP 503 with Retry-After."""
+
+    def __init__(self, retry_after):
+        super().__init__("Upstream TTS service is unavailable, try again later")
+        self.status = 503
+        self.retry_after = retry_after
+
+# Failures that count against the service and can be retried
+RETRYABLE_ERRORS = UPSTREAM_ERRORS + (UpstreamTimeout,)
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed attempts and rejects calls
+    for `cooldown` seconds. Then a single trial call is let through: its
+    success closes the breaker, its failure opens it again. A threshold of
+    0 disables the breaker. Used only on the engine loop.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def allow(self):
+        """
+        Raise UpstreamUnavailable unless a call may go to the service now.
+        Returns True when this call is the trial of a half-open breaker.
+        """
+        if self.state == "open":
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                self.counters["rejected"] += 1
+                raise UpstreamUnavailable(max(1, int(remaining + 0.5)))
+            self.state = "half_open"
+            self._trial = False
+        if self.state == "half_open":
+            if self._trial:
+                self.counters["rejected"] += 1
+                raise UpstreamUnavailable(1)
+            self._trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.state = "closed"
+        self._trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.threshold and self.failures >= self.threshold):
+            if self.state != "open":
+                self.counters["opened"] += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+    def abandon(self):
+        # A trial call that was cancelled decides nothing; let the next one try
+        if self.state == "half_open":
+            self._trial = False
+
+async def _until_audio(agen):
+    # Everything up to and including the first audio chunk of an attempt
+    items = []
+    async for item in agen:
+        items.append(item)
+        if item["type"] == "audio":
+            break
+    return items
+
+class _Attempt:
+    def __init__(self, agen, timeout, hedge=False, release=None):
+        self.agen = agen
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.task = asyncio.ensure_future(_until_audio(agen))
+        self._release = release
+
+    def cancel(self):
+        self.task.cancel()
+        self.finish()
+
+    def finish(self):
+        # Give back the limiter slot a hedged attempt took, exactly once
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+class Resilience:
+    """
+    Wraps upstream synthesis attempts with:
+
+    - a per-attempt timeout to the first audio chunk, and a stall timeout
+      between messages once audio flows;
+    - retries with full-jitter exponential backoff, only while nothing has
+      been passed on to the caller yet;
+    - optional hedging: when an attempt has not produced audio after
+      `hedge_delay` seconds (or the recent p95 first-byte time with
+      'auto'), a second attempt is started and the first to produce audio
+      wins. A hedge takes its own slot of `limiter`, when given, and is
+      skipped rather than queued when none is free;
+    - a circuit breaker that fails fast while the service keeps failing.
+
+    `stream(factory)` yields the items of upstream_client.stream(); the
+    factory starts a new attempt each time it is called.
+    """
+
+    def __init__(self, attempt_timeout=10, stall_timeout=10, retries=2, backoff=0.25, max_backoff=5,
+                 hedge_delay=None, breaker_threshold=5, breaker_cooldown=30, limiter=None):
+        self.attempt_timeout = attempt_timeout
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_delay = hedge_delay
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.limiter = limiter
+        self._first_byte = deque(maxlen=200)
+        self.counters = {"attempts": 0, "retries": 0, "timeouts": 0, "failures": 0, "hedges": 0, "hedge_wins": 0,
+                         "hedges_skipped": 0}
+
+    def _hedge_after(self):
+        if self.hedge_delay == 'auto':
+            # Not enough history yet to know what a slow attempt is
+            if len(self._first_byte) < 20:
+                return None
+            samples = sorted(self._first_byte)
+            return samples[int(len(samples) * 0.95) - 1]
+        return self.hedge_delay
+
+    def _launch(self, factory, hedge=False, release=None):
+        self.counters["attempts"] += 1
+        return _Attempt(factory(), self.attempt_timeout, hedge, release)
+
+    def _launch_hedge(self, factory):
+        release = None
+        if self.limiter is not None:
+            acquired_at = self.limiter.try_acquire()
+            if acquired_at is None:
+                # A hedge is extra load; it must not queue behind real requests
+                self.counters["hedges_skipped"] += 1
+                return None
+            release = functools.partial(self.limiter.release, acquired_at)
+        self.counters["hedges"] += 1
+        return self._launch(factory, hedge=True, release=release)
+
+    def _failed(self):
+        self.counters["failures"] += 1
+        self.breaker.failure()
+
+    async def _first_audio(self, factory):
+        """Run an attempt, hedged if configured, until one of them produces audio."""
+        attempts = [self._launch(factory)]
+        hedge_after = self._hedge_after() if self.breaker.state == "closed" else None
+        hedge_at = attempts[0].started + hedge_after if hedge_after is not None else None
+        error = None
+        try:
+            while attempts:
+                now = time.monotonic()
+                wake_at = min(attempt.deadline for attempt in attempts)
+                if hedge_at is not None:
+                    wake_at = min(wake_at, hedge_at)
+                done, _ = await asyncio.wait([attempt.task for attempt in attempts], timeout=max(0, wake_at - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for attempt in [attempt for attempt in attempts if attempt.task in done]:
+                    attempts.remove(attempt)
+                    if attempt.task.exception() is None:
+                        self._first_byte.append(time.monotonic() - attempt.started)
+                        if attempt.hedge:
+                            self.counters["hedge_wins"] += 1
+                        return attempt, attempt.task.result()
+                    attempt.finish()
+                    error = attempt.task.exception()
+                    if not isinstance(error, RETRYABLE_ERRORS):
+                        # Not the service failing (e.g. a refused format): no retry, no breaker failure
+                        raise error
+                    self._failed()
+
+                now = time.monotonic()
+                for attempt in [attempt for attempt in attempts if now >= attempt.deadline]:
+                    attempts.remove(attempt)
+                    attempt.cancel()
+                    self.counters["timeouts"] += 1
+                    self._failed()
+                    error = UpstreamTimeout(f"No audio from upstream within {self.attempt_timeout:g}s")
+                if hedge_at is not None and now >= hedge_at and attempts:
+                    hedge_at = None
+                    hedge = self._launch_hedge(factory)
+                    if hedge is not None:
+                        attempts.append(hedge)
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def stream(self, factory):
+        for retry in range(self.retries + 1):
+            trial = self.breaker.allow()
+            try:
+                try:
+                    attempt, items = await self._first_audio(factory)
+                except RETRYABLE_ERRORS:
+                    if retry == self.retries:
+                        raise
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry)))
+                    continue
+                self.breaker.success()
+
+                # Audio has reached the caller from here on, so a failure is final
+                agen = attempt.agen
+                try:
+                    for item in items:
+                        yield item
+                    while True:
+                        try:
+                            item = await asyncio.wait_for(agen.__anext__(), self.stall_timeout)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            self.counters["timeouts"] += 1
+                            raise UpstreamTimeout(f"Upstream stalled for more than {self.stall_timeout:g}s")
+                        yield item
+                except RETRYABLE_ERRORS:
+                    self._failed()
+                    raise
+                finally:
+                    attempt.finish()
+                    await agen.aclose()
+                return
+            finally:
+                if trial and self.breaker.state == "half_open":
+                    self.breaker.abandon()
+
+    def stats(self):
+        return dict(
+            self.counters,
+            breaker_state=self.breaker.state,
+            breaker_open=int(self.breaker.state != "closed"),
+            breaker_opened=self.breaker.counters["opened"],
+            breaker_rejected=self.breaker.counters["rejected"],
+            consecutive_failures=self.breaker.failures,
+        )
@@ -0,0 +1,216 @@
+# scratch.py
+
+import io
+import os
+import tempfile
+import threading
+import time
+
+from prefork import process_alive
+
+# Scratch files carry this prefix so the janitor only ever touches its own files
+FILE_PREFIX = 'scratch-'
+
+def _file_pid(name):
+    # Spilled files are named scratch-<pid>-<random>
+    try:
+        return int(name[len(FILE_PREFIX):].split('-', 1)[0])
+    except ValueError:
+        return None
+
+class _ClosingReader:
+    """File object proxy that releases its ScratchBuffer when it is closed."""
+
+    def __init__(self, raw, buffer):
+        self._raw = raw
+        self._buffer = buffer
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        self._raw.close()
+        self._buffer.close()
+
+class ScratchBuffer:
+    """
+    Write-once buffer for one generated output. Data stays in memory until
+    it grows past the store's threshold, then it is spilled to a file in the
+    scratch directory. close() releases the memory or removes the file.
+    """
+
+    def __init__(self, store, initial=b""):
+        self.store = store
+        self.path = None
+        self.size = len(initial)
+        self.closed = False
+        self._memory = io.BytesIO(initial)
+        self._memory.seek(0, io.SEEK_END)
+        self._file = None
+        store._track(self, memory=self.size)
+
+    @property
+    def spilled(self):
+        return self.path is not None
+
+    def write(self, data):
+        if self._file is None and self.size + len(data) > self.store.memory_threshold:
+            self._spill()
+        if self._file is not None:
+            self._file.write(data)
+            self.store._track(self, disk=len(data))
+        else:
+            self._memory.write(data)
+            self.store._track(self, memory=len(data))
+        self.size += len(data)
+        return len(data)
+
+    def _spill(self):
+        fd, self.path = tempfile.mkstemp(prefix=f"{FILE_PREFIX}{os.getpid()}-", dir=self.store.directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._file.write(self._memory.getbuffer())
+        self.store._track(self, memory=-self.size, disk=self.size)
+        self.store._spilled()
+        self._memory = None
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def read_head(self, length):
+        if self._file is not None:
+            self.flush()
+            with open(self.path, 'rb') as f:
+                return f.read(length)
+        return self._memory.getbuffer()[:length].tobytes()
+
+    def overwrite(self, offset, data):
+        if self._file is not None:
+            self._file.seek(offset)
+            self._file.write(data)
+            self._file.seek(0, io.SEEK_END)
+        else:
+            self._memory.getbuffer()[offset:offset + len(data)] = data
+
+    def getvalue(self):
+        if self._file is not None:
+            self.flush()
+            with open(self.path, 'rb') as f:
+                return f.read()
+        return self._memory.getvalue()
+
+    def open(self):
+        """A fresh readable file object positioned at the start of the data."""
+        if self._file is not None:
+            self.flush()
+            return open(self.path, 'rb')
+        return io.BytesIO(self._memory.getvalue())
+
+    def reader(self):
+        """Like open(), but closing the returned file also closes this buffer."""
+        return _ClosingReader(self.open(), self)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.store._track(self, disk=-self.size, closing=True)
+        else:
+            self.store._track(self, memory=-self.size, closing=True)
+            self._memory = None
+
+class ScratchStore:
+    """
+    Owns the scratch directory: hands out ScratchBuffers, keeps byte counts
+    of what is currently held, and sweeps files left behind by crashed
+    processes once they are older than `max_age` or exceed `quota` bytes.
+    The directory may be shared by several worker processes: files of
+    another process that is still running are never swept (on Windows only
+    one process serves, so other pids are always leftovers of earlier runs).
+    """
+
+    def __init__(self, directory, memory_threshold, quota, max_age):
+        self.directory = directory
+        self.memory_threshold = memory_threshold
+        self.quota = quota
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._active = set()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self.counters = {"buffers": 0, "spilled": 0, "swept_files": 0, "swept_bytes": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def buffer(self, initial=b""):
+        return ScratchBuffer(self, initial)
+
+    def _track(self, buffer, memory=0, disk=0, closing=False):
+        with self._lock:
+            if closing:
+                self._active.discard(buffer)
+            elif buffer not in self._active:
+                self._active.add(buffer)
+                self.counters["buffers"] += 1
+            self._memory_bytes += memory
+            self._disk_bytes += disk
+
+    def _spilled(self):
+        with self._lock:
+            self.counters["spilled"] += 1
+
+    def sweep(self):
+        """Remove orphaned scratch files; returns the number of files removed."""
+        with self._lock:
+            active_paths = {buffer.path for buffer in self._active if buffer.path}
+
+        orphans = []
+        own_pid = os.getpid()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(FILE_PREFIX) or path in active_paths:
+                continue
+            pid = _file_pid(name)
+            if pid is not None and pid != own_pid and process_alive(pid):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            orphans.append((stat.st_mtime, stat.st_size, path))
+
+        # Oldest first: anything past max_age goes, then more until under quota
+        orphans.sort()
+        now = time.time()
+        orphan_bytes = sum(size for _, size, _ in orphans)
+        removed = 0
+        for mtime, size, path in orphans:
+            over_quota = self._disk_bytes + orphan_bytes > self.quota
+            if now - mtime < self.max_age and not over_quota:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            orphan_bytes -= size
+            removed += 1
+            with self._lock:
+                self.counters["swept_files"] += 1
+                self.counters["swept_bytes"] += size
+        return removed
+
+    def usage(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                active_buffers=len(self._active),
+                memory_bytes=self._memory_bytes,
+                disk_bytes=self._disk_bytes,
+                quota=self.quota,
+                directory=self.directory,
+            )
@@ -0,0 +1,70 @@
+# segmenter.py
+
+import re
+
+# Paragraphs are separated by one or more line breaks
+_PARAGRAPH_BREAK = re.compile(r'\s*\n\s*')
+
+# A sentence ends at CJK full stops/question/exclamation marks (no space
+# needed), or at Latin ones followed by whitespace; trailing closing quotes
+# and brackets stay with the sentence they close
+_SENTENCE_END = re.compile(
+    r'(?:[。！？；…]+|[.!?;]+(?=\s))[”’」』）》)\]"\']*\s*'
+)
+
+# Weaker break points used only when a single sentence is too long
+_CLAUSE_END = re.compile(r'(?:[，、：,:]|\s)+')
+
+def _sentences(paragraph):
+    start = 0
+    for match in _SENTENCE_END.finditer(paragraph):
+        sentence = paragraph[start:match.end()].strip()
+        if sentence:
+            yield sentence
+        start = match.end()
+    tail = paragraph[start:].strip()
+    if tail:
+        yield tail
+
+def _split_long(sentence, max_chars):
+    # Cut at the last clause boundary that fits, or hard-cut as a last resort
+    while len(sentence) > max_chars:
+        cut = 0
+        for match in _CLAUSE_END.finditer(sentence, 0, max_chars):
+            cut = match.end()
+        if cut == 0:
+            cut = max_chars
+        yield sentence[:cut].strip()
+        sentence = sentence[cut:].strip()
+    if sentence:
+        yield sentence
+
+def split_text(text, max_chars):
+    """
+    Split text into segments of at most `max_chars` characters, breaking at
+    paragraph and sentence boundaries (CJK and Latin punctuation) and
+    packing consecutive sentences together. Short text is one segment.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text]
+
+    segments = []
+    current = ""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        for sentence in _sentences(paragraph):
+            for piece in _split_long(sentence, max_chars):
+                # Joined sentences need a space unless both sides are CJK
+                joiner = "" if not current or not (current[-1].isascii() or piece[0].isascii()) else " "
+                if current and len(current) + len(joiner) + len(piece) > max_chars:
+                    segments.append(current)
+                    current = piece
+                else:
+                    current = f"{current}{joiner}{piece}"
+        # Prefer ending a segment at a paragraph boundary once it is half full
+        if len(current) >= max_chars // 2:
+            segments.append(current)
+            current = ""
+    if current:
+        segments.append(current)
+    return segments
@@ -1,626 +1,232 @@
 # server.py
 
-from flask import Flask, request, send_file, jsonify, render_template_string
-from gevent.pywsgi import WSGIServer
 from dotenv import load_dotenv
 import os
-import webbrowser
-import threading
-import time
 
-from tts_handler import generate_speech, get_models, get_voices
-from utils import require_api_key, AUDIO_FORMAT_MIME_TYPES
+from prefork import PreforkServer, bind_listener, prefork_supported, reuse_port_supported
+from utils import require_api_key, require_api_key_or_param, parse_bool, AUDIO_FORMAT_MIME_TYPES
 
-app = Flask(__name__)
 load_dotenv()
 
 API_KEY = os.getenv('API_KEY', 'sk')
 PORT = int(os.getenv('PORT', 5050))
+# 多进程模式：WORKERS > 1 时以预派生 (pre-fork) 方式启动多个 worker 进程
+WORKERS = int(os.getenv('WORKERS', 1))
+PREFORK = WORKERS > 1 and prefork_supported()
+REUSE_PORT = PREFORK and parse_bool(os.getenv('REUSE_PORT'), False) and reuse_port_supported()
+GRACEFUL_TIMEOUT = float(os.getenv('GRACEFUL_TIMEOUT', 30))
+
+# 直接运行时先绑定端口，再导入 Flask、gevent、edge-tts 等较重的依赖：
+# 启动期间到达的连接在监听队列中等待，而不是被拒绝（REUSE_PORT 时由各 worker 各自绑定）
+LISTENER = bind_listener(('0.0.0.0', PORT)) if __name__ == '__main__' and not REUSE_PORT else None
+
+from flask import Flask, Response, request, send_file, jsonify
+from gevent import get_hub, socket as gevent_socket
+from gevent.pywsgi import WSGIServer
+from werkzeug.exceptions import HTTPException, RequestedRangeNotSatisfiable
+from werkzeug.wsgi import wrap_file
+import threading
+import time
+import json
+import base64
+import math
+import re
+import zipfile
+from itertools import chain
+
+from tts_handler import generate_speech, stream_speech, generate_batch, prepare_dialogue, dialogue_key, generate_dialogue, stream_dialogue, submit_job, get_job, delete_job, speech_cache_key, voice_label, audio_cache, scratch_store, voice_catalog, upstream_limiter, transcode_limiter, transcoder_backend, upstream_client, upstream_resilience, inflight, timestamp_store, get_timestamps, start_background_tasks, get_models, get_voices
+from admission import AdmissionRejected, begin_request
+from resilience import UpstreamUnavailable, UpstreamTimeout, RETRYABLE_ERRORS
+from metrics import registry, speech_requests, stats_collector, MetricsMiddleware
+from timestamps import BOUNDARY_TYPES, TIMESTAMP_FORMAT_MIME_TYPES, render as render_timestamps, timestamps_id
+from static_assets import StaticAsset
+from audio_cache import BufferReader
+from profiler import ProfilerBusy, profiler, render_collapsed
+
+app = Flask(__name__)
+# Request counts, latency through the last byte sent and bytes out per endpoint,
+# plus a Server-Timing header with each request's stages
+app.wsgi_app = MetricsMiddleware(app.wsgi_app, app, server_timing=parse_bool(os.getenv('SERVER_TIMING'), True))
+# 磁盘缓存中的音频交给前置的 Web 服务器（Apache mod_xsendfile、lighttpd 等）用 sendfile 发送
+app.config['USE_X_SENDFILE'] = parse_bool(os.getenv('USE_X_SENDFILE'), False)
 
 DEFAULT_VOICE = os.getenv('DEFAULT_VOICE', 'en-US-AndrewNeural')
 DEFAULT_RESPONSE_FORMAT = os.getenv('DEFAULT_RESPONSE_FORMAT', 'mp3')
 DEFAULT_SPEED = float(os.getenv('DEFAULT_SPEED', 1.0))
 
-# DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'tts-1')
+# 请求排队等待合成资源的最长时间（秒），超时返回 503
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 30))
 
-# HTML文件路径
-HTML_FILE = os.path.join(os.path.dirname(__file__), 'index.html')
+# 批量合成接口单次请求允许的最大条目数
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 1000))
 
-# 添加一个完整的 HTML 测试页面（备用，如果文件不存在则使用）
-HOME_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Edge TTS API 测试平台</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { 
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 12px;
-            box-shadow: 0 10px 40px rgba(0,0,0,0.2);
-            overflow: hidden;
-        }
-        .header {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 30px;
-            text-align: center;
-        }
-        .header h1 { font-size: 2em; margin-bottom: 10px; }
-        .header p { opacity: 0.9; }
-        .content { padding: 30px; }
-        .section {
-            margin-bottom: 40px;
-            padding: 25px;
-            background: #f8f9fa;
-            border-radius: 8px;
-            border-left: 4px solid #667eea;
-        }
-        .section h2 {
-            color: #333;
-            margin-bottom: 20px;
-            font-size: 1.5em;
-        }
-        .form-group {
-            margin-bottom: 15px;
-        }
-        .form-group label {
-            display: block;
-            margin-bottom: 5px;
-            color: #555;
-            font-weight: 500;
-        }
-        .form-group input,
-        .form-group select,
-        .form-group textarea {
-            width: 100%;
-            padding: 10px;
-            border: 1px solid #ddd;
-            border-radius: 6px;
-            font-size: 14px;
-            transition: border-color 0.3s;
-        }
-        .form-group input:focus,
-        .form-group select:focus,
-        .form-group textarea:focus {
-            outline: none;
-            border-color: #667eea;
-        }
-        .form-group textarea {
-            min-height: 80px;
-            resize: vertical;
-        }
-        .form-row {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 15px;
-        }
-        .btn {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 6px;
-            cursor: pointer;
-            font-size: 14px;
-            font-weight: 500;
-            transition: transform 0.2s, box-shadow 0.2s;
-            margin-right: 10px;
-            margin-top: 10px;
-        }
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
-        }
-        .btn:active {
-            transform: translateY(0);
-        }
-        .btn-secondary {
-            background: #6c757d;
-        }
-        .result {
-            margin-top: 20px;
-            padding: 15px;
-            background: white;
-            border-radius: 6px;
-            border: 1px solid #ddd;
-            display: none;
-        }
-        .result.show {
-            display: block;
-        }
-        .result h3 {
-            margin-bottom: 10px;
-            color: #333;
-        }
-        .result pre {
-            background: #f8f9fa;
-            padding: 15px;
-            border-radius: 6px;
-            overflow-x: auto;
-            font-size: 12px;
-            line-height: 1.5;
-        }
-        .audio-player {
-            margin-top: 15px;
-            width: 100%;
-        }
-        .loading {
-            display: none;
-            text-align: center;
-            padding: 20px;
-            color: #667eea;
-        }
-        .loading.show {
-            display: block;
-        }
-        .error {
-            color: #dc3545;
-            background: #f8d7da;
-            padding: 10px;
-            border-radius: 6px;
-            margin-top: 10px;
-        }
-        .success {
-            color: #155724;
-            background: #d4edda;
-            padding: 10px;
-            border-radius: 6px;
-            margin-top: 10px;
-        }
-        .voice-list {
-            max-height: 300px;
-            overflow-y: auto;
-            margin-top: 10px;
-        }
-        .voice-item {
-            padding: 8px;
-            border-bottom: 1px solid #eee;
-            cursor: pointer;
-            transition: background 0.2s;
-        }
-        .voice-item:hover {
-            background: #f0f0f0;
-        }
-        .method-selector {
-            display: inline-block;
-            margin-bottom: 15px;
-        }
-        .method-selector label {
-            margin-right: 15px;
-            cursor: pointer;
-        }
-        .method-selector input[type="radio"] {
-            margin-right: 5px;
-        }
-        @media (max-width: 768px) {
-            .form-row {
-                grid-template-columns: 1fr;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🎤 Edge TTS API 测试平台</h1>
-            <p>基于微软 Edge TTS 的 OpenAI TTS API 替代品</p>
-        </div>
-        <div class="content">
-            <!-- 普通TTS接口测试 -->
-            <div class="section">
-                <h2>📝 普通TTS接口 (/tts)</h2>
-                <div class="method-selector">
-                    <label><input type="radio" name="tts-method" value="GET" checked> GET</label>
-                    <label><input type="radio" name="tts-method" value="POST"> POST</label>
-                </div>
-                <div class="form-group">
-                    <label>API密钥 (key):</label>
-                    <input type="text" id="tts-key" placeholder="输入API密钥" value="sk">
-                </div>
-                <div class="form-group">
-                    <label>文本内容 (text):</label>
-                    <textarea id="tts-text" placeholder="输入要合成的文本">Hello, this is a test of the TTS API.</textarea>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label>说话人 (voice):</label>
-                        <input type="text" id="tts-voice" placeholder="例如: en-US-AndrewNeural" value="en-US-AndrewNeural">
-                    </div>
-                    <div class="form-group">
-                        <label>音频格式 (format):</label>
-                        <select id="tts-format">
-                            <option value="mp3">MP3</option>
-                            <option value="wav">WAV</option>
-                            <option value="opus">OPUS</option>
-                            <option value="aac">AAC</option>
-                            <option value="flac">FLAC</option>
-                            <option value="pcm">PCM</option>
-                        </select>
-                    </div>
-                </div>
-                <div class="form-group">
-                    <label>语速 (speed):</label>
-                    <input type="number" id="tts-speed" step="0.1" min="0.5" max="2.0" value="1.0">
-                </div>
-                <button class="btn" onclick="testSimpleTTS()">🚀 测试TTS接口</button>
-                <div class="loading" id="tts-loading">正在生成语音...</div>
-                <div class="result" id="tts-result">
-                    <h3>结果:</h3>
-                    <audio id="tts-audio" class="audio-player" controls></audio>
-                    <div id="tts-message"></div>
-                </div>
-            </div>
-
-            <!-- OpenAI格式TTS接口测试 -->
-            <div class="section">
-                <h2>🎯 OpenAI格式TTS接口 (/v1/audio/speech)</h2>
-                <div class="form-group">
-                    <label>API密钥 (Bearer Token):</label>
-                    <input type="text" id="openai-key" placeholder="输入API密钥" value="sk">
-                </div>
-                <div class="form-group">
-                    <label>文本内容 (input):</label>
-                    <textarea id="openai-input" placeholder="输入要合成的文本">Hello, this is a test of the OpenAI TTS API.</textarea>
-                </div>
-                <div class="form-row">
-                    <div class="form-group">
-                        <label>说话人 (voice):</label>
-                        <input type="text" id="openai-voice" placeholder="例如: en-US-AndrewNeural" value="en-US-AndrewNeural">
-                    </div>
-                    <div class="form-group">
-                        <label>音频格式 (response_format):</label>
-                        <select id="openai-format">
-                            <option value="mp3">MP3</option>
-                            <option value="wav">WAV</option>
-                            <option value="opus">OPUS</option>
-                            <option value="aac">AAC</option>
-                            <option value="flac">FLAC</option>
-                            <option value="pcm">PCM</option>
-                        </select>
-                    </div>
-                </div>
-                <div class="form-group">
-                    <label>语速 (speed):</label>
-                    <input type="number" id="openai-speed" step="0.1" min="0.5" max="2.0" value="1.0">
-                </div>
-                <button class="btn" onclick="testOpenAITTS()">🚀 测试OpenAI TTS接口</button>
-                <div class="loading" id="openai-loading">正在生成语音...</div>
-                <div class="result" id="openai-result">
-                    <h3>结果:</h3>
-                    <audio id="openai-audio" class="audio-player" controls></audio>
-                    <div id="openai-message"></div>
-                </div>
-            </div>
-
-            <!-- 列出模型 -->
-            <div class="section">
-                <h2>📋 列出模型 (/v1/models)</h2>
-                <div class="form-group">
-                    <label>API密钥 (Bearer Token):</label>
-                    <input type="text" id="models-key" placeholder="输入API密钥" value="sk">
-                </div>
-                <button class="btn" onclick="testListModels()">📋 获取模型列表</button>
-                <div class="loading" id="models-loading">正在获取模型列表...</div>
-                <div class="result" id="models-result">
-                    <h3>结果:</h3>
-                    <pre id="models-data"></pre>
-                </div>
-            </div>
-
-            <!-- 列出语音 -->
-            <div class="section">
-                <h2>🗣️ 列出语音 (/v1/voices)</h2>
-                <div class="form-group">
-                    <label>API密钥 (Bearer Token):</label>
-                    <input type="text" id="voices-key" placeholder="输入API密钥" value="sk">
-                </div>
-                <div class="form-group">
-                    <label>语言代码 (language, 可选):</label>
-                    <input type="text" id="voices-language" placeholder="例如: zh-CN, en-US (留空获取默认语言)">
-                </div>
-                <button class="btn" onclick="testListVoices()">🗣️ 获取语音列表</button>
-                <div class="loading" id="voices-loading">正在获取语音列表...</div>
-                <div class="result" id="voices-result">
-                    <h3>结果:</h3>
-                    <div class="voice-list" id="voices-data"></div>
-                </div>
-            </div>
-
-            <!-- 列出所有语音 -->
-            <div class="section">
-                <h2>🌍 列出所有语音 (/v1/voices/all)</h2>
-                <div class="form-group">
-                    <label>API密钥 (Bearer Token):</label>
-                    <input type="text" id="all-voices-key" placeholder="输入API密钥" value="sk">
-                </div>
-                <button class="btn" onclick="testListAllVoices()">🌍 获取所有语音</button>
-                <div class="loading" id="all-voices-loading">正在获取所有语音列表...</div>
-                <div class="result" id="all-voices-result">
-                    <h3>结果:</h3>
-                    <div class="voice-list" id="all-voices-data"></div>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        const API_BASE = window.location.origin;
-
-        // 普通TTS接口测试
-        async function testSimpleTTS() {
-            const method = document.querySelector('input[name="tts-method"]:checked').value;
-            const key = document.getElementById('tts-key').value;
-            const text = document.getElementById('tts-text').value;
-            const voice = document.getElementById('tts-voice').value;
-            const format = document.getElementById('tts-format').value;
-            const speed = document.getElementById('tts-speed').value;
-
-            if (!key || !text) {
-                showMessage('tts-message', '请填写API密钥和文本内容', 'error');
-                return;
-            }
+# 对话合成接口单次请求允许的最大台词数
+DIALOGUE_MAX_LINES = int(os.getenv('DIALOGUE_MAX_LINES', 200))
 
-            const loading = document.getElementById('tts-loading');
-            const result = document.getElementById('tts-result');
-            const audio = document.getElementById('tts-audio');
-
-            loading.classList.add('show');
-            result.classList.remove('show');
-
-            try {
-                let url = `${API_BASE}/tts?key=${encodeURIComponent(key)}&text=${encodeURIComponent(text)}&voice=${encodeURIComponent(voice)}&format=${format}&speed=${speed}`;
-                
-                if (method === 'POST') {
-                    const response = await fetch(`${API_BASE}/tts`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({ key, text, voice, format, speed })
-                    });
-
-                    if (response.ok) {
-                        const blob = await response.blob();
-                        const audioUrl = URL.createObjectURL(blob);
-                        audio.src = audioUrl;
-                        result.classList.add('show');
-                        showMessage('tts-message', '语音生成成功！', 'success');
-                    } else {
-                        const error = await response.json();
-                        showMessage('tts-message', `错误: ${error.error || '生成失败'}`, 'error');
-                        result.classList.add('show');
-                    }
-                } else {
-                    const response = await fetch(url);
-                    if (response.ok) {
-                        const blob = await response.blob();
-                        const audioUrl = URL.createObjectURL(blob);
-                        audio.src = audioUrl;
-                        result.classList.add('show');
-                        showMessage('tts-message', '语音生成成功！', 'success');
-                    } else {
-                        const error = await response.json();
-                        showMessage('tts-message', `错误: ${error.error || '生成失败'}`, 'error');
-                        result.classList.add('show');
-                    }
-                }
-            } catch (error) {
-                showMessage('tts-message', `请求失败: ${error.message}`, 'error');
-                result.classList.add('show');
-            } finally {
-                loading.classList.remove('show');
-            }
-        }
-
-        // OpenAI格式TTS接口测试
-        async function testOpenAITTS() {
-            const key = document.getElementById('openai-key').value;
-            const input = document.getElementById('openai-input').value;
-            const voice = document.getElementById('openai-voice').value;
-            const format = document.getElementById('openai-format').value;
-            const speed = document.getElementById('openai-speed').value;
-
-            if (!key || !input) {
-                showMessage('openai-message', '请填写API密钥和文本内容', 'error');
-                return;
-            }
+# 已合成音频稳定地址的浏览器缓存时间（秒），之后凭 ETag / Last-Modified 重新验证
+AUDIO_URL_MAX_AGE = int(os.getenv('AUDIO_URL_MAX_AGE', 86400))
 
-            const loading = document.getElementById('openai-loading');
-            const result = document.getElementById('openai-result');
-            const audio = document.getElementById('openai-audio');
-
-            loading.classList.add('show');
-            result.classList.remove('show');
-
-            try {
-                const response = await fetch(`${API_BASE}/v1/audio/speech`, {
-                    method: 'POST',
-                    headers: {
-                        'Authorization': `Bearer ${key}`,
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        input: input,
-                        voice: voice,
-                        response_format: format,
-                        speed: parseFloat(speed)
-                    })
-                });
-
-                if (response.ok) {
-                    const blob = await response.blob();
-                    const audioUrl = URL.createObjectURL(blob);
-                    audio.src = audioUrl;
-                    result.classList.add('show');
-                    showMessage('openai-message', '语音生成成功！', 'success');
-                } else {
-                    const error = await response.json();
-                    showMessage('openai-message', `错误: ${error.error || '生成失败'}`, 'error');
-                    result.classList.add('show');
-                }
-            } catch (error) {
-                showMessage('openai-message', `请求失败: ${error.message}`, 'error');
-                result.classList.add('show');
-            } finally {
-                loading.classList.remove('show');
-            }
-        }
-
-        // 列出模型
-        async function testListModels() {
-            const key = document.getElementById('models-key').value;
-            if (!key) {
-                alert('请填写API密钥');
-                return;
-            }
+# 语速范围与 OpenAI 接口一致
+SPEED_MIN = 0.25
+SPEED_MAX = 4.0
 
-            const loading = document.getElementById('models-loading');
-            const result = document.getElementById('models-result');
-            const data = document.getElementById('models-data');
-
-            loading.classList.add('show');
-            result.classList.remove('show');
-
-            try {
-                const response = await fetch(`${API_BASE}/v1/models`, {
-                    headers: {
-                        'Authorization': `Bearer ${key}`
-                    }
-                });
-
-                const json = await response.json();
-                data.textContent = JSON.stringify(json, null, 2);
-                result.classList.add('show');
-            } catch (error) {
-                data.textContent = `错误: ${error.message}`;
-                result.classList.add('show');
-            } finally {
-                loading.classList.remove('show');
-            }
-        }
-
-        // 列出语音
-        async function testListVoices() {
-            const key = document.getElementById('voices-key').value;
-            const language = document.getElementById('voices-language').value;
-            if (!key) {
-                alert('请填写API密钥');
-                return;
-            }
+def parse_speed(value):
+    """解析语速参数，不是数字或超出 SPEED_MIN~SPEED_MAX 时抛出 ValueError"""
+    try:
+        speed = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'speed' must be a number, got {value!r}")
+    if not (math.isfinite(speed) and SPEED_MIN <= speed <= SPEED_MAX):
+        raise ValueError(f"'speed' must be between {SPEED_MIN:g} and {SPEED_MAX:g}")
+    return speed
 
-            const loading = document.getElementById('voices-loading');
-            const result = document.getElementById('voices-result');
-            const data = document.getElementById('voices-data');
-
-            loading.classList.add('show');
-            result.classList.remove('show');
-
-            try {
-                let url = `${API_BASE}/v1/voices`;
-                if (language) {
-                    url += `?language=${encodeURIComponent(language)}`;
-                }
-                const response = await fetch(url, {
-                    headers: {
-                        'Authorization': `Bearer ${key}`
-                    }
-                });
-
-                const json = await response.json();
-                displayVoices(data, json.voices || []);
-                result.classList.add('show');
-            } catch (error) {
-                data.innerHTML = `<div class="error">错误: ${error.message}</div>`;
-                result.classList.add('show');
-            } finally {
-                loading.classList.remove('show');
-            }
-        }
-
-        // 列出所有语音
-        async function testListAllVoices() {
-            const key = document.getElementById('all-voices-key').value;
-            if (!key) {
-                alert('请填写API密钥');
-                return;
-            }
+def parse_response_format(value):
+    """校验输出格式，不在 AUDIO_FORMAT_MIME_TYPES 中时抛出 ValueError"""
+    if not isinstance(value, str) or value not in AUDIO_FORMAT_MIME_TYPES:
+        raise ValueError(f"Unsupported response_format {value!r}, expected one of {', '.join(AUDIO_FORMAT_MIME_TYPES)}")
+    return value
 
-            const loading = document.getElementById('all-voices-loading');
-            const result = document.getElementById('all-voices-result');
-            const data = document.getElementById('all-voices-data');
-
-            loading.classList.add('show');
-            result.classList.remove('show');
-
-            try {
-                const response = await fetch(`${API_BASE}/v1/voices/all`, {
-                    headers: {
-                        'Authorization': `Bearer ${key}`
-                    }
-                });
-
-                const json = await response.json();
-                displayVoices(data, json.voices || []);
-                result.classList.add('show');
-            } catch (error) {
-                data.innerHTML = `<div class="error">错误: ${error.message}</div>`;
-                result.classList.add('show');
-            } finally {
-                loading.classList.remove('show');
-            }
-        }
+# 缓存键是 SHA-256 十六进制摘要
+CACHE_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
 
-        // 显示语音列表
-        function displayVoices(container, voices) {
-            if (voices.length === 0) {
-                container.innerHTML = '<div class="error">未找到语音</div>';
-                return;
-            }
+# 单次采样分析的最长时间（秒）
+PROFILE_MAX_SECONDS = 300
 
-            container.innerHTML = voices.map(voice => {
-                return `<div class="voice-item" onclick="selectVoice('${voice.name}')">
-                    <strong>${voice.name}</strong> - ${voice.gender} (${voice.language})
-                </div>`;
-            }).join('');
-        }
-
-        // 选择语音
-        function selectVoice(voiceName) {
-            document.getElementById('tts-voice').value = voiceName;
-            document.getElementById('openai-voice').value = voiceName;
-            alert(`已选择语音: ${voiceName}`);
-        }
-
-        // 显示消息
-        function showMessage(elementId, message, type) {
-            const element = document.getElementById(elementId);
-            element.className = type;
-            element.textContent = message;
-        }
-    </script>
-</body>
-</html>
-"""
+# DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'tts-1')
 
-@app.route('/')
-def home():
-    # 尝试读取独立的HTML文件，如果不存在则使用模板
+# HTML文件路径
+HTML_FILE = os.path.join(os.path.dirname(__file__), 'index.html')
+
+# 测试页面的浏览器缓存时间（秒），之后凭 ETag 重新验证
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 86400))
+
+def load_home_page():
+    """测试页面在启动时读取一次，并预先压缩为 gzip（安装 brotli 时还有 br）"""
     if os.path.exists(HTML_FILE):
-        with open(HTML_FILE, 'r', encoding='utf-8') as f:
-            return f.read()
+        return StaticAsset.from_file(HTML_FILE, 'text/html')
+    # index.html 不存在时使用内置模板
+    from home_template import HOME_TEMPLATE
+    return StaticAsset(HOME_TEMPLATE.encode('utf-8'), 'text/html')
+
+HOME_PAGE = load_home_page()
+
+# wav streamed through a pipe carries placeholder sizes in its header, so it
+# is only streamed when the client asks for it explicitly
+STREAM_BY_DEFAULT = {fmt for fmt in AUDIO_FORMAT_MIME_TYPES if fmt != "wav"}
+
+@app.before_request
+def admission_context():
+    # 按 API 密钥（没有时按客户端地址）公平分配合成资源
+    auth_header = request.headers.get('Authorization', '')
+    client = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else None
+    client = client or request.values.get('key') or request.values.get('api_key') or request.remote_addr
+    begin_request(client, ADMISSION_TIMEOUT)
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# 上游熔断期间快速失败，与准入拒绝一样返回 503 和 Retry-After
+app.register_error_handler(UpstreamUnavailable, admission_rejected)
+
+def upstream_failed(e):
+    # 重试后上游仍然失败或超时
+    status = 504 if isinstance(e, UpstreamTimeout) else 502
+    return jsonify({"error": f"Upstream TTS service failed: {e}"}), status
+
+for upstream_error in RETRYABLE_ERRORS:
+    app.register_error_handler(upstream_error, upstream_failed)
+
+def wants_stream(data, response_format):
+    return parse_bool(data.get('stream'), response_format in STREAM_BY_DEFAULT)
+
+def not_modified(etag):
+    """304 when the client already holds the audio for this exact request."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def stream_response(chunks, mime_type, response_format, etag):
+    # Pull the first chunk before answering so upstream errors still map to an error status
+    first_chunk = next(chunks, b"")
+    headers = {"Content-Disposition": f"attachment; filename=speech.{response_format}"}
+    response = Response(chain([first_chunk], chunks), mimetype=mime_type, headers=headers)
+    response.set_etag(etag)
+    return response
+
+def static_response(asset):
+    """从内存返回预先压缩的静态文件，客户端已缓存时返回 304"""
+    encoding, body, etag = asset.select(request.accept_encodings)
+    response = not_modified(etag) or Response(body, mimetype=asset.mimetype)
+    response.set_etag(etag)
+    if response.status_code == 200 and encoding != "identity":
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    return response
+
+def conditional_response(response, size):
+    """
+    GET/HEAD 请求的 Range 分段（206）、If-Range、If-None-Match 与 If-Modified-Since；
+    无法满足的 Range 返回 416 前先关闭响应中的文件
+    """
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        raise
+
+def audio_response(buffer, mime_type, response_format, etag):
+    # The scratch buffer is released when the server closes the file after sending it
+    response = send_file(buffer.reader(), mimetype=mime_type, as_attachment=True, download_name=f"speech.{response_format}", etag=etag, conditional=False)
+    response.content_length = buffer.size
+    # GET requests (/tts) can ask for a byte range too
+    return conditional_response(response, buffer.size)
+
+def count_speech_request(endpoint, response_format, voice):
+    """
+    在参数校验通过后计数；未知的格式与语音记为 other，避免客户端输入撑大指标的标签集合。
+    voice 为 None 表示一个请求使用了多种语音（对话）
+    """
+    known_format = isinstance(response_format, str) and response_format in AUDIO_FORMAT_MIME_TYPES
+    speech_requests.inc(endpoint=endpoint, format=response_format if known_format else 'other',
+                        voice='multiple' if voice is None else voice_label(voice))
+
+def set_audio_location(response, etag, response_format):
+    """Content-Location 指向合成结果的稳定地址：缓存中存在期间可反复获取（支持 Range），不会重新合成"""
+    if response_format in AUDIO_FORMAT_MIME_TYPES:
+        response.headers['Content-Location'] = f"/v1/audio/speech/{etag}.{response_format}"
+    return response
+
+def cached_audio_response(cached, mime_type, response_format, etag):
+    download_name = f"speech.{response_format}"
+    if cached.path is not None:
+        # 磁盘缓存按路径发送，USE_X_SENDFILE 开启时只返回 X-Sendfile 头
+        response = send_file(cached.path, mimetype=mime_type, download_name=download_name, etag=etag,
+                             last_modified=cached.modified, max_age=AUDIO_URL_MAX_AGE)
     else:
-        return render_template_string(HOME_TEMPLATE, port=PORT)
+        # 内存缓存与缓存包（mmap）中的音频不复制，直接从原缓冲区按需读取
+        body = wrap_file(request.environ, BufferReader(cached.data))
+        response = Response(body, mimetype=mime_type, direct_passthrough=True)
+        response.headers['Content-Disposition'] = f'inline; filename={download_name}'
+        response.content_length = cached.size
+        response.set_etag(etag)
+        response.last_modified = cached.modified
+        response = conditional_response(response, cached.size)
+    # 需要认证的内容只允许客户端自己缓存
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = AUDIO_URL_MAX_AGE
+    return response
+
+@app.route('/')
+def home():
+    return static_response(HOME_PAGE)
 
 @app.route('/v1/audio/speech', methods=['POST'])
 @require_api_key
@@ -633,48 +239,395 @@ def text_to_speech():
     # model = data.get('model', DEFAULT_MODEL)
     voice = data.get('voice', DEFAULT_VOICE)
 
-    response_format = data.get('response_format', DEFAULT_RESPONSE_FORMAT)
-    speed = float(data.get('speed', DEFAULT_SPEED))
-    
+    try:
+        response_format = parse_response_format(data.get('response_format', DEFAULT_RESPONSE_FORMAT))
+        speed = parse_speed(data.get('speed', DEFAULT_SPEED))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Optional prosody adjustments, e.g. "+5Hz" / "-10%" or plain numbers
+    pitch = data.get('pitch')
+    volume = data.get('volume')
+    # Optional word/sentence timings of the same synthesis, fetched afterwards by id
+    timestamps = data.get('timestamps')
+    if timestamps is not None and not (isinstance(timestamps, str) and timestamps in BOUNDARY_TYPES):
+        return jsonify({"error": f"Unsupported timestamps {timestamps!r}, expected word or sentence"}), 400
+
     mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
 
-    # Generate the audio file in the specified format with speed adjustment
-    output_file_path = generate_speech(text, voice, response_format, speed)
+    try:
+        etag = speech_cache_key(text, voice, response_format, speed, pitch, volume)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    count_speech_request('speech', response_format, voice)
+    timings_id = timestamps_id(etag, timestamps) if timestamps else None
+    cached = not_modified(etag) if timings_id is None or get_timestamps(timings_id) is not None else None
+    if cached:
+        response = cached
+    elif wants_stream(data, response_format):
+        # Forward audio chunks as they arrive instead of waiting for the whole clip
+        response = stream_response(stream_speech(text, voice, response_format, speed, pitch, volume, timestamps), mime_type, response_format, etag)
+    else:
+        # Generate the audio in the specified format with speed adjustment
+        buffer = generate_speech(text, voice, response_format, speed, pitch, volume, timestamps)
 
-    # Return the file with the correct MIME type
-    return send_file(output_file_path, mimetype=mime_type, as_attachment=True, download_name=f"speech.{response_format}")
+        # Return the audio with the correct MIME type
+        response = audio_response(buffer, mime_type, response_format, etag)
+
+    if timings_id:
+        response.headers['X-Timestamps-Id'] = timings_id
+    return set_audio_location(response, etag, response_format)
+
+@app.route('/v1/audio/speech/<key>.<response_format>', methods=['GET'])
+@require_api_key_or_param
+def cached_speech(key, response_format):
+    """
+    按稳定地址获取已合成的音频（合成响应头 Content-Location 的值），只读缓存，不会触发合成
+    - 支持 HEAD、Range 分段请求（206）、If-Range、If-None-Match 与 If-Modified-Since
+    - 除 Authorization 头外也可使用 key 查询参数认证，便于直接作为 <audio> 的地址
+    - 多进程模式下需设置 AUDIO_CACHE_DIR，否则只有合成该音频的 worker 能找到它
+    """
+    mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format)
+    # 缓存条目连同合成时的格式一起保存，扩展名与之不符时不会命中
+    cached = audio_cache.lookup(key, response_format) if mime_type and CACHE_KEY_PATTERN.fullmatch(key) else None
+    if cached is None:
+        message = "Audio not found, it may have been evicted from the cache"
+        if not audio_cache.disk_dir:
+            message += "; without AUDIO_CACHE_DIR audio is only kept in the memory of the worker that synthesized it"
+        return jsonify({"error": message}), 404
+    return cached_audio_response(cached, mime_type, response_format, key)
+
+@app.route('/v1/audio/timestamps/<timings_id>', methods=['GET'])
+@require_api_key
+def speech_timestamps(timings_id):
+    """
+    获取 /v1/audio/speech 请求中 timestamps 对应的逐词/逐句时间戳
+    - timings_id: 合成响应头 X-Timestamps-Id 的值（流式合成结束后可用）
+    - format: json（默认）、srt 或 vtt
+    """
+    timestamp_format = request.args.get('format', 'json')
+    if timestamp_format not in TIMESTAMP_FORMAT_MIME_TYPES:
+        return jsonify({"error": f"Unsupported format '{timestamp_format}', expected json, srt or vtt"}), 400
+    events = get_timestamps(timings_id)
+    if events is None:
+        return jsonify({"error": "Timestamps not found"}), 404
+    return Response(render_timestamps(events, timestamp_format), mimetype=TIMESTAMP_FORMAT_MIME_TYPES[timestamp_format])
+
+@app.route('/v1/audio/speech/batch', methods=['POST'])
+@require_api_key
+def batch_text_to_speech():
+    """
+    批量合成接口
+    请求体：
+    - items: 条目数组，每项包含 input（必需）、voice、response_format、speed、pitch、volume
+    - voice / response_format / speed: 条目未指定时使用的默认值（可选）
+    - output: zip（默认，打包返回）或 ndjson（每完成一条即返回一行，音频为 base64）
+    相同的条目只会合成一次
+    """
+    data = request.json or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing 'items' array in request body"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items, at most {BATCH_MAX_ITEMS} per batch"}), 400
+
+    output = data.get('output', 'zip')
+    if output not in ('zip', 'ndjson'):
+        return jsonify({"error": "'output' must be 'zip' or 'ndjson'"}), 400
+
+    batch = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('input'):
+            return jsonify({"error": f"Missing 'input' in item {index}"}), 400
+        try:
+            entry = {
+                "text": item['input'],
+                "voice": item.get('voice', data.get('voice', DEFAULT_VOICE)),
+                "response_format": parse_response_format(item.get('response_format', data.get('response_format', DEFAULT_RESPONSE_FORMAT))),
+                "speed": parse_speed(item.get('speed', data.get('speed', DEFAULT_SPEED))),
+                "pitch": item.get('pitch'),
+                "volume": item.get('volume'),
+            }
+            speech_cache_key(**entry)
+        except ValueError as e:
+            return jsonify({"error": f"Item {index}: {e}"}), 400
+        batch.append(entry)
+
+    results = generate_batch(batch)
+
+    if output == 'ndjson':
+        def lines():
+            for indices, audio, error in results:
+                for index in indices:
+                    line = {"index": index, "response_format": batch[index]["response_format"]}
+                    if error is not None:
+                        line["error"] = str(error)
+                    else:
+                        line["audio"] = base64.b64encode(audio).decode('ascii')
+                    yield json.dumps(line) + "\n"
+        return Response(lines(), mimetype='application/x-ndjson')
+
+    # 全部完成后打包为 zip，附带 manifest.json 记录每条的文件名或错误
+    buffer = scratch_store.buffer()
+    try:
+        manifest = [None] * len(batch)
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for indices, audio, error in results:
+                for index in indices:
+                    if error is not None:
+                        manifest[index] = {"index": index, "error": str(error)}
+                        continue
+                    name = f"{index:05d}.{batch[index]['response_format']}"
+                    archive.writestr(name, audio)
+                    manifest[index] = {"index": index, "file": name}
+            archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    except BaseException:
+        buffer.close()
+        raise
+    response = send_file(buffer.reader(), mimetype='application/zip', as_attachment=True, download_name="speech.zip")
+    response.content_length = buffer.size
+    return response
+
+@app.route('/v1/audio/dialogue', methods=['POST'])
+@require_api_key
+def dialogue_to_speech():
+    """
+    多角色对话合成接口，各句并发合成后按顺序拼接为一个音频
+    请求体：
+    - lines: 台词数组，每项包含 input（必需）、voice、speed（0.5~2.0）、pitch、volume、pause（该句之后的停顿秒数）
+    - voice: 台词未指定语音时使用的默认值（可选）
+    - response_format: 输出格式，整段对话只编码一次
+    - stream: 是否边合成边按顺序返回（默认除 wav 外均流式）
+    """
+    data = request.json or {}
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        return jsonify({"error": "Missing 'lines' array in request body"}), 400
+    if len(lines) > DIALOGUE_MAX_LINES:
+        return jsonify({"error": f"Too many lines, at most {DIALOGUE_MAX_LINES} per dialogue"}), 400
+
+    script = []
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict) or not line.get('input'):
+            return jsonify({"error": f"Missing 'input' in line {index}"}), 400
+        try:
+            speed = parse_speed(line.get('speed', 1.0))
+        except ValueError as e:
+            return jsonify({"error": f"Line {index}: {e}"}), 400
+        script.append(dict(line, text=line['input'], voice=line.get('voice', data.get('voice', DEFAULT_VOICE)), speed=speed))
+    try:
+        script = prepare_dialogue(script)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        response_format = parse_response_format(data.get('response_format', DEFAULT_RESPONSE_FORMAT))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mime_type = AUDIO_FORMAT_MIME_TYPES[response_format]
+    # 只有一种语音时按该语音计数，多种语音记为 multiple
+    voices = {line['voice'] for line in script}
+    count_speech_request('dialogue', response_format, voices.pop() if len(voices) == 1 else None)
+
+    etag = dialogue_key(script, response_format)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    if wants_stream(data, response_format):
+        return stream_response(stream_dialogue(script, response_format), mime_type, response_format, etag)
+    return audio_response(generate_dialogue(script, response_format), mime_type, response_format, etag)
+
+def job_status(job):
+    total = job['total_segments']
+    return {
+        "id": job['id'],
+        "status": job['status'],
+        "response_format": job['response_format'],
+        "completed_segments": job['completed_segments'],
+        "total_segments": total,
+        "progress": round(job['completed_segments'] / total, 4) if total else 1.0,
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+    }
+
+@app.route('/v1/audio/jobs', methods=['POST'])
+@require_api_key
+def create_job():
+    """
+    异步合成任务，适合整本书等耗时较长的文本
+    请求体参数与 /v1/audio/speech 相同，立即返回任务 id，
+    通过 GET /v1/audio/jobs/<id> 查询进度，完成后从 GET /v1/audio/jobs/<id>/content 下载
+    """
+    data = request.json
+    if not data or 'input' not in data:
+        return jsonify({"error": "Missing 'input' in request body"}), 400
+
+    try:
+        job_id = submit_job(
+            data['input'],
+            data.get('voice', DEFAULT_VOICE),
+            parse_response_format(data.get('response_format', DEFAULT_RESPONSE_FORMAT)),
+            parse_speed(data.get('speed', DEFAULT_SPEED)),
+            data.get('pitch'),
+            data.get('volume'),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(job_status(get_job(job_id))), 202
+
+@app.route('/v1/audio/jobs/<job_id>', methods=['GET'])
+@require_api_key
+def show_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job))
+
+@app.route('/v1/audio/jobs/<job_id>/content', methods=['GET'])
+@require_api_key
+def job_content(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'completed':
+        return jsonify({"error": f"Job is {job['status']}", "status": job['status']}), 409
+    response_format = job['response_format']
+    mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
+    return send_file(job['result_path'], mimetype=mime_type, as_attachment=True, download_name=f"speech.{response_format}")
+
+@app.route('/v1/audio/jobs/<job_id>', methods=['DELETE'])
+@require_api_key
+def remove_job(job_id):
+    """删除已完成或已失败的任务及其音频文件，进行中的任务返回 409"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not delete_job(job_id):
+        return jsonify({"error": f"Job is {job['status']}", "status": job['status']}), 409
+    return '', 204
 
 @app.route('/v1/models', methods=['GET', 'POST'])
 @require_api_key
 def list_models():
     return jsonify({"data": get_models()})
 
+def parse_count(data, name, default=None):
+    """非负整数参数（offset、limit），无效时抛出 ValueError"""
+    value = data.get(name)
+    if value is None:
+        return default
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a non-negative integer")
+    if count < 0:
+        raise ValueError(f"'{name}' must be a non-negative integer")
+    return count
+
+def voice_query(data):
+    """Filtering, pagination and projection options shared by the voice endpoints; raises ValueError for bad paging."""
+    fields = data.get('fields')
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    return {
+        "gender": data.get('gender'),
+        "offset": parse_count(data, 'offset', 0),
+        "limit": parse_count(data, 'limit'),
+        "fields": fields,
+    }
+
 @app.route('/v1/voices', methods=['GET', 'POST'])
 @require_api_key
 def list_voices():
     specific_language = None
 
-    data = request.args if request.method == 'GET' else request.json
+    data = (request.args if request.method == 'GET' else request.json) or {}
     if data and ('language' in data or 'locale' in data):
         specific_language = data.get('language') if 'language' in data else data.get('locale')
 
-    return jsonify({"voices": get_voices(specific_language)})
+    try:
+        query = voice_query(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    total, voices = get_voices(specific_language, **query)
+    return jsonify({"voices": voices, "total": total})
 
 @app.route('/v1/voices/all', methods=['GET', 'POST'])
 @require_api_key
 def list_all_voices():
-    return jsonify({"voices": get_voices('all')})
+    data = (request.args if request.method == 'GET' else request.json) or {}
+    try:
+        query = voice_query(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    total, voices = get_voices('all', **query)
+    return jsonify({"voices": voices, "total": total})
+
+@app.route('/v1/stats', methods=['GET'])
+@require_api_key
+def service_stats():
+    """缓存命中/淘汰、语音列表与临时存储占用等运行统计"""
+    return jsonify({
+        "cache": audio_cache.stats(),
+        "voices": voice_catalog.stats(),
+        "scratch": scratch_store.usage(),
+        "admission": {"upstream": upstream_limiter.stats(), "transcode": transcode_limiter.stats()},
+        "transcoder": transcoder_backend.stats(),
+        "upstream": upstream_client.stats(),
+        "inflight": inflight.stats(),
+        "timestamps": timestamp_store.stats(),
+        "resilience": upstream_resilience.stats(),
+        "profiler": profiler.stats(),
+    })
+
+@app.route('/v1/admin/profile', methods=['GET'])
+@require_api_key
+def profile_process():
+    """
+    对当前进程的实时流量采样分析，返回火焰图工具（flamegraph.pl、speedscope 等）可读的折叠栈文本
+    - seconds: 采样时长（默认 10，最多 300）
+    - interval: 采样间隔，单位毫秒（默认 10）
+    同一时间只能进行一次采样；多进程模式下只分析处理该请求的 worker
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', 10)) / 1000
+    except ValueError:
+        return jsonify({"error": "'seconds' and 'interval' must be numbers"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.001 <= interval <= 1:
+        return jsonify({"error": f"'seconds' must be in (0, {PROFILE_MAX_SECONDS}] and 'interval' in [1, 1000] ms"}), 400
+
+    try:
+        # 在 gevent 线程池的原生线程中采样，本请求只是等待，其他请求照常处理
+        stacks, samples = get_hub().threadpool.spawn(profiler.profile, seconds, interval).get()
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    response = Response(render_collapsed(stacks), mimetype='text/plain')
+    response.headers['Content-Disposition'] = 'attachment; filename=profile.folded'
+    response.headers['X-Profile-Samples'] = str(samples)
+    return response
+
+# 现有统计在抓取 /metrics 时才读取
+registry.add_collector(stats_collector('tts_cache', {"audio": audio_cache.stats}))
+registry.add_collector(stats_collector('tts_admission', {"upstream": upstream_limiter.stats, "transcode": transcode_limiter.stats}))
+registry.add_collector(stats_collector('tts_scratch', {"scratch": scratch_store.usage}))
+registry.add_collector(stats_collector('tts_transcoder', {transcoder_backend.name: transcoder_backend.stats}))
+registry.add_collector(stats_collector('tts_upstream', {"websocket": upstream_client.stats}))
+registry.add_collector(stats_collector('tts_singleflight', {"synthesis": inflight.stats}))
+registry.add_collector(stats_collector('tts_timestamps', {"memory": timestamp_store.stats}))
+registry.add_collector(stats_collector('tts_resilience', {"upstream": upstream_resilience.stats}))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 文本格式的指标：各阶段耗时直方图、请求数、发送字节数、上游错误等"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/voices/chinese', methods=['GET'])
 def list_chinese_voices():
     """获取中文语音列表，无需密钥验证，供前端使用"""
     try:
-        # 获取所有中文语音（包括简体中文和繁体中文）
-        all_voices = get_voices('all')
-        chinese_voices = [
-            v for v in all_voices 
-            if v['language'].startswith('zh')
-        ]
+        # 按语言前缀索引直接取出所有中文语音（包括简体中文和繁体中文）
+        _, chinese_voices = get_voices('zh')
         return jsonify({"voices": chinese_voices})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -688,7 +641,10 @@ def simple_tts():
     - voice: 说话人（可选，默认使用DEFAULT_VOICE）
     - key: 密钥（必需）
     - format: 音频格式（可选，默认mp3）
-    - speed: 语速（可选，默认1.0）
+    - speed: 语速（可选，0.25~4.0，默认1.0）
+    - pitch: 音调（可选，如 +5Hz 或 -5）
+    - volume: 音量（可选，如 +10% 或 -10）
+    - stream: 是否流式返回（可选，wav以外的格式默认开启）
     """
     # 从GET参数或POST参数中获取数据
     if request.method == 'GET':
@@ -712,17 +668,41 @@ def simple_tts():
     
     # 获取可选参数
     voice = data.get('voice', DEFAULT_VOICE)
-    response_format = data.get('format') or data.get('response_format', DEFAULT_RESPONSE_FORMAT)
-    speed = float(data.get('speed', DEFAULT_SPEED))
+    try:
+        response_format = parse_response_format(data.get('format') or data.get('response_format', DEFAULT_RESPONSE_FORMAT))
+        speed = parse_speed(data.get('speed', DEFAULT_SPEED))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    pitch = data.get('pitch')
+    volume = data.get('volume')
     
     mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
+
+    # 客户端已缓存相同请求的音频时直接返回 304
+    try:
+        etag = speech_cache_key(text, voice, response_format, speed, pitch, volume)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    count_speech_request('tts', response_format, voice)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
     try:
-        # 生成语音
-        output_file_path = generate_speech(text, voice, response_format, speed)
-        
-        # 返回音频文件
-        return send_file(output_file_path, mimetype=mime_type, as_attachment=True, download_name=f"speech.{response_format}")
+        # 流式返回，收到第一段音频即开始发送
+        if wants_stream(data, response_format):
+            response = stream_response(stream_speech(text, voice, response_format, speed, pitch, volume), mime_type, response_format, etag)
+        else:
+            # 生成语音
+            buffer = generate_speech(text, voice, response_format, speed, pitch, volume)
+
+            # 返回音频文件
+            response = audio_response(buffer, mime_type, response_format, etag)
+        # 之后可按稳定地址重复获取，不再合成
+        return set_audio_location(response, etag, response_format)
+    except (AdmissionRejected, UpstreamUnavailable, HTTPException) + RETRYABLE_ERRORS:
+        # 由各自的错误处理返回（如 Range 无法满足时的 416）
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to generate speech: {str(e)}"}), 500
 
@@ -737,12 +717,25 @@ print(f" ")
 def open_browser():
     """延迟打开浏览器，等待服务器启动"""
     time.sleep(1.5)  # 等待服务器完全启动
+    import webbrowser
     url = f"http://localhost:{PORT}"
     webbrowser.open(url)
     print(f" * Browser opened at {url}")
 
 if __name__ == '__main__':
-    http_server = WSGIServer(('0.0.0.0', PORT), app)
+    if PREFORK:
+        # 多进程模式：各 worker 共享监听端口与磁盘缓存，崩溃自动重启，SIGHUP 平滑重载；不自动打开浏览器
+        PreforkServer(app, ('0.0.0.0', PORT), WORKERS, reuse_port=REUSE_PORT, graceful_timeout=GRACEFUL_TIMEOUT,
+                      on_worker_start=lambda slot: start_background_tasks(prewarm=slot == 0), listener=LISTENER).run()
+        raise SystemExit(0)
+    if WORKERS > 1:
+        print(" * WORKERS > 1 requires fork(), which this platform lacks; serving with a single process")
+
+    # 提前绑定的是标准库套接字，交给 gevent 前转换为协作式套接字
+    http_server = WSGIServer(gevent_socket.socket(fileno=LISTENER.detach()), app)
+
+    # 预先加载语音列表（优先读取本地快照），并启动临时文件清理任务
+    start_background_tasks()
     
     # 在后台线程中打开浏览器
     browser_thread = threading.Thread(target=open_browser, daemon=True)
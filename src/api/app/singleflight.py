@@ -0,0 +1,85 @@
+# singleflight.py
+
+import asyncio
+
+class _Flight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.consumers = 0
+        self.task = None
+        self._waiters = []
+
+    def notify(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight syntheses, used only on the engine loop.
+
+    The first request for a key starts one producer task; it and every
+    concurrent duplicate replay the chunks produced so far and then follow
+    the producer live, so followers of a streaming request are streamed
+    too. The producer runs as long as anybody is still consuming and is
+    cancelled once the last consumer goes away.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.counters = {"leaders": 0, "followers": 0, "cancelled": 0}
+
+    async def _produce(self, key, flight, source):
+        try:
+            async for chunk in source:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+    async def join(self, key, factory):
+        """Yield the output for `key`, starting `factory()` only if nobody is producing it yet."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(self._produce(key, flight, factory()))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["followers"] += 1
+
+        flight.consumers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.consumers -= 1
+            if flight.consumers == 0 and not flight.done:
+                # Nobody is listening any more; a new request starts afresh
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+                self.counters["cancelled"] += 1
+
+    def stats(self):
+        return dict(self.counters, in_flight=len(self._flights))
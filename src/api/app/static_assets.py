@@ -0,0 +1,47 @@
+# static_assets.py
+
+import gzip
+import hashlib
+
+# Smaller variants than this are not worth a Content-Encoding
+MIN_SAVINGS = 0.1
+
+def _brotli_compress(body):
+    # Optional: pip install brotli
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(body, quality=11)
+
+class StaticAsset:
+    """
+    A file served from memory. The body is read once, compressed once with
+    gzip (and brotli when the `brotli` package is installed), and every
+    encoding gets its own strong ETag so repeat visits can be answered with
+    a 304 without touching the disk.
+    """
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {"identity": (body, digest)}
+        for encoding, compressed in (("br", _brotli_compress(body)), ("gzip", gzip.compress(body, 9, mtime=0))):
+            if compressed is not None and len(compressed) <= len(body) * (1 - MIN_SAVINGS):
+                self.encodings[encoding] = (compressed, f"{digest}-{encoding}")
+
+    @classmethod
+    def from_file(cls, path, mimetype):
+        with open(path, 'rb') as f:
+            return cls(f.read(), mimetype)
+
+    def select(self, accept_encodings):
+        """
+        Return (encoding, body, etag) for the best encoding the client
+        accepts; `accept_encodings` is werkzeug's parsed Accept-Encoding.
+        """
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and accept_encodings.quality(encoding) > 0:
+                return (encoding,) + self.encodings[encoding]
+        return ("identity",) + self.encodings["identity"]
+
@@ -0,0 +1,149 @@
+# timestamps.py
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from edge_tts.constants import TICKS_PER_SECOND
+
+# Boundary granularities a client can ask for, and the upstream event type of each
+BOUNDARY_TYPES = {"word": "WordBoundary", "sentence": "SentenceBoundary"}
+
+# Sidecar formats and their MIME types
+TIMESTAMP_FORMAT_MIME_TYPES = {
+    "json": "application/json",
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt",
+}
+
+def timestamps_id(key, granularity):
+    """Id of the timings for the synthesis with cache key `key`."""
+    return f"{key}-{granularity}"
+
+def shift(events, ticks):
+    return [dict(event, offset=event["offset"] + ticks) for event in events]
+
+def scale(events, speed):
+    """Timings after ffmpeg changed the playback speed by `speed`."""
+    return [dict(event, offset=int(event["offset"] / speed), duration=int(event["duration"] / speed)) for event in events]
+
+def _cues(events):
+    for event in events:
+        start = event["offset"] / TICKS_PER_SECOND
+        yield start, start + event["duration"] / TICKS_PER_SECOND, event["text"]
+
+def _clock(seconds, separator):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def render(events, timestamp_format):
+    """Render boundary events (offsets in 100ns ticks) as json, srt or vtt."""
+    if timestamp_format == "srt":
+        return "".join(f"{number}\n{_clock(start, ',')} --> {_clock(end, ',')}\n{text}\n\n"
+                       for number, (start, end, text) in enumerate(_cues(events), start=1))
+    if timestamp_format == "vtt":
+        return "WEBVTT\n\n" + "".join(f"{_clock(start, '.')} --> {_clock(end, '.')}\n{text}\n\n"
+                                      for start, end, text in _cues(events))
+    return json.dumps([{"text": text, "start": round(start, 3), "end": round(end, 3)}
+                       for start, end, text in _cues(events)], ensure_ascii=False)
+
+# A shared directory is pruned back to max_entries files after this many puts
+PRUNE_INTERVAL = 64
+
+class TimestampStore:
+    """
+    LRU of boundary events by timestamps id, bounded by entry count.
+
+    With a `directory`, events are also written there as one JSON file per
+    id, so worker processes sharing the directory can serve timings that
+    another worker synthesized. The directory keeps the `max_entries` most
+    recently written files.
+    """
+
+    def __init__(self, max_entries, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory or None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._puts = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            events = self._entries.get(key)
+            if events is not None:
+                self._entries.move_to_end(key)
+                return events
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                events = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._remember(key, events)
+        return events
+
+    def put(self, key, events):
+        if self.max_entries <= 0:
+            return
+        self._remember(key, events)
+        if self.directory:
+            self._write(key, events)
+
+    def _remember(self, key, events):
+        with self._lock:
+            self._entries[key] = events
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _write(self, key, events):
+        # Write to a hidden temp file first so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(events, f, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Remove the oldest files until the directory holds max_entries; returns how many."""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        removed = 0
+        for _, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "directory": self.directory}
@@ -0,0 +1,381 @@
+# transcoder.py
+
+import asyncio
+import math
+import queue
+import struct
+from collections import deque
+
+# Size of each read from ffmpeg's stdout
+READ_CHUNK_SIZE = 64 * 1024
+
+# ffmpeg output options for each response format; every muxer here can be
+# written to a non-seekable pipe
+FFMPEG_OUTPUT_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-f", "adts"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+    "wav": ["-c:a", "pcm_s16le", "-f", "wav"],
+    "pcm": ["-c:a", "pcm_s16le", "-f", "s16le", "-ac", "1", "-ar", "24000"],
+}
+
+def atempo_filter(speed):
+    # A single atempo instance only accepts factors between 0.5 and 2.0
+    if not (math.isfinite(speed) and speed > 0):
+        raise ValueError(f"Speed must be a positive number, got {speed!r}")
+    factors = []
+    while speed > 2.0:
+        factors.append(2.0)
+        speed /= 2.0
+    while speed < 0.5:
+        factors.append(0.5)
+        speed /= 0.5
+    factors.append(speed)
+    return ",".join(f"atempo={factor:g}" for factor in factors)
+
+def ffmpeg_command(response_format, speed=1.0, input_format="mp3"):
+    # Only known formats, so a client cannot pick arbitrary muxers or grow the pool
+    if response_format not in FFMPEG_OUTPUT_ARGS:
+        raise ValueError(f"Unsupported response format {response_format!r}")
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", input_format, "-i", "pipe:0"]
+    if speed != 1.0:
+        command += ["-filter:a", atempo_filter(speed)]
+    command += FFMPEG_OUTPUT_ARGS[response_format]
+    command.append("pipe:1")
+    return command
+
+async def _spawn(command):
+    return await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+async def _pipe(process, chunks):
+    # Feed chunks to ffmpeg's stdin while yielding what it writes to stdout
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg exited early; its return code explains why
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            data = await process.stdout.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+        # Surface upstream synthesis errors before ffmpeg's own
+        await feeder
+        if await process.wait() != 0:
+            stderr = (await process.stderr.read()).decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"Error in audio conversion: {stderr}")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+async def transcode(chunks, response_format, speed=1.0):
+    """
+    Pipe mp3 chunks from an async iterator through ffmpeg and yield the
+    converted output as soon as ffmpeg produces it.
+    """
+    process = await _spawn(ffmpeg_command(response_format, speed))
+    async for data in _pipe(process, chunks):
+        yield data
+
+class FfmpegBackend:
+    """One new ffmpeg process per conversion."""
+
+    name = "ffmpeg"
+
+    async def prewarm(self):
+        pass
+
+    def transcode(self, chunks, response_format, speed=1.0):
+        return transcode(chunks, response_format, speed)
+
+    def stats(self):
+        return {"backend": self.name}
+
+class FfmpegPoolBackend:
+    """
+    Keeps ffmpeg processes spawned ahead of time so a conversion does not
+    wait for fork/exec and program start-up.
+
+    ffmpeg converts exactly one stream per process, so a process is used
+    once and a replacement is spawned in the background right away. Up to
+    `size` idle processes are kept for every command seen at normal speed
+    (and for `warm_formats` from the start); commands with an atempo filter
+    are rare enough to be spawned on demand.
+    """
+
+    name = "ffmpeg-pool"
+
+    def __init__(self, size=2, warm_formats=()):
+        self.size = size
+        self.warm_formats = tuple(warm_formats)
+        self._idle = {}
+        self._spawning = {}
+        self.counters = {"warm_hits": 0, "cold_spawns": 0, "spawned": 0}
+
+    def _take(self, command):
+        idle = self._idle.get(command)
+        while idle:
+            process = idle.popleft()
+            if process.returncode is None:
+                return process
+        return None
+
+    def _replenish(self, command):
+        missing = self.size - len(self._idle.get(command, ())) - self._spawning.get(command, 0)
+        for _ in range(max(missing, 0)):
+            self._spawning[command] = self._spawning.get(command, 0) + 1
+            asyncio.ensure_future(self._spawn_idle(command))
+
+    async def _spawn_idle(self, command):
+        try:
+            process = await _spawn(command)
+            self.counters["spawned"] += 1
+            self._idle.setdefault(command, deque()).append(process)
+        finally:
+            self._spawning[command] -= 1
+
+    async def prewarm(self):
+        """Fill the pool for `warm_formats` on the event loop that runs conversions."""
+        for response_format in self.warm_formats:
+            self._replenish(tuple(ffmpeg_command(response_format)))
+
+    async def transcode(self, chunks, response_format, speed=1.0):
+        command = tuple(ffmpeg_command(response_format, speed))
+        process = self._take(command)
+        if process is not None:
+            self.counters["warm_hits"] += 1
+        else:
+            self.counters["cold_spawns"] += 1
+            process = await _spawn(command)
+        if speed == 1.0:
+            self._replenish(command)
+        async for data in _pipe(process, chunks):
+            yield data
+
+    def stats(self):
+        return dict(self.counters, backend=self.name, size=self.size,
+                    idle=sum(len(idle) for idle in self._idle.values()))
+
+# Encoder and container for each response format with PyAV, mirroring FFMPEG_OUTPUT_ARGS
+PYAV_OUTPUTS = {
+    "mp3": ("libmp3lame", "mp3"),
+    "opus": ("libopus", "ogg"),
+    "aac": ("aac", "adts"),
+    "flac": ("flac", "flac"),
+    "wav": ("pcm_s16le", "wav"),
+    "pcm": ("pcm_s16le", "s16le"),
+}
+
+class _ChunkReader:
+    """Blocking file-like view of chunks handed over from the event loop."""
+
+    def __init__(self):
+        self._chunks = queue.Queue()
+        self._buffer = b""
+        self._eof = False
+
+    def put(self, chunk):
+        self._chunks.put(chunk)
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+            if self._buffer and size >= 0:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+class _LoopWriter:
+    """Write-only file-like object passing muxed output back to the event loop."""
+
+    def __init__(self, loop, output):
+        self._loop = loop
+        self._output = output
+        self.cancelled = False
+
+    def write(self, data):
+        if self.cancelled:
+            raise RuntimeError("Conversion cancelled")
+        self._loop.call_soon_threadsafe(self._output.put_nowait, bytes(data))
+        return len(data)
+
+class PyAVBackend:
+    """
+    Decodes and encodes in-process with PyAV (libav bindings), so no process
+    is spawned at all. Each conversion runs on a worker thread that reads
+    the mp3 chunks as they arrive.
+    """
+
+    name = "pyav"
+
+    def __init__(self):
+        try:
+            import av
+        except ImportError:
+            raise RuntimeError("TRANSCODER_BACKEND=pyav requires PyAV: pip install av")
+        self.av = av
+        self.counters = {"conversions": 0}
+
+    async def prewarm(self):
+        pass
+
+    def _convert(self, reader, writer, response_format, speed):
+        av = self.av
+        codec_name, container_format = PYAV_OUTPUTS[response_format]
+        with av.open(reader, mode='r', format='mp3') as source, \
+                av.open(writer, mode='w', format=container_format) as target:
+            audio = source.streams.audio[0]
+            stream = target.add_stream(codec_name, rate=24000, layout='mono')
+            resampler = av.AudioResampler(format=stream.codec_context.codec.audio_formats[0].name,
+                                          layout='mono', rate=24000)
+
+            graph = None
+            if speed != 1.0:
+                graph = av.filter.Graph()
+                node = graph.add_abuffer(template=audio)
+                for factor in atempo_filter(speed).split(','):
+                    filter_node = graph.add('atempo', factor.split('=', 1)[1])
+                    node.link_to(filter_node)
+                    node = filter_node
+                node.link_to(graph.add('abuffersink'))
+                graph.configure()
+
+            def filtered(frame):
+                if graph is None:
+                    if frame is not None:
+                        yield frame
+                    return
+                graph.push(frame)
+                while True:
+                    try:
+                        yield graph.pull()
+                    except (av.error.BlockingIOError, av.error.EOFError):
+                        return
+
+            def encode(frame):
+                for resampled in resampler.resample(frame):
+                    target.mux(stream.encode(resampled))
+
+            for frame in source.decode(audio):
+                frame.pts = None
+                for out in filtered(frame):
+                    encode(out)
+            for out in filtered(None):
+                encode(out)
+            encode(None)
+            target.mux(stream.encode(None))
+
+    async def transcode(self, chunks, response_format, speed=1.0):
+        if response_format not in PYAV_OUTPUTS:
+            raise ValueError(f"Unsupported response format {response_format!r}")
+        loop = asyncio.get_running_loop()
+        output = asyncio.Queue()
+        reader = _ChunkReader()
+        writer = _LoopWriter(loop, output)
+        self.counters["conversions"] += 1
+
+        def run():
+            try:
+                self._convert(reader, writer, response_format, speed)
+            finally:
+                loop.call_soon_threadsafe(output.put_nowait, None)
+
+        async def feed():
+            try:
+                async for chunk in chunks:
+                    reader.put(chunk)
+            finally:
+                reader.put(None)
+
+        feeder = asyncio.ensure_future(feed())
+        worker = loop.run_in_executor(None, run)
+        try:
+            while True:
+                data = await output.get()
+                if data is None:
+                    break
+                yield data
+
+            # Surface upstream synthesis errors before the codec's own
+            await feeder
+            try:
+                await worker
+            except Exception as e:
+                raise RuntimeError(f"Error in audio conversion: {e}")
+        finally:
+            writer.cancelled = True
+            if not feeder.done():
+                feeder.cancel()
+                reader.put(None)
+
+    def stats(self):
+        return dict(self.counters, backend=self.name)
+
+def create_backend(name, pool_size=2, warm_formats=()):
+    """Transcoder backend selected by TRANSCODER_BACKEND."""
+    if name == "ffmpeg":
+        return FfmpegBackend()
+    if name == "ffmpeg-pool":
+        return FfmpegPoolBackend(pool_size, warm_formats)
+    if name == "pyav":
+        return PyAVBackend()
+    raise ValueError(f"Unknown transcoder backend '{name}', expected ffmpeg, ffmpeg-pool or pyav")
+
+# Enough of the file to reach the data chunk of any wav ffmpeg writes
+WAV_HEADER_SCAN_SIZE = 4096
+
+def fix_wav_header(header, total_size):
+    """
+    Fill in the RIFF and data chunk sizes that ffmpeg leaves unset when it
+    writes wav to a pipe. `header` is the start of the file and `total_size`
+    its full length; returns the patched header, same length as given.
+    """
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return header
+    position = 12
+    while position + 8 <= len(header):
+        chunk_id = header[position:position + 4]
+        if chunk_id == b"data":
+            patched = bytearray(header)
+            struct.pack_into("<I", patched, 4, total_size - 8)
+            struct.pack_into("<I", patched, position + 4, total_size - position - 8)
+            return bytes(patched)
+        (chunk_size,) = struct.unpack_from("<I", header, position + 4)
+        position += 8 + chunk_size + (chunk_size & 1)
+    return header
+
+def wav_header(sample_rate=24000, channels=1, bits_per_sample=16):
+    """
+    Header for raw PCM streamed as wav. Sizes are unknown while streaming,
+    so they are set to the maximum like ffmpeg does for pipes; a buffered
+    response gets the real sizes from fix_wav_header.
+    """
+    block_align = channels * bits_per_sample // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                    sample_rate * block_align, block_align, bits_per_sample)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
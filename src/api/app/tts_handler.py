@@ -1,14 +1,119 @@
 # tts_handler.py
 
 import edge_tts
+from edge_tts.constants import TICKS_PER_SECOND
 import asyncio
+import hashlib
+import json
+import math
 import tempfile
-import subprocess
 import os
+import time
+from dotenv import load_dotenv
+
+from admission import FairLimiter
+from audio_cache import TIMESTAMPS_DIR_NAME, AudioCache, CacheBundle, make_key
+from engine import engine
+from jobs import JobManager, JobStore
+from metrics import mark_timing, record_timing, stage_seconds, synthesis_seconds, upstream_errors
+from resilience import Resilience
+from scratch import ScratchStore
+from segmenter import split_text
+from singleflight import SingleFlight
+from timestamps import BOUNDARY_TYPES, TimestampStore, scale, shift, timestamps_id
+from transcoder import create_backend, fix_wav_header, wav_header, WAV_HEADER_SCAN_SIZE
+from upstream import FormatRefused, UpstreamClient, fits_one_turn, mp3_silence, BYTES_PER_SECOND, MP3, RAW_PCM, OGG_OPUS
+from voice_catalog import VoiceCatalog
+
+load_dotenv()
 
 # Language default (environment variable)
 DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'en-US')
 
+# Alternative upstream endpoints, e.g. the stand-in server in benchmarks/fake_upstream.py.
+# edge-tts appends its own query parameters, so both URLs must already contain a '?'
+EDGE_TTS_WSS_URL = os.getenv('EDGE_TTS_WSS_URL', '')
+EDGE_TTS_VOICE_LIST_URL = os.getenv('EDGE_TTS_VOICE_LIST_URL', '')
+if EDGE_TTS_WSS_URL:
+    edge_tts.communicate.WSS_URL = EDGE_TTS_WSS_URL
+if EDGE_TTS_VOICE_LIST_URL:
+    edge_tts.voices.VOICE_LIST = EDGE_TTS_VOICE_LIST_URL
+
+# Synthesized audio cache: in-memory LRU plus an optional disk tier
+audio_cache = AudioCache(
+    memory_limit=int(float(os.getenv('AUDIO_CACHE_MEMORY_MB', 64)) * 1024 * 1024),
+    disk_dir=os.getenv('AUDIO_CACHE_DIR', ''),
+    disk_limit=int(float(os.getenv('AUDIO_CACHE_DISK_MB', 1024)) * 1024 * 1024),
+)
+
+# Read-only bundles of pre-synthesized phrases written by prewarm.py,
+# memory-mapped so they are served without calling the service
+for bundle_path in filter(None, (path.strip() for path in os.getenv('CACHE_BUNDLE', '').split(','))):
+    audio_cache.add_bundle(CacheBundle(bundle_path))
+
+# Manifest of phrases to synthesize into the cache in the background at start-up
+PREWARM_MANIFEST = os.getenv('PREWARM_MANIFEST', '')
+
+# Word/sentence timings captured from the synthesis stream, fetched by id;
+# kept next to the disk cache so every worker sharing it can serve them
+timestamp_store = TimestampStore(
+    int(os.getenv('TIMESTAMPS_CACHE_SIZE', 1024)),
+    directory=os.path.join(audio_cache.disk_dir, TIMESTAMPS_DIR_NAME) if audio_cache.disk_dir else None,
+)
+
+# Scratch space for generated outputs: small ones stay in memory, large ones spill to disk
+scratch_store = ScratchStore(
+    directory=os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'edge-tts-scratch')),
+    memory_threshold=int(float(os.getenv('SCRATCH_MEMORY_MB', 8)) * 1024 * 1024),
+    quota=int(float(os.getenv('SCRATCH_QUOTA_MB', 1024)) * 1024 * 1024),
+    max_age=float(os.getenv('SCRATCH_MAX_AGE', 3600)),
+)
+SCRATCH_JANITOR_INTERVAL = float(os.getenv('SCRATCH_JANITOR_INTERVAL', 300))
+
+# Long inputs are split into segments that are synthesized concurrently
+SEGMENT_MAX_CHARS = int(os.getenv('SEGMENT_MAX_CHARS', 600))
+SEGMENT_PARALLELISM = int(os.getenv('SEGMENT_PARALLELISM', 4))
+
+# Admission control: separate limits for upstream websocket sessions and
+# ffmpeg processes, each with a bounded queue of waiting requests
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 256))
+upstream_limiter = FairLimiter('upstream', int(os.getenv('UPSTREAM_CONCURRENCY', 32)), ADMISSION_QUEUE_SIZE)
+transcode_limiter = FairLimiter('transcode', int(os.getenv('TRANSCODE_CONCURRENCY', os.cpu_count() or 4)), ADMISSION_QUEUE_SIZE)
+
+# How conversions run: a new ffmpeg process each time, a pool of pre-spawned
+# ffmpeg processes, or in-process with PyAV
+transcoder_backend = create_backend(
+    os.getenv('TRANSCODER_BACKEND', 'ffmpeg'),
+    pool_size=int(os.getenv('TRANSCODER_POOL_SIZE', 2)),
+    warm_formats=[f for f in os.getenv('TRANSCODER_WARM_FORMATS', '').split(',') if f],
+)
+
+# Unique items of one batch request synthesized at the same time
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+
+# Lines of a dialogue synthesized at the same time, and the longest pause
+# allowed after a line (seconds)
+DIALOGUE_PARALLELISM = int(os.getenv('DIALOGUE_PARALLELISM', 4))
+DIALOGUE_MAX_PAUSE = 30
+
+async def _fetch_voices():
+    started = time.perf_counter()
+    try:
+        return await edge_tts.list_voices()
+    except Exception as e:
+        upstream_errors.inc(operation='voices', error=type(e).__name__)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage='voice_list_fetch')
+
+# Voice list loaded once, refreshed in the background and snapshotted to disk
+voice_catalog = VoiceCatalog(
+    engine,
+    fetch=_fetch_voices,
+    ttl=float(os.getenv('VOICE_CATALOG_TTL', 6 * 3600)),
+    snapshot_path=os.getenv('VOICE_CATALOG_SNAPSHOT', os.path.join(tempfile.gettempdir(), 'edge-tts-voices.json')),
+)
+
 # OpenAI voice names mapped to edge-tts equivalents
 voice_mapping = {
     'alloy': 'en-US-AvaNeural',
@@ -19,40 +124,591 @@ voice_mapping = {
     'shimmer': 'en-US-EmmaNeural'
 }
 
-async def _generate_audio(text, voice, response_format, speed):
-    # Determine if the voice is an OpenAI-compatible voice or a direct edge-tts voice
+# Speed range edge-tts can apply natively through the SSML prosody rate
+NATIVE_SPEED_MIN = 0.5
+NATIVE_SPEED_MAX = 2.0
+
+def _signed(value, unit):
+    """Format a prosody adjustment for edge-tts: 5 -> '+5Hz', '-10%' stays '-10%'."""
+    if value is None or value == "":
+        return f"+0{unit}"
+    text = str(value).strip()
+    if text.endswith(unit):
+        text = text[:-len(unit)]
+    try:
+        number = int(round(float(text)))
+    except ValueError:
+        raise ValueError(f"Invalid prosody value '{value}', expected a number of {unit}")
+    return f"{number:+d}{unit}"
+
+def normalize_pitch(pitch):
+    return _signed(pitch, "Hz")
+
+def normalize_volume(volume):
+    return _signed(volume, "%")
+
+def split_speed(speed):
+    """
+    Split a playback speed into the edge-tts prosody rate and the factor
+    ffmpeg still has to apply (1.0 whenever the speed is in native range).
+    Raises ValueError for a speed that is not a positive finite number.
+    """
+    if not (math.isfinite(speed) and speed > 0):
+        raise ValueError(f"Speed must be a positive number, got {speed!r}")
+    native_speed = min(max(speed, NATIVE_SPEED_MIN), NATIVE_SPEED_MAX)
+    rate_percent = int(round((native_speed - 1.0) * 100))
+    residual = speed / (1.0 + rate_percent / 100)
+    if abs(residual - 1.0) < 0.005:
+        residual = 1.0
+    return f"{rate_percent:+d}%", residual
+
+# Websocket client that can ask the service for formats other than mp3; it
+# shares one session and keeps idle websockets for reuse across syntheses
+upstream_client = UpstreamClient(
+    pool_size=int(os.getenv('UPSTREAM_POOL_SIZE', 8)),
+    idle_timeout=float(os.getenv('UPSTREAM_IDLE_TIMEOUT', 30)),
+    dns_ttl=int(os.getenv('UPSTREAM_DNS_TTL', 300)),
+)
+
+# Per-attempt and stall timeouts, jittered retries, optional hedging (seconds
+# or 'auto' for the recent p95 first-byte time) and a circuit breaker
+UPSTREAM_HEDGE_DELAY = os.getenv('UPSTREAM_HEDGE_DELAY', '')
+if UPSTREAM_HEDGE_DELAY not in ('', 'auto'):
+    UPSTREAM_HEDGE_DELAY = float(UPSTREAM_HEDGE_DELAY)
+upstream_resilience = Resilience(
+    attempt_timeout=float(os.getenv('UPSTREAM_ATTEMPT_TIMEOUT', 10)),
+    stall_timeout=float(os.getenv('UPSTREAM_STALL_TIMEOUT', 10)),
+    retries=int(os.getenv('UPSTREAM_RETRIES', 2)),
+    backoff=float(os.getenv('UPSTREAM_RETRY_BACKOFF', 0.25)),
+    hedge_delay=UPSTREAM_HEDGE_DELAY or None,
+    breaker_threshold=int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5)),
+    breaker_cooldown=float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', 30)),
+    limiter=upstream_limiter,
+)
+
+async def _stream_audio(text, voice, rate="+0%", pitch="+0Hz", volume="+0%", output_format=MP3,
+                        boundary="SentenceBoundary", events=None):
+    # Forward audio chunks from the service as soon as they arrive; boundary
+    # events go to `events` when the caller wants them
     edge_tts_voice = voice_mapping.get(voice, voice)  # Use mapping if in OpenAI names, otherwise use as-is
 
-    # Generate the TTS output in mp3 format first
-    temp_output_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-    communicator = edge_tts.Communicate(text, edge_tts_voice)
-    await communicator.save(temp_output_file.name)
-
-    # If the requested format is mp3 and speed is 1.0, return the generated file directly
-    if response_format == "mp3" and speed == 1.0:
-        return temp_output_file.name
-
-    # Convert to the requested format if not mp3 or if speed adjustment is needed
-    converted_output_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{response_format}")
-    
-    # ffmpeg playback speed adjustment
-    speed_filter = f"atempo={speed}" if response_format != "pcm" else f"asetrate=44100*{speed},aresample=44100"
-    ffmpeg_command = [
-        "ffmpeg", "-i", temp_output_file.name, 
-        "-filter:a", speed_filter,  # Apply speed adjustment
-        "-f", response_format, "-y",
-        converted_output_file.name
-    ]
+    def attempt():
+        # Called again for every retry or hedged attempt
+        return upstream_client.stream(text, edge_tts_voice, rate=rate, pitch=pitch, volume=volume,
+                                      output_format=output_format, boundary=boundary)
+
+    async with upstream_limiter.slot():
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            async for chunk in upstream_resilience.stream(attempt):
+                if chunk["type"] == "audio":
+                    if first_chunk:
+                        first_chunk = False
+                        stage_seconds.observe(time.perf_counter() - started, stage='upstream_first_byte')
+                        mark_timing('ttfb', first=True)
+                    yield chunk["data"]
+                elif events is not None:
+                    events.append(chunk)
+        except Exception as e:
+            upstream_errors.inc(operation='speech', error=type(e).__name__)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - started, stage='upstream')
+            # With several segments this ends up as the time the last one finished
+            mark_timing('synthesis')
+
+async def _stream_segments(segments, voice, rate="+0%", pitch="+0Hz", volume="+0%", output_format=MP3,
+                           boundary="SentenceBoundary", events=None):
+    """
+    Synthesize segments concurrently, at most SEGMENT_PARALLELISM at a time,
+    and yield their audio chunks in segment order. MP3 frames concatenate
+    cleanly (as does raw PCM), so segments are stitched without re-encoding,
+    and the first segment is forwarded live while later ones are buffered.
+    Boundary events of later segments are shifted by the length of the
+    audio before them.
+    """
+    if len(segments) == 1:
+        async for chunk in _stream_audio(segments[0], voice, rate, pitch, volume, output_format, boundary, events):
+            yield chunk
+        return
 
+    semaphore = asyncio.Semaphore(SEGMENT_PARALLELISM)
+    queues = [asyncio.Queue() for _ in segments]
+    segment_events = [[] if events is not None else None for _ in segments]
+    segment_bytes = [0] * len(segments)
+
+    async def produce(index, segment, queue):
+        async with semaphore:
+            try:
+                async for chunk in _stream_audio(segment, voice, rate, pitch, volume, output_format, boundary,
+                                                 segment_events[index]):
+                    segment_bytes[index] += len(chunk)
+                    queue.put_nowait(chunk)
+                queue.put_nowait(None)
+            except Exception as e:
+                queue.put_nowait(e)
+
+    # The semaphore is FIFO, so segments start in order
+    tasks = [asyncio.ensure_future(produce(index, segment, queue)) for index, (segment, queue) in enumerate(zip(segments, queues))]
     try:
-        subprocess.run(ffmpeg_command, check=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Error in audio conversion: {e}")
+        elapsed = 0
+        for index, queue in enumerate(queues):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            if events is not None:
+                # Segments are constant-bitrate mp3 or raw PCM, so their length follows from their size
+                events.extend(shift(segment_events[index], elapsed))
+                elapsed += segment_bytes[index] * TICKS_PER_SECOND // BYTES_PER_SECOND[output_format]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _convert(chunks, response_format, speed):
+    """
+    Turn upstream mp3, already synthesized at the native part of `speed`,
+    into the requested format, applying any speed left over for ffmpeg.
+    """
+    _, residual_speed = split_speed(speed)
+
+    # The upstream mp3 is forwarded untouched when no conversion is needed
+    if response_format == "mp3" and residual_speed == 1.0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    # Otherwise upstream chunks are piped through ffmpeg for format and any speed
+    # outside the native prosody range. The transcode slot, and with it an
+    # ffmpeg process, is only taken once upstream audio arrives, so requests
+    # still waiting for the service do not hold one. Upstream is read ahead
+    # meanwhile, so its slot is not held up waiting for transcode capacity.
+    queue = asyncio.Queue()
+
+    async def read_ahead():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    async def buffered(item):
+        while item is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = await queue.get()
+
+    reader = asyncio.ensure_future(read_ahead())
+    try:
+        first = await queue.get()
+        if isinstance(first, Exception):
+            raise first
+        async with transcode_limiter.slot():
+            started = time.perf_counter()
+            try:
+                async for chunk in transcoder_backend.transcode(buffered(first), response_format, residual_speed):
+                    yield chunk
+            finally:
+                elapsed = time.perf_counter() - started
+                stage_seconds.observe(elapsed, stage='transcode')
+                record_timing('transcode', elapsed)
+    finally:
+        reader.cancel()
+
+# Upstream output formats whose bytes can be sent as they are: raw PCM
+# (also behind a locally written wav header) and Ogg opus. Formats the
+# service turns down are remembered and fall back to mp3 plus ffmpeg
+unsupported_upstream_formats = set()
+
+def _native_format(response_format, residual_speed, segments):
+    if residual_speed != 1.0:
+        return None  # ffmpeg runs anyway to apply the speed
+    if response_format in ("pcm", "wav"):
+        native = RAW_PCM
+    elif response_format == "opus" and len(segments) == 1 and fits_one_turn(segments[0]):
+        # Ogg streams from separate turns do not concatenate into one stream
+        native = OGG_OPUS
+    else:
+        return None
+    return None if native in unsupported_upstream_formats else native
+
+async def _generate_audio(text, voice, response_format, speed, pitch="+0Hz", volume="+0%",
+                          boundary="SentenceBoundary", events=None):
+    """
+    Yield the requested format as it is produced, without touching the disk.
+    Boundary events of the same synthesis are collected into `events`, with
+    offsets matching the output audio.
+    """
+    rate, residual_speed = split_speed(speed)
+    segments = split_text(text, SEGMENT_MAX_CHARS)
+
+    native = _native_format(response_format, residual_speed, segments)
+    if native is not None:
+        produced = False
+        try:
+            header = wav_header() if response_format == "wav" else b""
+            async for chunk in _stream_segments(segments, voice, rate, pitch, volume, native, boundary, events):
+                produced = True
+                yield header + chunk
+                header = b""
+            return
+        except FormatRefused:
+            if produced:
+                raise
+            # Remembered on the first refusal, so later requests go straight to mp3
+            unsupported_upstream_formats.add(native)
+            if events is not None:
+                events.clear()
+
+    chunks = _stream_segments(segments, voice, rate, pitch, volume, MP3, boundary, events)
+    async for chunk in _convert(chunks, response_format, speed):
+        yield chunk
+    if events is not None and residual_speed != 1.0:
+        events[:] = scale(events, residual_speed)
+
+async def _collect(chunks, buffer):
+    async for chunk in chunks:
+        buffer.write(chunk)
+    return buffer
 
-    return converted_output_file.name
+def _finalize(response_format, buffer):
+    # Buffered wav gets real chunk sizes instead of the streaming placeholders
+    if response_format == "wav":
+        header = buffer.read_head(WAV_HEADER_SCAN_SIZE)
+        buffer.overwrite(0, fix_wav_header(header, buffer.size))
 
-def generate_speech(text, voice, response_format, speed=1.0):
-    return asyncio.run(_generate_audio(text, voice, response_format, speed))
+async def _cache_get(key, response_format):
+    # The disk tier reads files, which must not block the engine loop
+    if audio_cache.disk_dir:
+        return await asyncio.to_thread(audio_cache.get, key, response_format)
+    return audio_cache.get(key, response_format)
+
+async def _store(key, response_format, buffer):
+    # Outputs that spilled out of memory only go to the disk tier
+    if buffer.spilled:
+        buffer.flush()
+        store, value = audio_cache.put_file, buffer.path
+    else:
+        store, value = audio_cache.put, buffer.getvalue()
+    # Writing to the disk tier happens off the engine loop
+    if audio_cache.disk_dir:
+        await asyncio.to_thread(store, key, response_format, value)
+    else:
+        store(key, response_format, value)
+
+# Identical requests in flight at the same time share one synthesis
+inflight = SingleFlight()
+
+async def _produce(key, text, voice, response_format, speed, pitch, volume, timestamps=None):
+    # Runs once per key for everybody waiting on it; keeps a copy of the
+    # output so a completed synthesis fills the cache
+    events = [] if timestamps else None
+    buffer = scratch_store.buffer()
+    try:
+        async for chunk in _generate_audio(text, voice, response_format, speed, pitch, volume,
+                                           BOUNDARY_TYPES.get(timestamps, "SentenceBoundary"), events):
+            buffer.write(chunk)
+            yield chunk
+        _finalize(response_format, buffer)
+        await _store(key, response_format, buffer)
+        if timestamps:
+            await asyncio.to_thread(timestamp_store.put, timestamps_id(key, timestamps), events)
+    finally:
+        buffer.close()
+
+def _coalesced(key, text, voice, response_format, speed, pitch, volume, timestamps=None):
+    # A request for timings can only share a synthesis that collects the same ones
+    flight_key = timestamps_id(key, timestamps) if timestamps else key
+    return inflight.join(flight_key, lambda: _produce(key, text, voice, response_format, speed, pitch, volume, timestamps))
+
+async def _synthesize(key, buffer, text, voice, response_format, speed, pitch, volume, timestamps=None):
+    """Fill `buffer` with one complete output; the cache is filled by the shared synthesis."""
+    await _collect(_coalesced(key, text, voice, response_format, speed, pitch, volume, timestamps), buffer)
+    _finalize(response_format, buffer)
+    return buffer
+
+def _cached_audio(key, response_format, timestamps):
+    # Cached audio is only enough when the requested timings are known too
+    if timestamps and timestamp_store.get(timestamps_id(key, timestamps)) is None:
+        return None
+    return audio_cache.get(key, response_format)
+
+def get_timestamps(timings_id):
+    """Boundary events recorded for a timestamps id, or None."""
+    return timestamp_store.get(timings_id)
+
+def voice_label(voice):
+    """
+    Metric label for a requested voice: OpenAI names and voices in the
+    catalog as they are, anything else "other", so that clients cannot grow
+    the label set without bound.
+    """
+    if isinstance(voice, str) and (voice in voice_mapping or voice_catalog.knows(voice)):
+        return voice
+    return "other"
+
+def speech_cache_key(text, voice, response_format, speed=1.0, pitch=None, volume=None):
+    """Cache key (and ETag) of a request, computed on the resolved edge-tts voice."""
+    # Also validates the speed, before anything is synthesized
+    split_speed(float(speed))
+    return make_key(text, voice_mapping.get(voice, voice), response_format, speed,
+                    normalize_pitch(pitch), normalize_volume(volume))
+
+def generate_speech(text, voice, response_format, speed=1.0, pitch=None, volume=None, timestamps=None):
+    """
+    Return the synthesized audio as a ScratchBuffer, served from the cache
+    when possible. The caller must close() the buffer once it is sent.
+    With `timestamps` ('word' or 'sentence') the timings of the same
+    synthesis are kept for get_timestamps.
+    """
+    with synthesis_seconds.time(operation='generate_speech'):
+        pitch, volume = normalize_pitch(pitch), normalize_volume(volume)
+        key = speech_cache_key(text, voice, response_format, speed, pitch, volume)
+        audio = _cached_audio(key, response_format, timestamps)
+        if audio is not None:
+            return scratch_store.buffer(audio)
+
+        buffer = scratch_store.buffer()
+        try:
+            return engine.run(_synthesize(key, buffer, text, voice, response_format, speed, pitch, volume, timestamps))
+        except BaseException:
+            buffer.close()
+            raise
+
+def stream_speech(text, voice, response_format="mp3", speed=1.0, pitch=None, volume=None, timestamps=None):
+    """Yield audio chunks of the synthesized speech as they are produced."""
+    with synthesis_seconds.time(operation='stream_speech'):
+        pitch, volume = normalize_pitch(pitch), normalize_volume(volume)
+        key = speech_cache_key(text, voice, response_format, speed, pitch, volume)
+        audio = _cached_audio(key, response_format, timestamps)
+        if audio is not None:
+            yield audio
+            return
+
+        # A concurrent request for the same key is followed live instead of synthesized again
+        for chunk in engine.iterate(_coalesced(key, text, voice, response_format, speed, pitch, volume, timestamps)):
+            yield chunk
+
+async def _synthesize_batch(requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(key, request):
+        async with semaphore:
+            audio = await _cache_get(key, request[2])
+            if audio is not None:
+                return key, audio, None
+            buffer = scratch_store.buffer()
+            try:
+                await _synthesize(key, buffer, *request)
+                return key, buffer.getvalue(), None
+            except Exception as e:
+                return key, None, e
+            finally:
+                buffer.close()
+
+    tasks = [asyncio.ensure_future(run_one(key, request)) for key, request in requests.items()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def generate_batch(items, concurrency=None):
+    """
+    Synthesize many requests through the same pipeline as generate_speech.
+
+    `items` is a list of dicts with the generate_speech arguments (text,
+    voice, response_format, speed, pitch, volume). Identical items are
+    synthesized once. Yields (indices, audio, error) as each unique item
+    finishes, where `indices` are the positions in `items` it answers.
+    """
+    requests, indices = _batch_requests(items)
+    for key, audio, error in engine.iterate(_synthesize_batch(requests, concurrency or BATCH_CONCURRENCY)):
+        yield indices[key], audio, error
+
+def _batch_requests(items):
+    # Unique requests by cache key, and the positions in `items` each one answers
+    requests = {}
+    indices = {}
+    for index, item in enumerate(items):
+        pitch, volume = normalize_pitch(item.get('pitch')), normalize_volume(item.get('volume'))
+        request = (item['text'], item['voice'], item['response_format'], item.get('speed', 1.0), pitch, volume)
+        key = speech_cache_key(*request)
+        requests.setdefault(key, request)
+        indices.setdefault(key, []).append(index)
+    return requests, indices
+
+async def _prewarm(items):
+    requests, _ = _batch_requests(items)
+    failed = 0
+    async for _, _, error in _synthesize_batch(requests, BATCH_CONCURRENCY):
+        if error is not None:
+            failed += 1
+    print(f" * Pre-warmed {len(requests) - failed} of {len(requests)} phrases from {PREWARM_MANIFEST}")
+
+def prepare_dialogue(lines):
+    """
+    Validate and normalize dialogue lines: dicts with text and voice and
+    optional speed, pitch, volume and pause (seconds of silence after the
+    line). Every line is an mp3 speech request of its own, so it gets that
+    request's cache key. Raises ValueError for a line that cannot be used.
+    """
+    prepared = []
+    for index, line in enumerate(lines):
+        if not isinstance(line['text'], str) or not isinstance(line['voice'], str):
+            raise ValueError(f"Line {index}: input and voice must be strings")
+        try:
+            speed = float(line.get('speed', 1.0))
+            pause = float(line.get('pause', 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {index}: speed and pause must be numbers")
+        # The output is encoded once for the whole dialogue, so ffmpeg
+        # cannot apply a speed to one line only (NaN fails both checks too)
+        if not NATIVE_SPEED_MIN <= speed <= NATIVE_SPEED_MAX:
+            raise ValueError(f"Line {index}: speed must be between {NATIVE_SPEED_MIN:g} and {NATIVE_SPEED_MAX:g}")
+        if not 0 <= pause <= DIALOGUE_MAX_PAUSE:
+            raise ValueError(f"Line {index}: pause must be between 0 and {DIALOGUE_MAX_PAUSE} seconds")
+        try:
+            pitch, volume = normalize_pitch(line.get('pitch')), normalize_volume(line.get('volume'))
+        except ValueError as e:
+            raise ValueError(f"Line {index}: {e}")
+        prepared.append({
+            "text": line['text'], "voice": line['voice'], "speed": speed, "pitch": pitch, "volume": volume,
+            "pause": pause, "key": speech_cache_key(line['text'], line['voice'], "mp3", speed, pitch, volume),
+        })
+    return prepared
+
+def dialogue_key(lines, response_format):
+    """ETag of a dialogue prepared by prepare_dialogue."""
+    payload = json.dumps([[line['key'], f"{line['pause']:g}"] for line in lines] + [response_format])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+async def _dialogue_line(line):
+    # Served from the cache, or shared with identical lines and speech requests in flight
+    audio = await _cache_get(line['key'], "mp3")
+    if audio is not None:
+        yield audio
+        return
+    async for chunk in _coalesced(line['key'], line['text'], line['voice'], "mp3", line['speed'], line['pitch'],
+                                  line['volume']):
+        yield chunk
+
+async def _stream_dialogue(lines):
+    """
+    Synthesize dialogue lines concurrently, at most DIALOGUE_PARALLELISM at
+    a time, and yield them as one mp3 stream in line order, each followed
+    by its pause as silent frames. The first line is forwarded live while
+    later ones are buffered.
+    """
+    semaphore = asyncio.Semaphore(DIALOGUE_PARALLELISM)
+    queues = [asyncio.Queue() for _ in lines]
+
+    async def produce(line, queue):
+        async with semaphore:
+            try:
+                async for chunk in _dialogue_line(line):
+                    queue.put_nowait(chunk)
+                queue.put_nowait(None)
+            except Exception as e:
+                queue.put_nowait(e)
+
+    tasks = [asyncio.ensure_future(produce(line, queue)) for line, queue in zip(lines, queues)]
+    try:
+        for line, queue in zip(lines, queues):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            if line['pause']:
+                yield mp3_silence(line['pause'])
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _dialogue_audio(lines, response_format):
+    # The joined mp3 is converted once; mp3 output is passed through as it is
+    return _convert(_stream_dialogue(lines), response_format, 1.0)
+
+def generate_dialogue(lines, response_format):
+    """
+    Return the dialogue (lines from prepare_dialogue) as one ScratchBuffer
+    in `response_format`. The caller must close() the buffer once it is sent.
+    """
+    with synthesis_seconds.time(operation='generate_dialogue'):
+        buffer = scratch_store.buffer()
+        try:
+            engine.run(_collect(_dialogue_audio(lines, response_format), buffer))
+            _finalize(response_format, buffer)
+            return buffer
+        except BaseException:
+            buffer.close()
+            raise
+
+def stream_dialogue(lines, response_format):
+    """Yield the dialogue's audio in line order as the lines are synthesized."""
+    with synthesis_seconds.time(operation='stream_dialogue'):
+        for chunk in engine.iterate(_dialogue_audio(lines, response_format)):
+            yield chunk
+
+async def _stream_job_segment(text, job):
+    rate, _ = split_speed(job['speed'])
+    async for chunk in _stream_audio(text, job['voice'], rate, job['pitch'], job['volume']):
+        yield chunk
+
+# Long-running synthesis jobs, persisted in SQLite so they survive restarts
+job_manager = JobManager(
+    engine,
+    JobStore(os.getenv('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'edge-tts-jobs'))),
+    stream_segment=_stream_job_segment,
+    convert=_convert,
+    workers=int(os.getenv('JOB_WORKERS', 2)),
+    segment_parallelism=SEGMENT_PARALLELISM,
+    retention=float(os.getenv('JOB_RETENTION', 86400)),
+)
+
+def submit_job(text, voice, response_format, speed=1.0, pitch=None, volume=None):
+    """Queue a synthesis job and return its id."""
+    split_speed(float(speed))
+    return job_manager.submit(split_text(text, SEGMENT_MAX_CHARS), voice_mapping.get(voice, voice),
+                              response_format, float(speed), normalize_pitch(pitch), normalize_volume(volume))
+
+def get_job(job_id):
+    return job_manager.store.get(job_id)
+
+def delete_job(job_id):
+    """Remove a completed or failed job; False if it is missing or still running."""
+    return job_manager.delete(job_id)
+
+async def _janitor():
+    while True:
+        await asyncio.to_thread(scratch_store.sweep)
+        # Other workers write to a shared disk cache too; recount it from the directory
+        await asyncio.to_thread(audio_cache.rescan)
+        await asyncio.to_thread(job_manager.expire)
+        await asyncio.sleep(SCRATCH_JANITOR_INTERVAL)
+
+def start_background_tasks(prewarm=True):
+    """
+    Start the work that lives for the whole process on the engine loop.
+    In pre-fork mode only one worker pre-warms from PREWARM_MANIFEST.
+    """
+    voice_catalog.preload()
+    engine.submit(transcoder_backend.prewarm())
+    if PREWARM_MANIFEST and prewarm:
+        from prewarm import read_manifest
+        engine.submit(_prewarm(read_manifest(PREWARM_MANIFEST)))
+    engine.submit(_janitor())
+    job_manager.start()
 
 def get_models():
     return [
@@ -60,15 +716,11 @@ def get_models():
         {"id": "tts-1-hd", "name": "Text-to-speech v1 HD"}
     ]
 
-async def _get_voices(language=None):
-    # List all voices, filter by language if specified
-    all_voices = await edge_tts.list_voices()
+def get_voices(language=None, gender=None, offset=0, limit=None, fields=None):
+    """
+    List voices for a locale (`zh-CN`), a language prefix (`zh`) or 'all'.
+    Returns (total, voices) so callers can paginate.
+    """
     language = language or DEFAULT_LANGUAGE  # Use default if no language specified
-    filtered_voices = [
-        {"name": v['ShortName'], "gender": v['Gender'], "language": v['Locale']}
-        for v in all_voices if language == 'all' or language is None or v['Locale'] == language
-    ]
-    return filtered_voices
-
-def get_voices(language=None):
-    return asyncio.run(_get_voices(language))
+    with synthesis_seconds.time(operation='get_voices'):
+        return voice_catalog.query(language, gender, offset, limit, fields)
@@ -0,0 +1,307 @@
+# upstream.py
+
+import asyncio
+import json
+import time
+from collections import deque
+from xml.sax.saxutils import escape, unescape
+
+import aiohttp
+from edge_tts import communicate as edge_communicate
+from edge_tts.communicate import (
+    connect_id,
+    date_to_string,
+    get_headers_and_data,
+    mkssml,
+    remove_incompatible_characters,
+    split_text_by_byte_length,
+    ssml_headers_plus_data,
+)
+from edge_tts.constants import SEC_MS_GEC_VERSION, TICKS_PER_SECOND, WSS_HEADERS
+from edge_tts.data_classes import TTSConfig
+from edge_tts.drm import DRM
+from edge_tts.exceptions import NoAudioReceived, UnexpectedResponse, UnknownResponse, WebSocketError
+
+from metrics import record_timing, stage_seconds
+
+# Output formats requested from the service
+MP3 = "audio-24khz-48kbitrate-mono-mp3"
+RAW_PCM = "raw-24khz-16bit-mono-pcm"
+OGG_OPUS = "ogg-24khz-16bit-mono-opus"
+
+# Bytes per second of the constant-bitrate formats, used to carry boundary
+# offsets over from one websocket turn to the next
+BYTES_PER_SECOND = {MP3: 48_000 // 8, RAW_PCM: 24_000 * 2}
+
+# One frame of silence in the MP3 format above (MPEG-2 layer III, 24kHz,
+# 48kbps, mono): 576 samples, 144 bytes. Empty side info decodes to silence
+# and the frame does not use the bit reservoir, so it can go between the
+# frames of separately synthesized clips.
+MP3_SILENT_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC0]) + bytes(140)
+MP3_FRAME_SECONDS = 576 / 24_000
+
+def mp3_silence(seconds):
+    """Silent MP3 frames lasting `seconds`, rounded to whole frames."""
+    return MP3_SILENT_FRAME * round(seconds / MP3_FRAME_SECONDS)
+
+# Largest piece of escaped text sent in one turn, as edge-tts does
+MAX_TURN_BYTES = 4096
+
+# Everything a failed synthesis can raise
+UPSTREAM_ERRORS = (aiohttp.ClientError, NoAudioReceived, UnexpectedResponse, UnknownResponse, WebSocketError)
+
+class FormatRefused(Exception):
+    """
+    The service ended a turn without audio for an output format other than
+    mp3, which is how it turns down formats it does not offer. This is an
+    answer rather than a failure, so it is neither retried nor counted by
+    the circuit breaker.
+    """
+
+    def __init__(self, output_format):
+        super().__init__(f"Output format {output_format} was refused by the service")
+        self.output_format = output_format
+
+def fits_one_turn(text):
+    """Whether the service synthesizes `text` in a single websocket turn."""
+    return len(escape(remove_incompatible_characters(text)).encode('utf-8')) <= MAX_TURN_BYTES
+
+def _speech_config(output_format, boundary):
+    word_boundary = boundary == "WordBoundary"
+    return (
+        f"X-Timestamp:{date_to_string()}\r\n"
+        "Content-Type:application/json; charset=utf-8\r\n"
+        "Path:speech.config\r\n\r\n"
+        '{"context":{"synthesis":{"audio":{"metadataoptions":{'
+        f'"sentenceBoundaryEnabled":"{str(not word_boundary).lower()}",'
+        f'"wordBoundaryEnabled":"{str(word_boundary).lower()}"'
+        "},"
+        f'"outputFormat":"{output_format}"'
+        "}}}}\r\n"
+    )
+
+def _parse_metadata(data, offset_compensation):
+    for meta in json.loads(data)["Metadata"]:
+        if meta["Type"] in ("WordBoundary", "SentenceBoundary"):
+            return {
+                "type": meta["Type"],
+                "offset": meta["Data"]["Offset"] + offset_compensation,
+                "duration": meta["Data"]["Duration"],
+                "text": unescape(meta["Data"]["text"]["Text"]),
+            }
+        if meta["Type"] != "SessionEnd":
+            raise UnknownResponse(f"Unknown metadata type: {meta['Type']}")
+    return None
+
+class _StaleConnection(Exception):
+    """A reused websocket turned out to be closed before the turn started."""
+
+class UpstreamClient:
+    """
+    Edge TTS websocket client that, unlike edge_tts.Communicate, lets the
+    caller choose the output format the service produces and reuses
+    connections.
+
+    One aiohttp session with a DNS cache is shared by all syntheses, and a
+    websocket whose turn ended cleanly is kept for the next turn instead of
+    paying for a new TLS and websocket handshake. Up to `pool_size` idle
+    websockets are kept for at most `idle_timeout` seconds; a reused one
+    that was closed in the meantime is replaced transparently.
+
+    The session belongs to the event loop it was created on, which is the
+    synthesis engine's loop for the life of the process.
+
+    `stream()` yields the same chunks as Communicate.stream(): audio as
+    {"type": "audio", "data": bytes} and boundary events with offsets in
+    100ns ticks, continuous across the turns a long text is split into.
+    """
+
+    def __init__(self, connect_timeout=10, receive_timeout=60, pool_size=8, idle_timeout=30, dns_ttl=300):
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=None, sock_connect=connect_timeout)
+        self.ws_timeout = aiohttp.ClientWSTimeout(ws_receive=receive_timeout, ws_close=5)
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.dns_ttl = dns_ttl
+        self._session = None
+        self._session_loop = None
+        self._idle = deque()
+        self.counters = {
+            "turns": 0,
+            "reused_turns": 0,
+            "handshakes": 0,
+            "handshake_failures": 0,
+            "handshake_seconds_total": 0.0,
+            "handshake_seconds_max": 0.0,
+            "stale_connections": 0,
+        }
+
+    def _url(self):
+        # Read on every connection so EDGE_TTS_WSS_URL overrides apply
+        return (f"{edge_communicate.WSS_URL}&ConnectionId={connect_id()}"
+                f"&Sec-MS-GEC={DRM.generate_sec_ms_gec()}&Sec-MS-GEC-Version={SEC_MS_GEC_VERSION}")
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            # A forked worker starts a new engine loop and needs its own session
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ttl_dns_cache=self.dns_ttl, limit=0),
+                trust_env=True,
+                timeout=self.timeout,
+            )
+            self._session_loop = loop
+            self._idle.clear()
+        return self._session
+
+    async def _handshake(self):
+        session = self._get_session()
+        started = time.perf_counter()
+        try:
+            websocket = await session.ws_connect(
+                self._url(),
+                compress=15,
+                headers=DRM.headers_with_muid(WSS_HEADERS),
+                ssl=edge_communicate._SSL_CTX,
+                timeout=self.ws_timeout,
+            )
+        except BaseException:
+            self.counters["handshake_failures"] += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self.counters["handshakes"] += 1
+        self.counters["handshake_seconds_total"] += elapsed
+        self.counters["handshake_seconds_max"] = max(self.counters["handshake_seconds_max"], elapsed)
+        stage_seconds.observe(elapsed, stage='upstream_handshake')
+        record_timing('connect', elapsed)
+        return websocket
+
+    async def _acquire(self):
+        """Return (websocket, reused), preferring the most recently used idle connection."""
+        self._get_session()
+        now = time.monotonic()
+        while self._idle:
+            websocket, idle_since = self._idle.pop()
+            if not websocket.closed and now - idle_since <= self.idle_timeout:
+                return websocket, True
+            await websocket.close()
+        return await self._handshake(), False
+
+    async def _release(self, websocket, clean):
+        if clean and not websocket.closed and len(self._idle) < self.pool_size:
+            self._idle.append((websocket, time.monotonic()))
+        else:
+            await websocket.close()
+
+    async def stream(self, text, voice, rate="+0%", pitch="+0Hz", volume="+0%", output_format=MP3, boundary="SentenceBoundary"):
+        config = TTSConfig(voice, rate, volume, pitch, boundary)
+        state = {"offset_compensation": 0, "audio_bytes": 0, "last_end": 0}
+        for partial in split_text_by_byte_length(escape(remove_incompatible_characters(text)), MAX_TURN_BYTES):
+            try:
+                async for chunk in self._turn(config, partial, output_format, state):
+                    yield chunk
+            except aiohttp.WSServerHandshakeError as e:
+                if e.status != 403:
+                    raise
+                # The service rejects tokens from a skewed clock; correct it and retry once
+                DRM.handle_client_response_error(e)
+                async for chunk in self._turn(config, partial, output_format, state):
+                    yield chunk
+
+            bytes_per_second = BYTES_PER_SECOND.get(output_format)
+            if bytes_per_second:
+                state["offset_compensation"] = state["audio_bytes"] * TICKS_PER_SECOND // bytes_per_second
+            else:
+                state["offset_compensation"] = state["last_end"]
+
+    async def _turn(self, config, partial, output_format, state):
+        self.counters["turns"] += 1
+        websocket, reused = await self._acquire()
+        if reused:
+            self.counters["reused_turns"] += 1
+        try:
+            async for chunk in self._exchange(websocket, reused, config, partial, output_format, state):
+                yield chunk
+        except _StaleConnection:
+            self.counters["stale_connections"] += 1
+            websocket = await self._handshake()
+            async for chunk in self._exchange(websocket, False, config, partial, output_format, state):
+                yield chunk
+
+    async def _exchange(self, websocket, reused, config, partial, output_format, state):
+        # The connection only goes back to the pool when the turn ended normally
+        clean = False
+        received_any = False
+        audio_received = False
+        try:
+            try:
+                # Sent on every turn since the output format can change between turns
+                await websocket.send_str(_speech_config(output_format, config.boundary))
+                await websocket.send_str(ssml_headers_plus_data(connect_id(), date_to_string(), mkssml(config, partial)))
+            except (ConnectionError, aiohttp.ClientError):
+                if reused:
+                    raise _StaleConnection()
+                raise
+
+            async for received in websocket:
+                received_any = True
+                if received.type == aiohttp.WSMsgType.TEXT:
+                    encoded = received.data.encode('utf-8')
+                    headers, data = get_headers_and_data(encoded, encoded.find(b"\r\n\r\n"))
+                    path = headers.get(b"Path")
+                    if path == b"audio.metadata":
+                        event = _parse_metadata(data, state["offset_compensation"])
+                        if event is not None:
+                            state["last_end"] = event["offset"] + event["duration"]
+                            yield event
+                    elif path == b"turn.end":
+                        clean = True
+                        break
+                    elif path not in (b"response", b"turn.start"):
+                        raise UnknownResponse("Unknown path received")
+                elif received.type == aiohttp.WSMsgType.BINARY:
+                    if len(received.data) < 2:
+                        raise UnexpectedResponse("Binary message is missing the header length")
+                    header_length = int.from_bytes(received.data[:2], "big")
+                    if header_length > len(received.data):
+                        raise UnexpectedResponse("Header length is greater than the message")
+                    headers, data = get_headers_and_data(received.data, header_length)
+                    if headers.get(b"Path") != b"audio":
+                        raise UnexpectedResponse("Binary message is not audio")
+                    # The stream ends with an empty message without a content type
+                    if not data:
+                        continue
+                    audio_received = True
+                    state["audio_bytes"] += len(data)
+                    yield {"type": "audio", "data": data}
+                elif received.type == aiohttp.WSMsgType.ERROR:
+                    raise WebSocketError(received.data or "Unknown error")
+        finally:
+            await self._release(websocket, clean)
+
+        if not clean:
+            if reused and not received_any:
+                raise _StaleConnection()
+            if audio_received:
+                raise WebSocketError("Connection closed before the turn ended")
+            # A dropped connection says nothing about the format; retried like any failure
+            raise NoAudioReceived(f"Connection closed before any audio was received for output format {output_format}")
+        if not audio_received:
+            # Only a turn that ended normally without audio is a refusal
+            if output_format != MP3:
+                raise FormatRefused(output_format)
+            raise NoAudioReceived(f"No audio was received for output format {output_format}")
+
+    async def close(self):
+        while self._idle:
+            websocket, _ = self._idle.pop()
+            await websocket.close()
+        if self._session is not None:
+            await self._session.close()
+
+    def stats(self):
+        handshakes = self.counters["handshakes"]
+        return dict(
+            self.counters,
+            idle_connections=len(self._idle),
+            handshake_seconds_avg=round(self.counters["handshake_seconds_total"] / handshakes, 4) if handshakes else 0.0,
+        )
@@ -1,19 +1,29 @@
 # utils.py
 
-from flask import request, jsonify
 from functools import wraps
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def parse_bool(value, default: bool = False) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("yes", "y", "true", "1", "t")
+
 def getenv_bool(name: str, default: bool = False) -> bool:
-    return os.getenv(name, str(default)).lower() in ("yes", "y", "true", "1", "t")
+    return parse_bool(os.getenv(name), default)
 
 API_KEY = os.getenv('API_KEY', 'sk')
 REQUIRE_API_KEY = getenv_bool('REQUIRE_API_KEY', True)
 
 def require_api_key(f):
+    # Imported when the first route is decorated, so that the helpers above
+    # can be used before Flask is loaded
+    from flask import request, jsonify
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not REQUIRE_API_KEY:
@@ -27,6 +37,25 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def require_api_key_or_param(f):
+    """
+    Like require_api_key, but a request without an Authorization header may
+    pass the key in the `key` or `api_key` query parameter instead (as /tts
+    does), so the URL can be used directly as the src of an <audio> element.
+    """
+    from flask import request, jsonify
+    checked = require_api_key(f)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.args.get('key') or request.args.get('api_key')
+        if not REQUIRE_API_KEY or token is None or 'Authorization' in request.headers:
+            return checked(*args, **kwargs)
+        if token != API_KEY:
+            return jsonify({"error": "Invalid API key"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 # Mapping of audio format to MIME type
 AUDIO_FORMAT_MIME_TYPES = {
     "mp3": "audio/mpeg",
@@ -0,0 +1,164 @@
+# voice_catalog.py
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from gevent.lock import Semaphore
+
+# Fields a client can ask for through `fields=` projection
+VOICE_FIELDS = ("name", "gender", "language", "friendly_name", "categories", "personalities")
+
+def _normalize(voice):
+    tag = voice.get('VoiceTag', {})
+    return {
+        "name": voice['ShortName'],
+        "gender": voice['Gender'],
+        "language": voice['Locale'],
+        "friendly_name": voice.get('FriendlyName', ''),
+        "categories": tag.get('ContentCategories', []),
+        "personalities": tag.get('VoicePersonalities', []),
+    }
+
+class _CatalogIndex:
+    """Immutable snapshot of the voice list with lookup tables built once."""
+
+    def __init__(self, voices, loaded_at):
+        self.voices = voices
+        self.loaded_at = loaded_at
+        self.names = {voice['name'] for voice in voices}
+        self.by_locale = {}
+        self.by_prefix = {}
+        self.by_gender = {}
+        for position, voice in enumerate(voices):
+            self.by_locale.setdefault(voice['language'].lower(), []).append(position)
+            self.by_prefix.setdefault(voice['language'].split('-')[0].lower(), []).append(position)
+            self.by_gender.setdefault(voice['gender'].lower(), []).append(position)
+
+    def positions(self, language=None, gender=None):
+        if not language or language == 'all':
+            matches = range(len(self.voices))
+        elif '-' in language:
+            matches = self.by_locale.get(language.lower(), [])
+        else:
+            matches = self.by_prefix.get(language.lower(), [])
+        if gender:
+            wanted = set(self.by_gender.get(gender.lower(), []))
+            matches = [p for p in matches if p in wanted]
+        return matches
+
+class VoiceCatalog:
+    """
+    In-process catalog of edge-tts voices.
+
+    The list is fetched once, served from memory and refreshed in the
+    background on the engine loop after `ttl` seconds. Every successful
+    fetch is written to `snapshot_path` so a cold start or an upstream
+    outage can still answer from the last known list.
+    """
+
+    def __init__(self, engine, fetch, ttl, snapshot_path=None):
+        self.engine = engine
+        self.fetch = fetch
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path or None
+        self._index = None
+        self._refreshing = False
+        self._lock = Semaphore()
+        self.last_error = None
+
+    async def refresh(self):
+        """Fetch the voice list from upstream and swap in a new index."""
+        try:
+            voices = [_normalize(v) for v in await self.fetch()]
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self._refreshing = False
+        self._index = _CatalogIndex(voices, time.time())
+        self.last_error = None
+        if self.snapshot_path:
+            await asyncio.to_thread(self._write_snapshot, voices)
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception:
+            # Keep serving the previous list; the next request retries
+            pass
+
+    def _write_snapshot(self, voices):
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, temp_path = tempfile.mkstemp(prefix='.voices-', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(voices, f, ensure_ascii=False)
+        os.replace(temp_path, self.snapshot_path)
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                voices = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return _CatalogIndex(voices, os.path.getmtime(self.snapshot_path))
+
+    def _current_index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load_snapshot()
+                    if self._index is None:
+                        # Nothing to serve yet, the first caller waits for upstream
+                        self.engine.run(self.refresh())
+            index = self._index
+
+        if time.time() - index.loaded_at > self.ttl and not self._refreshing:
+            # Another worker process may already have refreshed the shared snapshot
+            snapshot = self._load_snapshot()
+            if snapshot is not None and time.time() - snapshot.loaded_at <= self.ttl:
+                self._index = index = snapshot
+            else:
+                self._refreshing = True
+                self.engine.submit(self._refresh_in_background())
+        return index
+
+    def knows(self, name):
+        """Whether `name` is in the list already loaded; never fetches."""
+        index = self._index
+        return index is not None and name in index.names
+
+    def preload(self):
+        """Load the snapshot, or start fetching the list, without waiting for it."""
+        if self._index is None:
+            self._index = self._load_snapshot()
+        if self._index is None and not self._refreshing:
+            self._refreshing = True
+            self.engine.submit(self._refresh_in_background())
+
+    def query(self, language=None, gender=None, offset=0, limit=None, fields=None):
+        """
+        Return (total, voices) for a locale (`zh-CN`), a language prefix (`zh`)
+        or 'all', optionally filtered by gender, paginated and projected.
+        """
+        index = self._current_index()
+        matches = index.positions(language, gender)
+        total = len(matches)
+        end = None if limit is None else offset + limit
+        voices = [index.voices[p] for p in matches[offset:end]]
+        fields = [f for f in (fields or ("name", "gender", "language")) if f in VOICE_FIELDS]
+        return total, [{f: v[f] for f in fields} for v in voices]
+
+    def stats(self):
+        index = self._index
+        return {
+            "voices": len(index.voices) if index else 0,
+            "age_seconds": round(time.time() - index.loaded_at, 1) if index else None,
+            "ttl": self.ttl,
+            "last_error": self.last_error,
+        }
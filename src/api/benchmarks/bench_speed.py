@@ -0,0 +1,68 @@
+# bench_speed.py
+#
+# Compares the two ways of changing playback speed for mp3 output:
+#   native - edge-tts prosody rate, upstream mp3 forwarded untouched
+#   atempo - synthesis at normal rate, then ffmpeg decode/atempo/re-encode
+#
+# Usage: python benchmarks/bench_speed.py [--runs 3] [--voice en-US-AndrewNeural]
+# Needs network access to the edge-tts service and ffmpeg on PATH.
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from tts_handler import _stream_audio, split_speed, upstream_client
+from transcoder import transcode
+
+TEXT = ("The quick brown fox jumps over the lazy dog. "
+        "Speech synthesis latency matters most for short interactive prompts.")
+
+async def _measure(chunks):
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    return time.perf_counter() - start, first_byte, size
+
+async def _run(chunks):
+    # Every asyncio.run() has its own loop; close the client's session and
+    # pooled connections before that loop goes away
+    try:
+        return await _measure(chunks)
+    finally:
+        await upstream_client.close()
+
+def native(text, voice, speed):
+    rate, _ = split_speed(speed)
+    return _stream_audio(text, voice, rate=rate)
+
+def atempo(text, voice, speed):
+    return transcode(_stream_audio(text, voice), "mp3", speed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare native prosody rate with ffmpeg atempo for mp3 speed changes")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--voice', default='en-US-AndrewNeural')
+    parser.add_argument('--speeds', default='0.75,1.25,1.5,2.0')
+    args = parser.parse_args()
+
+    print(f"{'speed':>6} {'path':>7} {'total ms':>9} {'ttfb ms':>8} {'bytes':>7}")
+    for speed in [float(s) for s in args.speeds.split(',')]:
+        for name, path in (("native", native), ("atempo", atempo)):
+            totals, ttfbs = [], []
+            for _ in range(args.runs):
+                total, ttfb, size = asyncio.run(_run(path(TEXT, args.voice, speed)))
+                totals.append(total * 1000)
+                ttfbs.append(ttfb * 1000)
+            print(f"{speed:>6g} {name:>7} {statistics.median(totals):>9.0f} {statistics.median(ttfbs):>8.0f} {size:>7}")
+
+if __name__ == '__main__':
+    main()
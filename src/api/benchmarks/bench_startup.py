@@ -0,0 +1,128 @@
+# bench_startup.py
+#
+# Cold-start time of the server: starts `python app/server.py` on a free
+# port and measures, from process start, how long until
+#   listen  - a TCP connection to the port is accepted
+#   models  - GET /v1/models answers 200
+# The process is stopped after each run. Results are reported as JSON
+# (median/min/max per milestone) and can be compared with --baseline so
+# import-time regressions are caught.
+#
+# Usage: python benchmarks/bench_startup.py [--runs 10] [--key your_api_key_here]
+#            [--output startup.json] [--baseline previous.json]
+# The server's usual environment variables apply; API_KEY and PORT are set
+# from the options.
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app', 'server.py')
+MILESTONES = ("listen", "models")
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def _accepting(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+def _models_ok(port, key):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/v1/models", headers={"Authorization": f"Bearer {key}"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status == 200
+    except (OSError, urllib.error.URLError):
+        return False
+
+def run_once(key, timeout):
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), API_KEY=key, WORKERS='1')
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER], env=env, cwd=os.path.dirname(SERVER),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = {}
+    try:
+        while len(times) < len(MILESTONES):
+            elapsed = time.perf_counter() - started
+            if elapsed > timeout:
+                raise TimeoutError(f"Server did not answer /v1/models within {timeout:g}s")
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            if "listen" not in times and _accepting(port):
+                times["listen"] = time.perf_counter() - started
+            if "listen" in times and _models_ok(port, key):
+                times["models"] = time.perf_counter() - started
+            else:
+                time.sleep(0.005)
+    finally:
+        process.send_signal(signal.SIGINT if os.name == 'nt' else signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return times
+
+def summarize(runs):
+    return {
+        milestone: {
+            "median_ms": round(statistics.median(run[milestone] for run in runs) * 1000, 1),
+            "min_ms": round(min(run[milestone] for run in runs) * 1000, 1),
+            "max_ms": round(max(run[milestone] for run in runs) * 1000, 1),
+        }
+        for milestone in MILESTONES
+    }
+
+def compare(results, baseline):
+    print(f"{'milestone':<12}{'median ms':>22}", file=sys.stderr)
+    for milestone in MILESTONES:
+        current = results[milestone]["median_ms"]
+        before = baseline.get("results", {}).get(milestone, {}).get("median_ms")
+        change = f" ({(current - before) / before * 100:+.1f}%)" if before else ""
+        print(f"{milestone:<12}{f'{current}{change}':>22}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from process start until the server answers")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--key', default='your_api_key_here')
+    parser.add_argument('--timeout', type=float, default=60, help="seconds to wait for each start")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    runs = []
+    for index in range(args.runs):
+        times = run_once(args.key, args.timeout)
+        print(f"run {index + 1}: listen {times['listen'] * 1000:.1f} ms, models {times['models'] * 1000:.1f} ms",
+              file=sys.stderr)
+        runs.append(times)
+    report = {
+        "config": {"runs": args.runs, "python": sys.version.split()[0]},
+        "finished_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": summarize(runs),
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(report["results"], json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# bench_transcoder.py
+#
+# Per-clip overhead of each transcoder backend for every response format:
+#   ffmpeg      - a new ffmpeg process per conversion
+#   ffmpeg-pool - pre-spawned ffmpeg processes, replaced in the background
+#   pyav        - in-process decode/encode with PyAV (skipped if not installed)
+#
+# The input is a short 24kHz 48kbps mono mp3 like the upstream sends,
+# generated once with ffmpeg. Conversions run one at a time with a short
+# pause in between, so the pool is measured in its steady state.
+#
+# Usage: python benchmarks/bench_transcoder.py [--runs 20] [--seconds 2] [--speed 1.0] [--json]
+# Needs ffmpeg on PATH.
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from transcoder import create_backend
+from utils import AUDIO_FORMAT_MIME_TYPES
+
+def make_clip(seconds):
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+         "-ar", "24000", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k", "-f", "mp3", "pipe:1"],
+        check=True, capture_output=True,
+    ).stdout
+
+async def _chunks(clip, size=4096):
+    for start in range(0, len(clip), size):
+        yield clip[start:start + size]
+
+async def _measure(backend, clip, response_format, speed):
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for chunk in backend.transcode(_chunks(clip), response_format, speed):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    return time.perf_counter() - start, first_byte, size
+
+async def run(args, clip):
+    results = []
+    for name in args.backends.split(','):
+        try:
+            backend = create_backend(name, pool_size=2, warm_formats=args.formats.split(','))
+        except RuntimeError as e:
+            print(f"skipping {name}: {e}", file=sys.stderr)
+            continue
+        await backend.prewarm()
+        for response_format in args.formats.split(','):
+            totals, ttfbs = [], []
+            for _ in range(args.runs):
+                await asyncio.sleep(args.pause / 1000)
+                total, first_byte, size = await _measure(backend, clip, response_format, args.speed)
+                totals.append(total * 1000)
+                ttfbs.append(first_byte * 1000)
+            results.append({
+                "backend": name,
+                "format": response_format,
+                "median_ms": round(statistics.median(totals), 2),
+                "p95_ms": round(sorted(totals)[max(0, int(len(totals) * 0.95) - 1)], 2),
+                "ttfb_median_ms": round(statistics.median(ttfbs), 2),
+                "bytes": size,
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-clip overhead of the transcoder backends")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=2.0, help="length of the test clip")
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--pause', type=float, default=50, help="ms between conversions")
+    parser.add_argument('--backends', default='ffmpeg,ffmpeg-pool,pyav')
+    parser.add_argument('--formats', default=','.join(AUDIO_FORMAT_MIME_TYPES))
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    clip = make_clip(args.seconds)
+    results = asyncio.run(run(args, clip))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':>12} {'format':>6} {'median ms':>10} {'p95 ms':>8} {'ttfb ms':>8} {'bytes':>8}")
+    for result in results:
+        print(f"{result['backend']:>12} {result['format']:>6} {result['median_ms']:>10.1f} {result['p95_ms']:>8.1f} "
+              f"{result['ttfb_median_ms']:>8.1f} {result['bytes']:>8}")
+
+if __name__ == '__main__':
+    main()
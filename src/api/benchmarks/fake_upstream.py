@@ -0,0 +1,181 @@
+# fake_upstream.py
+#
+# Local stand-in for the Edge TTS service, speaking the same websocket
+# protocol edge-tts uses, so throughput and latency can be measured without
+# the live Microsoft endpoint. Every word of the input becomes a
+# WordBoundary event followed by silence in the requested output format:
+# 24kHz 48kbps mono mp3 frames or raw 24kHz 16-bit PCM. Other formats end
+# the turn without audio, like the service does for formats it refuses.
+# Several turns can be sent over one connection, and /voices/list serves a
+# small voice list. A fraction of turns can be made to stall before their
+# first audio to reproduce the service's tail latency.
+#
+# Usage: python benchmarks/fake_upstream.py [--port 8765] [--latency 150] [--jitter 50]
+#                                         [--stall-rate 0.05] [--stall 2000]
+# Then start the server with
+#   EDGE_TTS_WSS_URL=ws://127.0.0.1:8765/edge/v1?TrustedClientToken=x
+#   EDGE_TTS_VOICE_LIST_URL=http://127.0.0.1:8765/voices/list?trustedclienttoken=x
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import uuid
+from html import unescape
+
+from aiohttp import web, WSMsgType
+
+# One silent MPEG-2 layer III frame: 24kHz, 48kbps, mono, 144 bytes, 24ms
+MP3_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC0]) + bytes(140)
+FRAME_TICKS = 24 * 10_000  # 100ns ticks per frame
+# Roughly the speaking rate of the real voices
+FRAMES_PER_WORD = 12
+
+# Audio of one word in each supported output format
+WORD_AUDIO = {
+    "audio-24khz-48kbitrate-mono-mp3": MP3_FRAME * FRAMES_PER_WORD,
+    "raw-24khz-16bit-mono-pcm": bytes(24_000 * 2 * 24 // 1000 * FRAMES_PER_WORD),
+}
+_OUTPUT_FORMAT = re.compile(r'"outputFormat":"([^"]+)"')
+
+VOICES = [
+    ("en-US-AndrewNeural", "Male", "en-US"),
+    ("en-US-AvaNeural", "Female", "en-US"),
+    ("en-US-EmmaNeural", "Female", "en-US"),
+    ("en-US-EricNeural", "Male", "en-US"),
+    ("en-US-SteffanNeural", "Male", "en-US"),
+    ("en-GB-SoniaNeural", "Female", "en-GB"),
+    ("zh-CN-XiaoxiaoNeural", "Female", "zh-CN"),
+    ("zh-CN-YunxiNeural", "Male", "zh-CN"),
+    ("zh-TW-HsiaoChenNeural", "Female", "zh-TW"),
+]
+
+_SSML_TEXT = re.compile(r"<prosody[^>]*>(.*)</prosody>", re.S)
+_WORD = re.compile(r"\w+|[^\w\s]", re.U)
+
+def _voice_list():
+    return [{
+        "Name": f"Microsoft Server Speech Text to Speech Voice ({locale}, {name.split('-')[-1]})",
+        "ShortName": name,
+        "Gender": gender,
+        "Locale": locale,
+        "SuggestedCodec": "audio-24khz-48kbitrate-mono-mp3",
+        "FriendlyName": f"Microsoft {name.split('-')[-1].replace('Neural', '')} Online (Natural) - {locale}",
+        "Status": "GA",
+        "VoiceTag": {"ContentCategories": ["General"], "VoicePersonalities": ["Friendly"]},
+    } for name, gender, locale in VOICES]
+
+def _text_message(request_id, path, body=""):
+    return (f"X-RequestId:{request_id}\r\n"
+            "Content-Type:application/json; charset=utf-8\r\n"
+            f"Path:{path}\r\n\r\n{body}")
+
+def _audio_message(request_id, data):
+    # edge-tts reads the 2-byte header length and expects the payload to
+    # start two bytes after it, so the header block ends with CRLF
+    header = (f"X-RequestId:{request_id}\r\n"
+              "Content-Type:application/octet-stream\r\n"
+              "Path:audio\r\n").encode()
+    return len(header).to_bytes(2, 'big') + header + data
+
+def _word_boundary(word, offset):
+    return json.dumps({"Metadata": [{
+        "Type": "WordBoundary",
+        "Data": {"Offset": offset, "Duration": FRAMES_PER_WORD * FRAME_TICKS,
+                 "text": {"Text": word, "Length": len(word), "BoundaryType": "WordBoundary"}},
+    }]})
+
+class FakeUpstream:
+    def __init__(self, latency, jitter, chunk_interval, error_rate, max_turns=0, stall_rate=0.0, stall=2000):
+        self.latency = latency / 1000
+        self.stall_rate = stall_rate
+        self.stall = stall / 1000
+        self.max_turns = max_turns
+        self.jitter = jitter / 1000
+        self.chunk_interval = chunk_interval / 1000
+        self.error_rate = error_rate
+        self.stats = {"connections": 0, "turns": 0, "failed_turns": 0, "stalled_turns": 0}
+
+    def _first_byte_delay(self):
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if random.random() < self.stall_rate:
+            self.stats["stalled_turns"] += 1
+            delay += self.stall
+        return delay
+
+    async def voices(self, request):
+        return web.json_response(_voice_list())
+
+    async def synthesize(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.stats["connections"] += 1
+        output_format = "audio-24khz-48kbitrate-mono-mp3"
+        turns = 0
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            if "Path:speech.config" in message.data:
+                match = _OUTPUT_FORMAT.search(message.data)
+                output_format = match.group(1) if match else output_format
+            elif "Path:ssml" in message.data:
+                await self._turn(ws, message.data, output_format)
+                turns += 1
+                if self.max_turns and turns >= self.max_turns:
+                    # Lets clients see a reused connection go away between turns
+                    await ws.close()
+        return ws
+
+    async def _turn(self, ws, message, output_format):
+        self.stats["turns"] += 1
+        request_id = uuid.uuid4().hex
+        match = _SSML_TEXT.search(message)
+        words = _WORD.findall(unescape(match.group(1))) if match else []
+
+        await asyncio.sleep(self._first_byte_delay())
+        await ws.send_str(_text_message(request_id, "turn.start", "{}"))
+        if output_format not in WORD_AUDIO or random.random() < self.error_rate:
+            # Like the real service on a bad request: the turn ends without audio
+            self.stats["failed_turns"] += 1
+            await ws.send_str(_text_message(request_id, "turn.end", "{}"))
+            return
+
+        offset = 0
+        for word in words:
+            await ws.send_str(_text_message(request_id, "audio.metadata", _word_boundary(word, offset)))
+            await ws.send_bytes(_audio_message(request_id, WORD_AUDIO[output_format]))
+            offset += FRAMES_PER_WORD * FRAME_TICKS
+            if self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+        await ws.send_str(_text_message(request_id, "turn.end", "{}"))
+
+    async def show_stats(self, request):
+        return web.json_response(self.stats)
+
+def make_app(latency=150, jitter=50, chunk_interval=5, error_rate=0.0, max_turns=0, stall_rate=0.0, stall=2000):
+    upstream = FakeUpstream(latency, jitter, chunk_interval, error_rate, max_turns, stall_rate, stall)
+    app = web.Application()
+    app.router.add_get('/edge/v1', upstream.synthesize)
+    app.router.add_get('/voices/list', upstream.voices)
+    app.router.add_get('/stats', upstream.show_stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Edge TTS websocket service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=150, help="ms before the first audio of a turn")
+    parser.add_argument('--jitter', type=float, default=50, help="+/- ms added to the first-audio latency")
+    parser.add_argument('--chunk-interval', type=float, default=5, help="ms between the audio chunks of a turn")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of turns that return no audio")
+    parser.add_argument('--max-turns', type=int, default=0, help="close a connection after this many turns (0: never)")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="fraction of turns whose first audio is delayed by --stall")
+    parser.add_argument('--stall', type=float, default=2000, help="ms added to the first-audio latency of a stalled turn")
+    args = parser.parse_args()
+    web.run_app(make_app(args.latency, args.jitter, args.chunk_interval, args.error_rate, args.max_turns,
+                         args.stall_rate, args.stall),
+                host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# loadgen.py
+#
+# Load generator for a running server. Drives /v1/audio/speech and /tts
+# across formats, speeds, text lengths and concurrency levels and reports
+# RPS, p50/p95/p99 latency and TTFB (time to the first body byte) per
+# scenario as JSON, so runs can be diffed or compared with --baseline.
+#
+# Each request gets a unique text unless --cache is given, so the audio
+# cache does not hide synthesis cost. Run it against the stand-in upstream
+# (benchmarks/fake_upstream.py) to measure the service itself.
+#
+# Usage: python benchmarks/loadgen.py [--url http://127.0.0.1:5050] [--key your_api_key_here]
+#            [--endpoints speech,tts] [--formats mp3,opus,wav] [--speeds 1.0,2.5]
+#            [--lengths short,long] [--concurrency 1,8,32] [--requests 50]
+#            [--output run.json] [--baseline previous.json]
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+import aiohttp
+
+SENTENCE = "The quick brown fox jumps over the lazy dog while the service keeps streaming audio. "
+TEXT_LENGTHS = {
+    "short": 1,    # ~85 characters, a single upstream turn
+    "medium": 7,   # ~600 characters, about one segment
+    "long": 35,    # ~3000 characters, several segments synthesized concurrently
+}
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _summary(values):
+    return {
+        "p50": _ms(_percentile(values, 50)),
+        "p95": _ms(_percentile(values, 95)),
+        "p99": _ms(_percentile(values, 99)),
+        "mean": _ms(sum(values) / len(values)) if values else None,
+    }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def _text(length, serial, cache):
+    text = SENTENCE * TEXT_LENGTHS[length]
+    return text if cache else f"Request {serial}. {text}"
+
+async def _request(session, args, scenario, text):
+    endpoint, response_format, speed = scenario["endpoint"], scenario["format"], scenario["speed"]
+    if endpoint == "speech":
+        call = session.post(f"{args.url}/v1/audio/speech",
+                            headers={"Authorization": f"Bearer {args.key}"},
+                            json={"input": text, "voice": args.voice, "response_format": response_format, "speed": speed})
+    else:
+        call = session.get(f"{args.url}/tts",
+                           params={"text": text, "key": args.key, "voice": args.voice, "format": response_format, "speed": str(speed)})
+
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    async with call as response:
+        async for chunk in response.content.iter_any():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            size += len(chunk)
+        status = response.status
+    return status, time.perf_counter() - start, ttfb, size
+
+async def run_scenario(session, args, scenario, serials):
+    latencies, ttfbs, errors, statuses, total_bytes = [], [], 0, {}, 0
+    remaining = iter(range(args.requests))
+
+    async def client():
+        nonlocal errors, total_bytes
+        for _ in remaining:
+            text = _text(scenario["length"], next(serials), args.cache)
+            try:
+                status, latency, ttfb, size = await _request(session, args, scenario, text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, latency, ttfb, size = type(e).__name__, None, None, 0
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status != 200:
+                errors += 1
+                continue
+            latencies.append(latency)
+            if ttfb is not None:
+                ttfbs.append(ttfb)
+            total_bytes += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(scenario["concurrency"])))
+    elapsed = time.perf_counter() - started
+    return dict(
+        scenario,
+        requests=args.requests,
+        errors=errors,
+        statuses=statuses,
+        elapsed_s=round(elapsed, 3),
+        rps=round(len(latencies) / elapsed, 2) if elapsed else None,
+        bytes=total_bytes,
+        latency_ms=_summary(latencies),
+        ttfb_ms=_summary(ttfbs),
+    )
+
+def _scenario_id(result):
+    return (result["endpoint"], result["format"], result["speed"], result["length"], result["concurrency"])
+
+def compare(results, baseline):
+    """Print p50/p95 latency and RPS changes against an earlier run."""
+    previous = {_scenario_id(r): r for r in baseline["results"]}
+    print(f"{'scenario':<36} {'rps':>14} {'p50 ms':>18} {'p95 ms':>18}", file=sys.stderr)
+    for result in results:
+        old = previous.get(_scenario_id(result))
+        if old is None:
+            continue
+        name = "/".join(str(part) for part in _scenario_id(result))
+        cells = []
+        for new_value, old_value in ((result["rps"], old["rps"]),
+                                     (result["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+                                     (result["latency_ms"]["p95"], old["latency_ms"]["p95"])):
+            if new_value is None or not old_value:
+                cells.append(f"{'-':>18}")
+            else:
+                cells.append(f"{new_value:>9.1f} ({(new_value - old_value) / old_value:+6.1%})")
+        print(f"{name:<36} {cells[0]:>14} {cells[1]:>18} {cells[2]:>18}", file=sys.stderr)
+
+async def main_async(args):
+    scenarios = [
+        {"endpoint": endpoint, "format": response_format, "speed": speed, "length": length, "concurrency": concurrency}
+        for endpoint, response_format, speed, length, concurrency in itertools.product(
+            args.endpoints.split(','), args.formats.split(','), [float(s) for s in args.speeds.split(',')],
+            args.lengths.split(','), [int(c) for c in args.concurrency.split(',')])
+    ]
+    serials = itertools.count(int(time.time()))
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    results = []
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for scenario in scenarios:
+            result = await run_scenario(session, args, scenario, serials)
+            print(f"{'/'.join(str(part) for part in _scenario_id(result))}: {result['rps']} rps, "
+                  f"p50 {result['latency_ms']['p50']} ms, ttfb p50 {result['ttfb_ms']['p50']} ms, "
+                  f"{result['errors']} errors", file=sys.stderr)
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the TTS endpoints")
+    parser.add_argument('--url', default='http://127.0.0.1:5050')
+    parser.add_argument('--key', default='your_api_key_here')
+    parser.add_argument('--voice', default='en-US-AndrewNeural')
+    parser.add_argument('--endpoints', default='speech,tts')
+    parser.add_argument('--formats', default='mp3,opus,wav')
+    parser.add_argument('--speeds', default='1.0')
+    parser.add_argument('--lengths', default='short,long')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=50, help="requests per scenario")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds per request")
+    parser.add_argument('--cache', action='store_true', help="repeat identical texts so the audio cache is hit")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ('key', 'output', 'baseline')},
+        "finished_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
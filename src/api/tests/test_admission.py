@@ -0,0 +1,70 @@
+import asyncio
+
+import tts_handler
+from admission import FairLimiter
+
+def test_try_acquire_never_queues():
+    limiter = FairLimiter('upstream', 1, 10)
+    acquired_at = limiter.try_acquire()
+    assert acquired_at is not None
+    assert limiter.try_acquire() is None
+    assert limiter.queued == 0
+    limiter.release(acquired_at)
+    assert limiter.in_use == 0
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+class RecordingBackend:
+    def __init__(self):
+        self.slots_in_use = []
+
+    async def transcode(self, chunks, response_format, speed=1.0):
+        self.slots_in_use.append(tts_handler.transcode_limiter.in_use)
+        async for chunk in chunks:
+            yield chunk.upper()
+
+def test_transcode_slot_is_taken_on_the_first_upstream_chunk(monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(tts_handler, 'transcoder_backend', backend)
+    limiter = tts_handler.transcode_limiter
+    waiting = []
+
+    async def upstream(admitted):
+        # Stands in for a request still queued for an upstream slot
+        await admitted.wait()
+        yield b"a"
+        yield b"b"
+
+    async def run():
+        admitted = asyncio.Event()
+        task = asyncio.ensure_future(tts_handler._convert(upstream(admitted), "flac", 1.0).__anext__())
+        await asyncio.sleep(0.01)
+        waiting.append(limiter.in_use)
+        admitted.set()
+        return await task
+
+    assert asyncio.run(run()) == b"A"
+    assert waiting == [0]
+    assert backend.slots_in_use == [1]
+    assert limiter.in_use == 0
+
+def test_upstream_is_read_ahead_while_waiting_for_a_transcode_slot(monkeypatch):
+    monkeypatch.setattr(tts_handler, 'transcoder_backend', RecordingBackend())
+    monkeypatch.setattr(tts_handler, 'transcode_limiter', FairLimiter('transcode', 1, 10))
+    drained = []
+
+    async def upstream():
+        for chunk in (b"a", b"b", b"c"):
+            yield chunk
+        drained.append(True)
+
+    async def run():
+        async with tts_handler.transcode_limiter.slot():
+            converted = asyncio.ensure_future(collect(tts_handler._convert(upstream(), "flac", 1.0)))
+            await asyncio.sleep(0.01)
+            # Upstream finished (and would have given back its slot) before ffmpeg could start
+            assert drained == [True]
+        return await converted
+
+    assert asyncio.run(run()) == [b"A", b"B", b"C"]
@@ -0,0 +1,85 @@
+import os
+
+from audio_cache import TIMESTAMPS_DIR_NAME, AudioCache, CacheBundle, make_key, write_bundle
+
+def test_rescan_enforces_the_limit_across_processes(tmp_path):
+    first = AudioCache(1024, disk_dir=str(tmp_path), disk_limit=250)
+    second = AudioCache(1024, disk_dir=str(tmp_path), disk_limit=250)
+    keys = [make_key(str(number), "voice", "mp3", 1.0) for number in range(4)]
+    first.put(keys[0], "mp3", b"a" * 100)
+    first.put(keys[1], "mp3", b"b" * 100)
+    second.put(keys[2], "mp3", b"c" * 100)
+    second.put(keys[3], "mp3", b"d" * 100)
+    # Each process only counted its own 200 bytes
+    assert first.stats()["disk_bytes"] == 200
+    assert first.rescan() == 2
+    assert first.stats()["disk_bytes"] == 200
+
+def test_scan_ignores_timestamps_and_fresh_partial_writes(tmp_path):
+    os.makedirs(tmp_path / TIMESTAMPS_DIR_NAME)
+    (tmp_path / TIMESTAMPS_DIR_NAME / "key-word.json").write_text("[]")
+    os.makedirs(tmp_path / "ab")
+    (tmp_path / "ab" / ".partial").write_bytes(b"x")
+    cache = AudioCache(1024, disk_dir=str(tmp_path), disk_limit=1024)
+    assert cache.stats()["disk_entries"] == 0
+    assert os.path.exists(tmp_path / "ab" / ".partial")
+
+def test_disk_tier_is_used_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    import tts_handler
+
+    threads = []
+
+    class RecordingCache(AudioCache):
+        def _write_disk(self, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return super()._write_disk(*args, **kwargs)
+
+        def _read_disk(self, key):
+            threads.append(threading.get_ident())
+            return super()._read_disk(key)
+
+    monkeypatch.setattr(tts_handler, "audio_cache", RecordingCache(0, disk_dir=str(tmp_path), disk_limit=1024))
+    buffer = tts_handler.scratch_store.buffer(b"audio")
+    key = make_key("hi", "voice", "mp3", 1.0)
+
+    async def store_and_read():
+        await tts_handler._store(key, "mp3", buffer)
+        return await tts_handler._cache_get(key, "mp3"), threading.get_ident()
+
+    try:
+        audio, loop_thread = asyncio.run(store_and_read())
+    finally:
+        buffer.close()
+    assert audio == b"audio"
+    assert len(threads) == 2 and loop_thread not in threads
+
+def test_entries_are_only_served_in_their_stored_format(tmp_path):
+    key = make_key("hi", "voice", "pcm", 1.0)
+    # Raw PCM can start with any bytes, including an mp3 frame sync
+    pcm = b"\xff\xff\x00\x00\x01\x00"
+    cache = AudioCache(1024, disk_dir=str(tmp_path), disk_limit=1024)
+    cache.put(key, "pcm", pcm)
+    assert cache.lookup(key, "pcm").data == pcm
+    assert cache.lookup(key, "mp3") is None
+    assert os.path.exists(tmp_path / key[:2] / f"{key}.pcm")
+
+    restarted = AudioCache(1024, disk_dir=str(tmp_path), disk_limit=1024)
+    assert restarted.lookup(key, "pcm").path.endswith(".pcm")
+    assert restarted.get(key, "mp3") is None
+    assert restarted.get(key, "pcm") == pcm
+
+def test_bundle_entries_keep_their_format(tmp_path):
+    key = make_key("hi", "voice", "opus", 1.0)
+    path = str(tmp_path / "bundle")
+    write_bundle(path, [(key, b"OggS audio", {"format": "opus"})])
+    bundle = CacheBundle(path)
+    try:
+        cache = AudioCache(1024)
+        cache.add_bundle(bundle)
+        assert cache.get(key, "opus") == b"OggS audio"
+        assert cache.get(key, "mp3") is None
+    finally:
+        bundle.close()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import threading
+import time
+
+from jobs import JobManager, JobStore
+
+class RecordingStore(JobStore):
+    """Records the threads the manager uses the store from."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.threads = set()
+
+    def _execute(self, sql, params=()):
+        self.threads.add(threading.get_ident())
+        return super()._execute(sql, params)
+
+async def stream_segment(text, job):
+    yield text.encode()
+
+async def convert(chunks, response_format, speed):
+    async for chunk in chunks:
+        yield chunk
+
+def manager(store, retention=0):
+    return JobManager(None, store, stream_segment, convert, workers=1, segment_parallelism=2, retention=retention)
+
+def run_job(jobs, segments):
+    job_id = jobs.store.create(segments, "voice", "mp3", 1.0, "+0Hz", "+0%")
+    jobs.store.threads.clear()
+
+    async def run():
+        await jobs._run(job_id)
+        return threading.get_ident()
+
+    return job_id, asyncio.run(run())
+
+def test_job_runs_with_store_and_files_off_the_loop(tmp_path):
+    jobs = manager(RecordingStore(str(tmp_path)))
+    job_id, loop_thread = run_job(jobs, ["one ", "two"])
+    threads = set(jobs.store.threads)
+    job = jobs.store.get(job_id)
+    assert job['status'] == 'completed' and job['completed_segments'] == 2
+    with open(job['result_path'], 'rb') as f:
+        assert f.read() == b"one two"
+    assert sorted(os.listdir(jobs.store.job_dir(job_id))) == ["result.mp3"]
+    assert threads and loop_thread not in threads
+
+def test_delete_only_removes_finished_jobs(tmp_path):
+    jobs = manager(RecordingStore(str(tmp_path)))
+    queued = jobs.store.create(["text"], "voice", "mp3", 1.0, "+0Hz", "+0%")
+    assert not jobs.delete(queued)
+    job_id, _ = run_job(jobs, ["text"])
+    assert jobs.delete(job_id)
+    assert jobs.store.get(job_id) is None
+    assert not os.path.exists(jobs.store.job_dir(job_id))
+    assert not jobs.delete(job_id)
+
+def test_expire_removes_jobs_past_retention(tmp_path):
+    jobs = manager(RecordingStore(str(tmp_path)), retention=3600)
+    old, _ = run_job(jobs, ["old"])
+    recent, _ = run_job(jobs, ["recent"])
+    jobs.store.set_status(old, 'failed', error="x")
+    jobs.store._execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 7200, old))
+    assert jobs.expire() == 1
+    assert jobs.store.get(old) is None
+    assert jobs.store.get(recent)['status'] == 'completed'
+    assert manager(jobs.store).expire() == 0
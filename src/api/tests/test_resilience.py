@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from edge_tts.exceptions import NoAudioReceived
+
+from admission import FairLimiter
+from resilience import CircuitBreaker, Resilience, UpstreamUnavailable
+from upstream import FormatRefused, OGG_OPUS
+
+def resilience(**kwargs):
+    options = dict(attempt_timeout=1, stall_timeout=1, retries=2, backoff=0, breaker_threshold=3, breaker_cooldown=30)
+    return Resilience(**dict(options, **kwargs))
+
+def factory(*outcomes):
+    """Each call starts the next attempt: an exception to raise, or a list of audio chunks."""
+    outcomes = list(outcomes)
+
+    def start():
+        outcome = outcomes.pop(0)
+
+        async def attempt():
+            if isinstance(outcome, Exception):
+                raise outcome
+            for data in outcome:
+                yield {"type": "audio", "data": data}
+        return attempt()
+    return start
+
+async def collect(wrapper, start):
+    return [item["data"] async for item in wrapper.stream(start)]
+
+def test_retries_failures_until_audio():
+    wrapper = resilience()
+    chunks = asyncio.run(collect(wrapper, factory(NoAudioReceived("x"), [b"a", b"b"])))
+    assert chunks == [b"a", b"b"]
+    assert wrapper.counters["retries"] == 1
+    # A success resets the breaker's count of consecutive failures
+    assert wrapper.breaker.failures == 0
+
+def test_gives_up_after_retries_and_opens_breaker():
+    wrapper = resilience()
+    with pytest.raises(NoAudioReceived):
+        asyncio.run(collect(wrapper, factory(*[NoAudioReceived("x")] * 3)))
+    assert wrapper.counters["attempts"] == 3
+    assert wrapper.breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(collect(wrapper, factory([b"a"])))
+
+def test_refused_format_is_not_retried_or_counted():
+    wrapper = resilience()
+    for _ in range(5):
+        with pytest.raises(FormatRefused):
+            asyncio.run(collect(wrapper, factory(FormatRefused(OGG_OPUS))))
+    assert wrapper.counters["attempts"] == 5
+    assert wrapper.counters["retries"] == 0
+    assert wrapper.breaker.failures == 0
+    assert wrapper.breaker.state == "closed"
+    assert asyncio.run(collect(wrapper, factory([b"mp3"]))) == [b"mp3"]
+
+def test_refused_trial_leaves_half_open_breaker_for_the_next_call():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    wrapper = resilience()
+    wrapper.breaker = breaker
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(FormatRefused):
+        asyncio.run(collect(wrapper, factory(FormatRefused(OGG_OPUS))))
+    assert breaker.state == "half_open"
+    assert asyncio.run(collect(wrapper, factory([b"a"]))) == [b"a"]
+    assert breaker.state == "closed"
+
+def slow_then_fast():
+    """The first attempt stalls before its audio, every later one answers at once."""
+    calls = []
+
+    def start():
+        delay = 0.5 if not calls else 0
+        calls.append(delay)
+
+        async def attempt():
+            await asyncio.sleep(delay)
+            yield {"type": "audio", "data": b"slow" if delay else b"fast"}
+        return attempt()
+    return start
+
+def test_hedge_holds_a_limiter_slot_until_it_is_done():
+    limiter = FairLimiter('upstream', 2, 10)
+    wrapper = resilience(hedge_delay=0.05, limiter=limiter)
+    in_use = []
+
+    async def run():
+        async for item in wrapper.stream(slow_then_fast()):
+            in_use.append(limiter.in_use)
+            assert item["data"] == b"fast"
+
+    asyncio.run(run())
+    assert in_use == [1]
+    assert limiter.in_use == 0
+    assert wrapper.counters["hedges"] == wrapper.counters["hedge_wins"] == 1
+
+def test_hedge_is_skipped_when_the_limiter_is_full():
+    limiter = FairLimiter('upstream', 1, 10)
+    wrapper = resilience(hedge_delay=0.05, limiter=limiter)
+
+    async def run():
+        # The request's own slot, as taken around the stream by the caller
+        async with limiter.slot():
+            return [item["data"] async for item in wrapper.stream(slow_then_fast())]
+
+    assert asyncio.run(run()) == [b"slow"]
+    assert limiter.in_use == 0
+    assert wrapper.counters["hedges"] == 0
+    assert wrapper.counters["hedges_skipped"] == 1
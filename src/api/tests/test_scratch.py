@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from scratch import FILE_PREFIX, ScratchStore
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def leftover(directory, pid, age=0, suffix="abc"):
+    path = os.path.join(directory, f"{FILE_PREFIX}{pid}-{suffix}")
+    with open(path, 'wb') as f:
+        f.write(b"x" * 10)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+def test_sweep_removes_files_of_dead_processes(tmp_path, dead_pid):
+    store = ScratchStore(str(tmp_path), memory_threshold=0, quota=0, max_age=3600)
+    orphan = leftover(tmp_path, dead_pid)
+    assert store.sweep() == 1
+    assert not os.path.exists(orphan)
+    assert store.usage()["swept_bytes"] == 10
+
+def test_sweep_keeps_live_workers_and_active_buffers(tmp_path):
+    store = ScratchStore(str(tmp_path), memory_threshold=0, quota=0, max_age=0)
+    other_worker = leftover(tmp_path, os.getppid(), age=7200)
+    buffer = store.buffer()
+    buffer.write(b"spilled")
+    assert buffer.spilled
+    assert store.sweep() == 0
+    assert os.path.exists(other_worker) and os.path.exists(buffer.path)
+    buffer.close()
+    assert not os.path.exists(buffer.path)
+
+def test_sweep_waits_for_max_age_under_quota(tmp_path, dead_pid):
+    store = ScratchStore(str(tmp_path), memory_threshold=0, quota=1024, max_age=3600)
+    recent = leftover(tmp_path, dead_pid)
+    stale = leftover(tmp_path, dead_pid, age=7200, suffix="def")
+    store.sweep()
+    assert os.path.exists(recent)
+    assert not os.path.exists(stale)
+
+def test_windows_removes_leftovers_of_earlier_runs(tmp_path, monkeypatch):
+    import prefork
+
+    store = ScratchStore(str(tmp_path), memory_threshold=0, quota=0, max_age=3600)
+    leftover_file = leftover(tmp_path, os.getppid())
+    # A single serving process on Windows: files of any other pid are from a previous run
+    monkeypatch.setattr(prefork.os, "name", "nt")
+    assert not prefork.process_alive(os.getppid())
+    assert store.sweep() == 1
+    assert not os.path.exists(leftover_file)
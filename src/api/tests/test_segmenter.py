@@ -0,0 +1,62 @@
+import pytest
+
+from segmenter import split_text
+
+def check_limit(segments, max_chars):
+    assert all(0 < len(segment) <= max_chars for segment in segments)
+
+@pytest.mark.parametrize("text", ["", "  hi  ", "x" * 10])
+def test_text_within_the_limit_is_one_segment(text):
+    assert split_text(text, 10) == [text.strip()]
+
+def test_one_character_over_the_limit_is_split():
+    assert split_text("x" * 11, 10) == ["x" * 10, "x"]
+
+def test_cjk_sentences_end_without_a_space():
+    assert split_text("你好。今天天气很好！我们去公园吧？", 8) == ["你好。", "今天天气很好！", "我们去公园吧？"]
+
+def test_latin_sentences_need_whitespace_after_the_mark():
+    # "3.5" is not a sentence end
+    assert split_text("It costs 3.5 dollars. OK!", 22) == ["It costs 3.5 dollars.", "OK!"]
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert split_text("“你好。”他说。然后走了。", 6) == ["“你好。”", "他说。", "然后走了。"]
+
+def test_mixed_cjk_and_latin_sentences():
+    assert split_text("中文句子。English sentence. 另一句。", 18) == ["中文句子。", "English sentence.", "另一句。"]
+
+def test_sentences_are_packed_with_the_right_joiner():
+    assert split_text("你好。世界。再见了朋友们。", 8) == ["你好。世界。", "再见了朋友们。"]
+    assert split_text("One. Two. Three. Four five six.", 10) == ["One. Two.", "Three.", "Four five", "six."]
+
+def test_paragraph_break_ends_a_half_full_segment():
+    assert split_text("Short one here. A b. C d.", 24) == ["Short one here. A b.", "C d."]
+    assert split_text("Short one here.\n\nA b. C d.", 24) == ["Short one here.", "A b. C d."]
+    # A paragraph under half the limit is packed with the next one
+    assert split_text("Hi.\nA b. C d. E f. G h. I j.", 24) == ["Hi. A b. C d. E f. G h.", "I j."]
+
+def test_long_sentence_is_cut_at_clause_boundaries():
+    assert split_text("alpha beta gamma delta epsilon", 12) == ["alpha beta", "gamma delta", "epsilon"]
+    assert split_text("一二三，四五六，七八九十", 5) == ["一二三，", "四五六，", "七八九十"]
+
+def test_sentence_without_break_points_is_hard_cut():
+    segments = split_text("a" * 25, 10)
+    assert segments == ["a" * 10, "a" * 10, "a" * 5]
+
+@pytest.mark.parametrize("max_chars", [1, 7, 50, 600])
+def test_segments_respect_the_limit_and_keep_the_text(max_chars):
+    text = "这是第一句。This is the second one! 第三句比较长，中间有逗号，还有更多的字。\n" * 20
+    segments = split_text(text, max_chars)
+    check_limit(segments, max_chars)
+    assert "".join(segments).replace(" ", "") == "".join(text.split())
+
+def test_segment_max_chars_edges():
+    from tts_handler import SEGMENT_MAX_CHARS
+
+    sentence = "这是一个句子。"
+    fitting = sentence * (SEGMENT_MAX_CHARS // len(sentence)) + "好" * (SEGMENT_MAX_CHARS % len(sentence))
+    assert len(fitting) == SEGMENT_MAX_CHARS
+    assert split_text(fitting, SEGMENT_MAX_CHARS) == [fitting]
+    segments = split_text(fitting + "。", SEGMENT_MAX_CHARS)
+    assert len(segments) == 2
+    check_limit(segments, SEGMENT_MAX_CHARS)
@@ -0,0 +1,110 @@
+import pytest
+
+import server
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+@pytest.fixture
+def auth():
+    return {"Authorization": f"Bearer {server.API_KEY}"}
+
+@pytest.mark.parametrize("value, expected", [(1, 1.0), ("1.5", 1.5), (0.25, 0.25), (4, 4.0)])
+def test_parse_speed_accepts_openai_range(value, expected):
+    assert server.parse_speed(value) == expected
+
+@pytest.mark.parametrize("value", [0, -1, 0.2, 4.5, "nan", "inf", "fast", None, [1]])
+def test_parse_speed_rejects(value):
+    with pytest.raises(ValueError):
+        server.parse_speed(value)
+
+@pytest.mark.parametrize("speed", [0, -2, "nan", "abc"])
+def test_speech_rejects_bad_speed_before_synthesis(client, auth, speed):
+    response = client.post('/v1/audio/speech', headers=auth, json={"input": "hi", "speed": speed})
+    assert response.status_code == 400
+
+def test_tts_rejects_bad_speed(client):
+    response = client.get(f'/tts?text=hi&speed=0&key={server.API_KEY}')
+    assert response.status_code == 400
+
+def test_batch_and_jobs_reject_bad_speed(client, auth):
+    response = client.post('/v1/audio/speech/batch', headers=auth, json={"items": [{"input": "hi", "speed": -1}]})
+    assert response.status_code == 400
+    response = client.post('/v1/audio/jobs', headers=auth, json={"input": "hi", "speed": 0})
+    assert response.status_code == 400
+
+def test_stable_url_requires_the_stored_format(client, auth, monkeypatch):
+    key = "a" * 64
+    # Raw PCM whose first sample looks like an mp3 frame sync
+    monkeypatch.setitem(server.audio_cache._memory, f"{key}.pcm", (b"\xff\xff\x00\x00" + bytes(140), 0))
+    assert client.get(f'/v1/audio/speech/{key}.pcm', headers=auth).status_code == 200
+    response = client.get(f'/v1/audio/speech/{key}.mp3', headers=auth)
+    assert response.status_code == 404
+    assert "AUDIO_CACHE_DIR" in response.get_json()["error"]
+
+def test_metric_labels_are_bounded_and_recorded_after_validation(client, auth, monkeypatch):
+    values = {}
+    monkeypatch.setattr(server.speech_requests, "_values", values)
+    server.count_speech_request('speech', "mp3", "alloy")
+    server.count_speech_request('speech', "x" * 40, "random-voice-123")
+    server.count_speech_request('speech', ["mp3"], {"voice": 1})
+    assert values == {('speech', 'mp3', 'alloy'): 1, ('speech', 'other', 'other'): 2}
+    client.post('/v1/audio/speech', headers=auth, json={"input": "hi", "voice": "new-voice", "speed": 0})
+    assert sum(values.values()) == 3
+
+@pytest.mark.parametrize("query", ["offset=abc", "limit=1.5", "limit=-1", "offset=-3"])
+def test_voices_reject_bad_paging(client, auth, query):
+    for path in ('/v1/voices', '/v1/voices/all'):
+        response = client.get(f'{path}?{query}', headers=auth)
+        assert response.status_code == 400
+        assert "non-negative integer" in response.get_json()["error"]
+
+def test_voice_query_defaults():
+    assert server.voice_query({}) == {"gender": None, "offset": 0, "limit": None, "fields": None}
+    assert server.voice_query({"offset": "5", "limit": 10, "fields": "name, gender"})["fields"] == ["name", "gender"]
+
+def test_unknown_response_format_is_rejected(client, auth):
+    requests = [
+        ('/v1/audio/speech', {"input": "hi", "response_format": "bogus"}),
+        ('/v1/audio/speech', {"input": "hi", "response_format": ["mp3"]}),
+        ('/v1/audio/speech/batch', {"items": [{"input": "hi", "response_format": "bogus"}]}),
+        ('/v1/audio/dialogue', {"lines": [{"input": "hi"}], "response_format": "bogus"}),
+        ('/v1/audio/jobs', {"input": "hi", "response_format": "bogus"}),
+    ]
+    for path, body in requests:
+        response = client.post(path, headers=auth, json=body)
+        assert response.status_code == 400, path
+        assert "response_format" in response.get_json()["error"]
+    assert client.get(f'/tts?text=hi&format=bogus&key={server.API_KEY}').status_code == 400
+
+def test_tts_unsatisfiable_range_is_416(client, monkeypatch):
+    monkeypatch.setattr(server, "generate_speech", lambda *args, **kwargs: server.scratch_store.buffer(b"\xff\xf3" + bytes(100)))
+    response = client.get(f'/tts?text=hi&stream=false&key={server.API_KEY}', headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    response = client.get(f'/tts?text=hi&stream=false&key={server.API_KEY}', headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206 and len(response.data) == 10
+
+@pytest.mark.parametrize("line", [
+    {"input": "hi", "speed": None}, {"input": "hi", "speed": [1]}, {"input": "hi", "speed": {"a": 1}},
+    {"input": "hi", "pause": None}, {"input": "hi", "pause": [1]}, {"input": "hi", "pause": "nan"},
+    {"input": "hi", "speed": 3.0}, {"input": "hi", "voice": ["alloy"]}, {"input": ["hi"]},
+])
+def test_dialogue_rejects_bad_lines(client, auth, line):
+    response = client.post('/v1/audio/dialogue', headers=auth, json={"lines": [line]})
+    assert response.status_code == 400
+    assert "Line 0" in response.get_json()["error"]
+
+def test_dialogue_metric_voice_label(client, auth, monkeypatch):
+    values = {}
+    monkeypatch.setattr(server.speech_requests, "_values", values)
+    monkeypatch.setattr(server, "generate_dialogue", lambda lines, fmt: server.scratch_store.buffer(b"audio"))
+    for voices in (["alloy"], ["alloy", "echo"], ["made-up-voice"]):
+        lines = [{"input": "hi", "voice": voice} for voice in voices]
+        assert client.post('/v1/audio/dialogue', headers=auth, json={"lines": lines, "response_format": "wav"}).status_code == 200
+    assert values == {('dialogue', 'wav', 'alloy'): 1, ('dialogue', 'wav', 'multiple'): 1, ('dialogue', 'wav', 'other'): 1}
+
+@pytest.mark.parametrize("timestamps", ["letter", ["word"], {"word": True}, 1])
+def test_speech_rejects_bad_timestamps(client, auth, timestamps):
+    response = client.post('/v1/audio/speech', headers=auth, json={"input": "hi", "timestamps": timestamps})
+    assert response.status_code == 400
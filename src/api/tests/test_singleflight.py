@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+class Source:
+    """An upstream stand-in that hands out one chunk each time `release()` is called."""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.started = 0
+        self.closed = False
+        self._gate = asyncio.Queue()
+
+    def release(self, count=1):
+        for _ in range(count):
+            self._gate.put_nowait(None)
+
+    async def produce(self):
+        self.started += 1
+        try:
+            for chunk in self.chunks:
+                await self._gate.get()
+                yield chunk
+            if self.error is not None:
+                await self._gate.get()
+                raise self.error
+        finally:
+            self.closed = True
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def consume(agen, into):
+    async for chunk in agen:
+        into.append(chunk)
+
+def test_follower_joining_mid_stream_replays_then_follows_live():
+    async def run():
+        flights = SingleFlight()
+        source = Source([b"a", b"b", b"c"])
+        leader, follower = [], []
+        leading = asyncio.ensure_future(consume(flights.join("k", source.produce), leader))
+        source.release()
+        await settle()
+        assert leader == [b"a"]
+
+        following = asyncio.ensure_future(consume(flights.join("k", source.produce), follower))
+        await settle()
+        # Chunks produced before joining are replayed at once
+        assert follower == [b"a"]
+        source.release(2)
+        await asyncio.gather(leading, following)
+        return flights, source, leader, follower
+
+    flights, source, leader, follower = asyncio.run(run())
+    assert leader == follower == [b"a", b"b", b"c"]
+    assert source.started == 1
+    assert flights.stats() == {"leaders": 1, "followers": 1, "cancelled": 0, "in_flight": 0}
+
+def test_followers_keep_the_producer_running_when_the_leader_is_cancelled():
+    async def run():
+        flights = SingleFlight()
+        source = Source([b"a", b"b"])
+        leader, follower = [], []
+        leading = asyncio.ensure_future(consume(flights.join("k", source.produce), leader))
+        following = asyncio.ensure_future(consume(flights.join("k", source.produce), follower))
+        source.release()
+        await settle()
+        leading.cancel()
+        await settle()
+        assert not source.closed
+        source.release()
+        await following
+        return flights, source, leader, follower
+
+    flights, source, leader, follower = asyncio.run(run())
+    assert leader == [b"a"]
+    assert follower == [b"a", b"b"]
+    assert source.started == 1
+    assert flights.counters["cancelled"] == 0
+
+def test_producer_is_cancelled_once_the_last_consumer_leaves():
+    async def run():
+        flights = SingleFlight()
+        source = Source([b"a", b"b"])
+        consumers = [asyncio.ensure_future(consume(flights.join("k", source.produce), [])) for _ in range(2)]
+        source.release()
+        await settle()
+        for consumer in consumers:
+            consumer.cancel()
+        await settle()
+        assert source.closed
+        assert flights.stats()["in_flight"] == 0
+
+        # The next request for the key starts afresh
+        fresh = Source([b"x"])
+        fresh.release()
+        chunks = []
+        await consume(flights.join("k", fresh.produce), chunks)
+        return flights, chunks
+
+    flights, chunks = asyncio.run(run())
+    assert chunks == [b"x"]
+    assert flights.counters["cancelled"] == 1
+
+def test_producer_failure_reaches_every_consumer():
+    async def run():
+        flights = SingleFlight()
+        source = Source([b"a"], error=RuntimeError("upstream failed"))
+        results = [[], []]
+        consumers = [asyncio.ensure_future(consume(flights.join("k", source.produce), into)) for into in results]
+        source.release(2)
+        outcomes = await asyncio.gather(*consumers, return_exceptions=True)
+        return flights, results, outcomes
+
+    flights, results, outcomes = asyncio.run(run())
+    assert results == [[b"a"], [b"a"]]
+    assert [str(outcome) for outcome in outcomes] == ["upstream failed"] * 2
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    # A failed flight is not reused by later requests
+    assert flights.stats()["in_flight"] == 0
+
+def test_follower_joining_after_a_failure_starts_a_new_flight():
+    async def run():
+        flights = SingleFlight()
+        failing = Source([], error=RuntimeError("boom"))
+        failing.release()
+        with pytest.raises(RuntimeError):
+            await consume(flights.join("k", failing.produce), [])
+        retry = Source([b"ok"])
+        retry.release()
+        chunks = []
+        await consume(flights.join("k", retry.produce), chunks)
+        return flights, chunks, retry
+
+    flights, chunks, retry = asyncio.run(run())
+    assert chunks == [b"ok"]
+    assert retry.started == 1
+    assert flights.counters["leaders"] == 2
@@ -0,0 +1,25 @@
+import pytest
+
+from tts_handler import split_speed, speech_cache_key, NATIVE_SPEED_MIN, NATIVE_SPEED_MAX
+
+@pytest.mark.parametrize("speed, rate", [(1.0, "+0%"), (0.5, "-50%"), (1.25, "+25%"), (2.0, "+100%")])
+def test_native_range_needs_no_ffmpeg(speed, rate):
+    assert split_speed(speed) == (rate, 1.0)
+
+@pytest.mark.parametrize("speed", [0.25, 0.3, 3.0, 4.0])
+def test_outside_native_range_leaves_a_residual(speed):
+    rate, residual = split_speed(speed)
+    native = 1.0 + int(rate.rstrip('%')) / 100
+    assert NATIVE_SPEED_MIN <= native <= NATIVE_SPEED_MAX
+    assert native * residual == pytest.approx(speed)
+    assert residual > 0
+
+@pytest.mark.parametrize("speed", [0, -1.0, float('nan'), float('inf')])
+def test_rejects_unusable_speeds(speed):
+    with pytest.raises(ValueError):
+        split_speed(speed)
+
+def test_cache_key_validates_speed():
+    with pytest.raises(ValueError):
+        speech_cache_key("hello", "alloy", "mp3", speed=0)
+    assert speech_cache_key("hello", "alloy", "mp3", speed=1) == speech_cache_key("hello", "alloy", "mp3", speed=1.0)
@@ -0,0 +1,31 @@
+import os
+
+from timestamps import TimestampStore, render
+
+EVENTS = [{"text": "Hello", "offset": 1_000_000, "duration": 5_000_000}]
+
+def test_render_formats():
+    assert render(EVENTS, "srt") == "1\n00:00:00,100 --> 00:00:00,600\nHello\n\n"
+    assert render(EVENTS, "vtt").startswith("WEBVTT\n\n00:00:00.100 --> 00:00:00.600\n")
+
+def test_memory_store_is_bounded():
+    store = TimestampStore(2)
+    for key in "abc":
+        store.put(key, EVENTS)
+    assert store.get("a") is None
+    assert store.get("c") == EVENTS
+
+def test_directory_is_shared_between_stores(tmp_path):
+    writer = TimestampStore(8, directory=str(tmp_path))
+    reader = TimestampStore(8, directory=str(tmp_path))
+    writer.put("key-word", EVENTS)
+    assert reader.get("key-word") == EVENTS
+    assert reader.get("missing-word") is None
+
+def test_prune_keeps_max_entries_newest_files(tmp_path):
+    store = TimestampStore(2, directory=str(tmp_path))
+    for number in range(4):
+        store.put(f"k{number}-word", EVENTS)
+        os.utime(tmp_path / f"k{number}-word.json", (number, number))
+    assert store.prune() == 2
+    assert sorted(os.listdir(tmp_path)) == ["k2-word.json", "k3-word.json"]
@@ -0,0 +1,42 @@
+import math
+
+import pytest
+
+from transcoder import atempo_filter, ffmpeg_command
+
+def factors(speed):
+    return [float(part.split('=')[1]) for part in atempo_filter(speed).split(',')]
+
+@pytest.mark.parametrize("speed", [0.25, 0.3, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 10.0])
+def test_atempo_chain_multiplies_to_speed(speed):
+    chain = factors(speed)
+    assert all(0.5 <= factor <= 2.0 for factor in chain)
+    assert math.prod(chain) == pytest.approx(speed, rel=1e-3)
+
+@pytest.mark.parametrize("speed", [0, -1.0, -0.25, float('nan'), float('inf'), float('-inf')])
+def test_atempo_rejects_unusable_speeds(speed):
+    with pytest.raises(ValueError):
+        atempo_filter(speed)
+
+def test_ffmpeg_command_skips_filter_at_normal_speed():
+    assert "-filter:a" not in ffmpeg_command("flac")
+    command = ffmpeg_command("flac", 3.0)
+    assert command[command.index("-filter:a") + 1] == "atempo=2,atempo=1.5"
+
+def test_unknown_formats_are_refused_before_spawning():
+    import asyncio
+
+    from transcoder import FfmpegPoolBackend
+
+    with pytest.raises(ValueError):
+        ffmpeg_command("mp3; rm -rf")
+    pool = FfmpegPoolBackend(size=2)
+
+    async def run():
+        async def chunks():
+            yield b""
+        return [data async for data in pool.transcode(chunks(), "bogus")]
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert pool.counters["cold_spawns"] == 0 and pool.stats()["idle"] == 0
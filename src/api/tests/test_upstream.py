@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from edge_tts.communicate import TTSConfig
+from edge_tts.exceptions import NoAudioReceived
+
+from upstream import FormatRefused, UpstreamClient, MP3, OGG_OPUS
+
+def text(path):
+    return SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=f"Path:{path}\r\n\r\n{{}}")
+
+class ScriptedWebSocket:
+    """Answers a turn with the given messages, then closes (cleanly or not)."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.closed = False
+
+    async def send_str(self, data):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self._messages()
+
+    async def _messages(self):
+        for message in self.messages:
+            yield message
+
+def exchange(messages, output_format):
+    client = UpstreamClient()
+    config = TTSConfig("en-US-AriaNeural", "+0%", "+0%", "+0Hz", "SentenceBoundary")
+    state = {"offset_compensation": 0, "audio_bytes": 0, "last_end": 0}
+
+    async def run():
+        return [chunk async for chunk in client._exchange(ScriptedWebSocket(messages), False, config, "hi",
+                                                          output_format, state)]
+    return asyncio.run(run())
+
+def test_clean_turn_without_audio_refuses_the_format():
+    with pytest.raises(FormatRefused):
+        exchange([text("turn.start"), text("turn.end")], OGG_OPUS)
+    with pytest.raises(NoAudioReceived):
+        exchange([text("turn.start"), text("turn.end")], MP3)
+
+@pytest.mark.parametrize("messages", [[], [text("turn.start")]])
+def test_dropped_connection_is_a_failure_not_a_refusal(messages):
+    with pytest.raises(NoAudioReceived) as raised:
+        exchange(messages, OGG_OPUS)
+    assert not isinstance(raised.value, FormatRefused)
+
+def test_only_a_refusal_falls_back_to_mp3(monkeypatch):
+    import tts_handler
+
+    requested = []
+
+    def failing_segments(segments, voice, rate, pitch, volume, output_format, boundary, events):
+        requested.append(output_format)
+
+        async def stream():
+            raise NoAudioReceived("dropped")
+            yield
+        return stream()
+
+    monkeypatch.setattr(tts_handler, "_stream_segments", failing_segments)
+    monkeypatch.setattr(tts_handler, "unsupported_upstream_formats", set())
+
+    async def run():
+        return [chunk async for chunk in tts_handler._generate_audio("hi", "alloy", "pcm", 1.0)]
+
+    with pytest.raises(NoAudioReceived):
+        asyncio.run(run())
+    assert requested == [tts_handler.RAW_PCM]
+    assert tts_handler.unsupported_upstream_formats == set()